@@ -1,85 +1,94 @@
-
 import streamlit as st
-from streamlit import components
-import pandas as pd
-from TrailRecommedations import TrailRecommendation
-from TrailDifficulty import TrailDifficulty
-import re
-import os
 import streamlit.components.v1 as components
 import base64
+import os
+import TrailCore
+from StaticAssets import get_static_assets
+from TrailDifficulty import get_difficulty_catalog
+from TrailMetrics import get_metrics
+
+# Heavy dependencies (sklearn, requests) are imported by the code paths that need them, and the
+# catalog is only loaded when the Recommendation page is first opened; python benchmarks/import_time_report.py
+# shows what a cold start imports.
+PAGE_STYLE = """
+    <style>
+    [data-testid="stAppViewContainer"] {{
+    background-image: url("https://images.unsplash.com/photo-1508615070457-7baeba4003ab?ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D&auto=format&fit=crop&w=1740&q=80");
+    background-size: 180%;
+    background-position: top left;
+    background-repeat: no-repeat;
+    background-attachment: local;
+    }}
+
+    [data-testid="stSidebar"] > div:first-child {{
+    background-image: url("data:image/png;base64,{img}");
+    background-position: center; 
+    background-repeat: no-repeat;
+    background-attachment: local;
+    }}
+
+    [data-testid="stHeader"] {{
+    background: rgba(0,0,0,0);
+    }}
+    </style>
+    """
+
+
+@st.cache_resource(max_entries=2)
+def load_recommender(version):
+    # One immutable catalog per process and store version, shared by every session; requests
+    # never write to it. Workers map the prebuilt binary catalog when there is one
+    # (python App/CatalogStore.py), and pick up a version published by python App/CatalogRefresh.py
+    # on the next rerun, while sessions still rendering keep the one they already hold.
+    return TrailCore.load_recommender(version)
 
+@st.cache_resource
+def start_metrics_server(port):
+    # One exporter per process, shared by every session; the recommenders run in this process,
+    # so it sees their stages, caches and geocoder too
+    return metrics.serve(port)
 
-app_root = os.path.dirname(os.path.abspath(__file__))
-csv_path = os.path.join(app_root, 'Finalized_Trail_paths.csv')
-
-df = pd.read_csv(csv_path)
-trails = TrailRecommendation(df)
-trails.preprocess_data()
-print(trails.df['Length(miles)'])
-print("HEY HEY HEY")
-@st.cache_data
-def get_img_as_base64(file):
-    with open(file, "rb") as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
-
-@st.cache
-def get_recommendations(user_input):
-    print("Say something funny")
-    recommendations = trails.get_recommendations(user_input)
-    recommendations['Site Name'] = recommendations.apply(lambda row: '<a href="{}">{}</a>'.format(row['website'], row['site_name']), axis=1)
-    print(recommendations.head(20))
-    selected_rec = recommendations[['Site Name', 'Name', 'Length(miles)', 'Elevation Gain(feet)', 'Distance From You(miles)']]
-    return selected_rec
+metrics = get_metrics()
+# Set TRAILS_METRICS_PORT (e.g. 9100) to expose /metrics and /metrics.json for scraping
+if os.environ.get('TRAILS_METRICS_PORT'):
+    start_metrics_server(int(os.environ['TRAILS_METRICS_PORT']))
+# Static files are read once per process and served from memory (StaticAssets.py)
+assets = get_static_assets()
 
 def home_page():
-    with open("App/static/map.html", "r") as file:
-        html_content = file.read()
-    st.components.v1.html(html_content, height=800)
+    # The tiled map only loads the trails of its viewport (python App/TrailTiles.py publishes the
+    # tiles); the pre-rendered map.html is the fallback until tiles exist
+    tile_map = TrailCore.tile_map_html()
+    components.html(tile_map if tile_map is not None else assets.text('map.html'), height=800)
 
 def recommendation_page():
-    zip_pattern = r'^\d{5}$'
+    # The amenity choices come from the catalog's amenity index
+    trails = load_recommender(TrailCore.current_store_version())
     zip_code = st.text_input("Enter your zip code:")
     exploration_mode = st.selectbox("Exploration mode", ['Walk', 'Bike', 'Horse riding', 'Snowmobile', 'Accessible'])
     elevation_gain = st.number_input("Elevation gain (m)", value=0, min_value=0)
     trail_length = st.number_input("Trail length (miles)", value=0, min_value=0)
-    experience = st.selectbox("Experience level", ['Beginner', 'Moderate', 'Experienced'])
-    distance = st.selectbox("Filter by distance", ['All', 'Within 10 miles', 'Within 50 miles', 'Within 100 miles'])
+    experience = st.selectbox("Experience level", TrailCore.EXPERIENCE_LEVELS)
+    distance = st.selectbox("Filter by distance", list(TrailCore.DISTANCE_FILTERS))
+    amenities = st.multiselect("Amenities", trails.amenity_index.amenities)
+    keywords = st.text_input("Keywords (e.g. waterfall, lake)")
 
     if st.button("Submit"):
-        # Validate user input
-        if not re.match(zip_pattern, zip_code):
-            st.error('Invalid zip code')
+        # Validate the answers and get recommendations; the JSON service (TrailService.py) shares this core
+        try:
+            user_input = TrailCore.build_user_input(zip_code, exploration_mode, elevation_gain, trail_length,
+                                                    experience, TrailCore.DISTANCE_FILTERS[distance],
+                                                    amenities, keywords)
+            recommendations = trails.get_recommendations(user_input)
+        except ValueError as e:
+            st.error(str(e))
             return
+        # Rendering is timed as its own request, next to the recommender's stages; the links and
+        # display columns are prepared once per catalog, so only the result rows are formatted
+        with metrics.request('render_recommendations'):
+            recommendations_table = TrailCore.recommendation_renderer(trails).html(recommendations)
 
-        if not isinstance(trail_length, int) or trail_length <= 0:
-            st.error('Trail length should be a positive integer')
-            return
-
-        if not isinstance(elevation_gain, int) or elevation_gain <= 0:
-            st.error('Elevation gain should be a positive integer')
-            return
-        # Create user input dictionary
-        user_input = {
-            'Zip': zip_code,
-            'Foot': 'Y' if exploration_mode == 'Walk' else 'N',
-            'Horse': 'Y' if exploration_mode == 'Horse riding' else 'N',
-            'Bike': 'Y' if exploration_mode == 'Bike' else 'N',
-            'Snowmb': 'Y' if exploration_mode == 'Snowmobile' else 'N',
-            'Accessible': 'Y' if exploration_mode == 'Accessible' else 'N',
-            'Trail_Leng': trail_length,
-            'Elevation_Gain': elevation_gain,
-            'type_factor': experience.lower(),
-            'radius': 0 if distance == 'All' else int(distance.split()[1])
-        }
-
-        # Get recommendations
-        recommendations = trails.get_recommendations(user_input)
-        recommendations['Site Name'] = recommendations.apply(lambda row: f'<a href="{row["website"]}">{row["site_name"]}</a>', axis=1)
-        selected_rec = recommendations[['Site Name', 'Name', 'Elevation Gain(feet)', 'Length(miles)', 'Distance From You(miles)']] #'Length(miles)',
-
-        if selected_rec.empty:
+        if recommendations.empty:
             st.warning("Sorry! No matches were found.")
         else:
             #st.table(selected_rec)
@@ -88,70 +97,48 @@ def recommendation_page():
                 #html_content = file.read()
             #recommendations_html = html_content.replace("{{ recommendations|safe }}", selected_rec.to_html(index=False, render_links=True, escape=False))
             #st.components.v1.html(recommendations_html, height=3000)
-            recommendations_table = selected_rec.to_html(index=False, render_links=True, escape=False)
 
-            custom_style = '<style>.dataframe { max-height: 1000px; overflow-y: auto; background-color: white; padding: 10px;}</style>'
-            st.markdown(custom_style, unsafe_allow_html=True)
+            st.markdown(assets.style('css/results.css'), unsafe_allow_html=True)
             with st.container():
                  st.markdown(recommendations_table, unsafe_allow_html=True)
+            # The results over the same tiles as the Home page, only the overlay is per query
+            tile_map = TrailCore.tile_map_html(recommendations)
+            if tile_map is not None:
+                components.html(tile_map, height=500)
 
 
 
 def difficulty_page():
     zip_code = st.text_input("Enter your zip code:")
     #difficulty_level = st.selectbox("Difficulty level", ['Easy', 'Medium', 'Hard'])
-    difficulty_level = st.selectbox("Difficulty level", ['Easy Peasy Lemon Squeezy', 'Medium – The Adventure Tickles', 'Hard – The Thrill Kicks In', 'Very Hard – The Leg-Day Loco'])
+    difficulty_level = st.selectbox("Difficulty level", TrailCore.DIFFICULTY_LABELS)
+    # The difficulty catalog is loaded and partitioned once per process
+    diff = get_difficulty_catalog()
+    amenities = st.multiselect("Amenities", diff.amenity_index.amenities)
+    keywords = st.text_input("Keywords (e.g. waterfall, lake)")
 
     if st.button("Submit"):
-        # Read the difficulty data
-        df_difficulty = pd.read_csv('App/Trail_Difficulty.csv')
-
-        # Create user input dictionary
-        user_input = {
-            'Zip': zip_code,
-            'Difficulty': difficulty_level
-        }
-
-        # Get recommendations
-        diff = TrailDifficulty(df_difficulty)
-        df_reco = diff.get_recommendations(user_input)
-        df_reco['Site Name'] = df_reco.apply(lambda row: f'<a href="{row["website"]}">{row["site_name"]}</a>', axis=1)
-        df_reco['Elevation Gain(feet)'] = df_reco['Elevation_Gain'] / 3.28
-        df_reco = df_reco[['Distance From You(miles)', 'Site Name', 'Name', 'Length(miles)', 'Elevation Gain(feet)', 'type_factor']] #'Length(miles)'
-        recommendations_table = df_reco.to_html(index=False, render_links=True, escape=False, classes='table', header=True, border=0,
-                                               table_id='recommendations-table')
-        custom_style = '<style>.dataframe { max-height: 1000px; overflow-y: auto; background-color: white; padding: 10px;}</style>'
-
-        st.markdown(custom_style, unsafe_allow_html=True)
+        try:
+            user_input = TrailCore.build_difficulty_input(zip_code, difficulty_level, amenities, keywords)
+            df_reco = TrailCore.get_difficulty_recommendations(diff, user_input)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        with metrics.request('render_difficulty'):
+            recommendations_table = TrailCore.difficulty_renderer(diff).html(df_reco)
+        st.markdown(assets.style('css/results.css'), unsafe_allow_html=True)
 
         with st.container():
                  st.markdown(recommendations_table, unsafe_allow_html=True)
+        tile_map = TrailCore.tile_map_html(df_reco) if not df_reco.empty else None
+        if tile_map is not None:
+            components.html(tile_map, height=500)
 
 
 def run_streamlit_app():
-    img = get_img_as_base64("App/static/image.jpg")
-    page_bg_img = f"""
-    <style>
-    [data-testid="stAppViewContainer"] {{
-    background-image: url("https://images.unsplash.com/photo-1508615070457-7baeba4003ab?ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxwaG90by1wYWdlfHx8fGVufDB8fHx8fA%3D%3D&auto=format&fit=crop&w=1740&q=80");
-    background-size: 180%;
-    background-position: top left;
-    background-repeat: no-repeat;
-    background-attachment: local;
-    }}
-
-    [data-testid="stSidebar"] > div:first-child {{
-    background-image: url("data:image/png;base64,{img}");
-    background-position: center; 
-    background-repeat: no-repeat;
-    background-attachment: local;
-    }}
-
-    [data-testid="stHeader"] {{
-    background: rgba(0,0,0,0);
-    }}
-    </style>
-    """
+    # The page style embeds the sidebar image; both are built once per image content
+    page_bg_img = assets.derive('image.jpg', 'page_style',
+                                lambda data: PAGE_STYLE.format(img=base64.b64encode(data).decode()))
 
     st.markdown(page_bg_img, unsafe_allow_html=True)
     #st.title('limegreen[_Trails To Health_]')
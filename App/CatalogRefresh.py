@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from CatalogStore import DEFAULT_STORE_PATH, CatalogStore
+from TrailFeatures import TrailFeatures
+from TrailRecommedations import TEXT_COLUMNS, TrailRecommendation, compact_frame
+from TrailTextStore import TrailTextStore
+from VersionedDirectory import new_version
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+
+
+class CatalogRefresh:
+    """
+    Incremental ingestion of a new trail CSV into a published catalog.
+
+    The new raw rows are matched to the live catalog by trail key (TrailRecommendation.fingerprint):
+    a key that is new is an added trail, a known key whose content hash differs is a changed
+    trail, and a key that disappeared is a removed trail. Only added and changed trails are
+    binned and one-hot encoded, with the bin edges and encoder vocabulary frozen by the full
+    build, so every other trail keeps exactly the encoding it already had.
+
+    The new catalog is assembled copy-on-write: kept rows are gathered from the live feature
+    masks and spatial index, the re-encoded rows are written into the gaps, and the result is
+    published as a new store version (an atomic swap of the CURRENT pointer) and as the new
+    in-process recommender. Queries that already hold the previous recommender finish on it
+    undisturbed; it is never modified.
+
+    Method:
+    diff: counts the added, changed and removed trails of a new raw catalog
+    apply: builds, publishes and returns the recommender for a new raw catalog
+    """
+    def __init__(self, recommender, store=None):
+        """
+        Parameters:
+        - recommender (TrailRecommendation): the preprocessed live catalog
+        - store (CatalogStore): where new versions are published; None keeps them in memory only
+        """
+        self.recommender = recommender
+        self.store = store
+        self._lock = threading.Lock()
+
+    def _match(self, recommender, raw):
+        """For each raw row, its row in the live catalog, or -1 if it was added or changed."""
+        row_keys, row_hashes = recommender.fingerprint(raw)
+        if pd.Index(row_keys).has_duplicates:
+            raise ValueError("The trail keys of the new catalog are not unique")
+        source_rows = pd.Index(recommender.row_keys).get_indexer(row_keys)
+        known = source_rows >= 0
+        changed = np.zeros(len(raw), dtype=bool)
+        changed[known] = recommender.row_hashes[source_rows[known]] != row_hashes[known]
+        return source_rows, known, changed, row_keys, row_hashes
+
+    def diff(self, raw):
+        recommender = self.recommender
+        _, known, changed, _, _ = self._match(recommender, raw)
+        kept = int(known.sum() - changed.sum())
+        return {'added': int((~known).sum()), 'changed': int(changed.sum()),
+                'removed': len(recommender.row_keys) - int(known.sum()), 'unchanged': kept}
+
+    def apply(self, raw, version=None):
+        """
+        Publishes the catalog for the raw trail DataFrame `raw` and returns (recommender, summary).
+        Rows keep the order of `raw`, as a full preprocess_data of it would.
+        """
+        with self._lock:
+            old = self.recommender
+            source_rows, known, changed, row_keys, row_hashes = self._match(old, raw)
+            summary = {'added': int((~known).sum()), 'changed': int(changed.sum()),
+                       'removed': len(old.row_keys) - int(known.sum())}
+            source_rows[changed] = -1
+            kept = np.flatnonzero(source_rows >= 0)
+            fresh = np.flatnonzero(source_rows < 0)
+            summary['unchanged'] = len(kept)
+
+            fresh_df, fresh_features = old.encode_rows(raw.iloc[fresh])
+            positions = np.concatenate([kept, fresh])
+            df = pd.concat([old.df.iloc[source_rows[kept]], compact_frame(fresh_df)]).iloc[np.argsort(positions, kind='stable')]
+            df.index = raw.index
+            # Categories of the kept and fresh rows can differ, which pd.concat turns into object columns
+            df = compact_frame(df)
+
+            old_masks = old.feature_matrix.masks
+            masks = np.empty(len(raw), dtype=old_masks.dtype)
+            masks[kept] = old_masks[source_rows[kept]]
+            masks[fresh] = fresh_features.masks
+            features = TrailFeatures(masks, old.feature_matrix.n_features)
+            spatial_index = old.spatial_index.updated(source_rows, raw['latitude'].values, raw['longitude'].values)
+            # The text store is only dictionary codes, so it is simply encoded again
+            text_store = TrailTextStore.from_frame(raw, TEXT_COLUMNS)
+
+            recommender = TrailRecommendation(raw, geocoder=old.geocoder)
+            for attribute in ('categorical_features', 'encoder_categories', 'encoded_features', 'feature_columns'):
+                setattr(recommender, attribute, getattr(old, attribute))
+            recommender.set_catalog(df, features, spatial_index, row_keys, row_hashes, text_store=text_store)
+            if self.store is not None:
+                recommender.catalog_version = self.store.write(recommender, version)
+            else:
+                recommender.catalog_version = version or new_version()
+            # A single reference swap: new queries see the new catalog from here on
+            self.recommender = recommender
+            return recommender, summary
+
+
+def refresh_store(csv_path, store_path=DEFAULT_STORE_PATH, version=None):
+    """Refreshes the CURRENT version of a store from a trail CSV; returns (version, summary)."""
+    store = CatalogStore(store_path)
+    refresh = CatalogRefresh(store.load(), store)
+    recommender, summary = refresh.apply(pd.read_csv(csv_path), version)
+    return recommender.catalog_version, summary
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Apply a new trail CSV to the binary catalog without a full rebuild.")
+    parser.add_argument('--csv', default=os.path.join(app_root, 'Finalized_Trail_paths.csv'))
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--version', default=None)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    version, summary = refresh_store(args.csv, args.store, args.version)
+    print(f"Published catalog version {version} to {args.store} in {time.perf_counter() - start:.2f}s {summary}")
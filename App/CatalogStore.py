@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from TrailFeatures import TrailFeatures
+from TrailSpatialIndex import TrailSpatialIndex
+from TrailTextStore import TrailTextStore
+from VersionedDirectory import VersionedDirectory
+
+
+FORMAT_NAME = 'trails-to-health-catalog'
+FORMAT_VERSION = 3
+app_root = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = os.path.join(app_root, 'catalog')
+
+
+class CatalogStore:
+    """
+    A columnar, memory-mapped on-disk format for a preprocessed TrailRecommendation catalog.
+
+    A store is a VersionedDirectory: one sub-directory per catalog version and a CURRENT file
+    naming the live one. Each version has a header.json (format version, catalog version and
+    column schema) and one .npy file per array: numeric columns, categorical codes, UTF-8
+    blobs with offsets for text columns, the bit-packed feature masks, the spatial index, the
+    trail keys and content hashes used by CatalogRefresh, and the columns of the text store.
+
+    The feature masks, coordinates and spatial index are opened with mmap_mode='r', so they
+    are never copied: every worker process that loads the same version shares the same
+    physical pages through the OS page cache, and nothing is binned or one-hot encoded again.
+    The text store (site descriptions, addresses, ...) is only mapped when a result needs it.
+
+    Method:
+    write: writes a preprocessed recommender as a new version and makes it CURRENT
+    load: maps the CURRENT (or a given) version into a ready-to-query TrailRecommendation
+    current_version: returns the name of the live version
+    """
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.versions = VersionedDirectory(path, 'Catalog version')
+
+    def exists(self):
+        return self.versions.exists()
+
+    def current_version(self):
+        return self.versions.current_version()
+
+    def write(self, recommender, version=None, keep=3):
+        """
+        Writes a preprocessed TrailRecommendation as a new version, publishes it as CURRENT and
+        removes all but the newest `keep` versions. Returns the version name.
+
+        Versions are immutable: workers may have any of them memory-mapped, so writing a
+        version name that already exists raises ValueError instead of replacing it.
+        """
+        version, tmp_dir = self.versions.create(version)
+        df = recommender.df
+        columns = []
+        for i, name in enumerate(df.columns):
+            columns.append(_write_column(tmp_dir, f'c{i}', name, df[name]))
+        index = recommender.spatial_index
+        np.save(os.path.join(tmp_dir, 'feature_masks.npy'), np.ascontiguousarray(recommender.feature_matrix.masks))
+        np.save(os.path.join(tmp_dir, 'spatial_latitudes.npy'), index.latitudes)
+        np.save(os.path.join(tmp_dir, 'spatial_longitudes.npy'), index.longitudes)
+        np.save(os.path.join(tmp_dir, 'spatial_order.npy'), index.order)
+        np.save(os.path.join(tmp_dir, 'spatial_cells.npy'), index.sorted_cells)
+        # Trail keys and content hashes, so the next refresh only re-encodes what changed
+        np.save(os.path.join(tmp_dir, 'row_keys.npy'), recommender.row_keys)
+        np.save(os.path.join(tmp_dir, 'row_hashes.npy'), recommender.row_hashes)
+        header = {
+            'format': FORMAT_NAME,
+            'format_version': FORMAT_VERSION,
+            'catalog_version': version,
+            'n_rows': len(df),
+            'index_name': df.index.name,
+            'index_is_range': isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1,
+            'columns': columns,
+            'categorical_features': list(recommender.categorical_features),
+            'encoded_features': list(recommender.encoded_features),
+            'feature_columns': list(recommender.feature_columns),
+            'encoder_categories': {column: [_to_json(c) for c in categories]
+                                   for column, categories in recommender.encoder_categories.items()},
+            'cell_size': index.cell_size,
+            'text_columns': recommender.text_store.save(tmp_dir),
+        }
+        if not header['index_is_range']:
+            np.save(os.path.join(tmp_dir, 'index.npy'), df.index.to_numpy())
+        with open(os.path.join(tmp_dir, 'header.json'), 'w') as f:
+            json.dump(header, f, indent=1)
+
+        self.versions.publish(version, tmp_dir, keep)
+        return version
+
+    def load(self, version=None, geocoder=None):
+        """Maps a stored version into a TrailRecommendation that is ready for get_recommendations."""
+        from TrailRecommedations import TrailRecommendation
+        version = version or self.current_version()
+        version_dir = os.path.join(self.path, version)
+        with open(os.path.join(version_dir, 'header.json')) as f:
+            header = json.load(f)
+        if header.get('format') != FORMAT_NAME or header.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"{version_dir} is not a version {FORMAT_VERSION} {FORMAT_NAME} store")
+
+        def mapped(name):
+            return np.load(os.path.join(version_dir, name), mmap_mode='r', allow_pickle=False)
+
+        data = {column['name']: _read_column(version_dir, column, mapped) for column in header['columns']}
+        if header['index_is_range']:
+            index = pd.RangeIndex(header['n_rows'], name=header['index_name'])
+        else:
+            index = pd.Index(np.load(os.path.join(version_dir, 'index.npy'), allow_pickle=False), name=header['index_name'])
+        df = pd.DataFrame(data, index=index, columns=[column['name'] for column in header['columns']])
+
+        recommender = TrailRecommendation(df, geocoder=geocoder)
+        recommender.categorical_features = header['categorical_features']
+        recommender.encoded_features = np.array(header['encoded_features'], dtype=object)
+        recommender.feature_columns = header['feature_columns']
+        recommender.encoder_categories = header['encoder_categories']
+        spatial_index = TrailSpatialIndex.from_arrays(
+            mapped('spatial_latitudes.npy'), mapped('spatial_longitudes.npy'),
+            mapped('spatial_order.npy'), mapped('spatial_cells.npy'), header['cell_size'])
+        features = TrailFeatures(mapped('feature_masks.npy'), len(header['feature_columns']))
+        text_store = TrailTextStore.open(version_dir, header['text_columns'], header['n_rows'])
+        recommender.set_catalog(df, features, spatial_index, mapped('row_keys.npy'),
+                                mapped('row_hashes.npy'), header['catalog_version'], text_store)
+        return recommender
+
+
+def _write_column(directory, stem, name, series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        np.save(os.path.join(directory, f'{stem}.npy'), series.cat.codes.to_numpy())
+        return {'name': name, 'kind': 'category', 'file': f'{stem}.npy',
+                'categories': [_to_json(c) for c in series.cat.categories], 'ordered': bool(series.cat.ordered)}
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        np.save(os.path.join(directory, f'{stem}.npy'), series.to_numpy())
+        return {'name': name, 'kind': 'numeric', 'file': f'{stem}.npy', 'dtype': str(series.dtype)}
+    nulls = series.isna().to_numpy()
+    values = [None if null else str(value) for value, null in zip(series.to_numpy(), nulls)]
+    uniques = pd.unique(np.array([v for v in values if v is not None], dtype=object))
+    if len(uniques) <= len(values) // 2:
+        # Repetitive text (site names, websites, units): dictionary codes, -1 for missing
+        lookup = {value: code for code, value in enumerate(uniques)}
+        codes = np.array([-1 if v is None else lookup[v] for v in values], dtype=np.int32)
+        np.save(os.path.join(directory, f'{stem}.npy'), codes)
+        return {'name': name, 'kind': 'dictionary', 'file': f'{stem}.npy', 'values': list(uniques)}
+    # Free text: one UTF-8 blob plus row offsets, with a null mask for missing values
+    encoded = [b'' if v is None else v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f'{stem}.blob.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, f'{stem}.offsets.npy'), offsets)
+    np.save(os.path.join(directory, f'{stem}.nulls.npy'), nulls)
+    return {'name': name, 'kind': 'text', 'file': stem}
+
+
+def _read_column(directory, column, mapped):
+    if column['kind'] == 'numeric':
+        return mapped(column['file'])
+    if column['kind'] == 'category':
+        return pd.Categorical.from_codes(np.asarray(mapped(column['file'])), categories=column['categories'],
+                                         ordered=column['ordered'])
+    if column['kind'] == 'dictionary':
+        codes = np.asarray(mapped(column['file']))
+        lookup = np.array(column['values'] + [None], dtype=object)
+        # Code -1 (missing) picks the trailing None
+        return lookup[codes]
+    raw = mapped(f"{column['file']}.blob.npy").tobytes()
+    offsets = mapped(f"{column['file']}.offsets.npy").tolist()
+    nulls = np.asarray(mapped(f"{column['file']}.nulls.npy"))
+    values = np.array([raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])] + [None],
+                      dtype=object)[:-1]
+    values[nulls] = None
+    return values
+
+
+def _to_json(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def build_store(csv_path, store_path=DEFAULT_STORE_PATH, version=None):
+    """Reads and preprocesses a trail CSV once and writes it as a new store version."""
+    from TrailRecommedations import TrailRecommendation
+    recommender = TrailRecommendation(pd.read_csv(csv_path))
+    recommender.preprocess_data()
+    return CatalogStore(store_path).write(recommender, version)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the binary trail catalog used by the app workers.")
+    parser.add_argument('--csv', default=os.path.join(app_root, 'Finalized_Trail_paths.csv'))
+    parser.add_argument('--out', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--version', default=None)
+    args = parser.parse_args()
+    print(f"Wrote catalog version {build_store(args.csv, args.out, args.version)} to {args.out}")
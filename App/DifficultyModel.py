@@ -0,0 +1,178 @@
+"""
+The fitted difficulty clustering, persisted so new trails can be labeled without rerunning it.
+
+Usage: python App/DifficultyModel.py --csv new_trails.csv [--out App/Trail_Difficulty.csv] [--model App/models/difficulty_model.npz]
+Labels the trails of --csv and adds them to the difficulty catalog, replacing the trails it already has.
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from TrailClustering import (CATEGORICAL_COLUMNS, DIFFICULTY_CSV_PATH, MIN_SHAPE_LENG, NUMERIC_COLUMNS,
+                             prepare_trails, write_difficulty_csv)
+from TrailKeys import trail_keys
+
+
+FORMAT_VERSION = 1
+app_root = os.path.dirname(os.path.abspath(__file__))
+# Next to the versioned training runs of TrainModels.py, which publishes the model here
+DEFAULT_MODEL_PATH = os.path.join(app_root, 'models', 'difficulty_model.npz')
+
+
+class DifficultyModel:
+    """
+    The fitted ColumnTransformer (type_factor vocabulary and MinMax parameters), the cluster
+    centroids and the difficulty label of each centroid, as plain arrays.
+
+    assign_difficulty applies the transformer and the nearest-centroid rule with a few NumPy
+    operations over the whole batch, so labeling thousands of new trails takes milliseconds
+    and needs neither scikit-learn nor the original catalog.
+
+    Labels stay stable across refits: when a new clustering replaces a previous model, each
+    new centroid inherits the label of the previous centroid it is matched to (a minimum-cost
+    matching in the previous model's feature space), so a trail only changes label if the
+    clusters themselves moved.
+
+    Method:
+    from_clustering: builds the model of a fitted TrailClustering, aligned with a previous model
+    transform: the feature rows of a batch of trails
+    assign_difficulty: the difficulty label of each trail of a batch
+    save / load: writes / reads the model as one .npz file
+    """
+    def __init__(self, categories, scale, offset, centroids, labels, version=None):
+        """
+        Parameters:
+        - categories (list): the type_factor vocabulary of the one-hot encoder
+        - scale, offset (array): MinMaxScaler scale_ and min_ of NUMERIC_COLUMNS
+        - centroids (array): cluster centers in transformed feature space, one row per cluster
+        - labels (list): difficulty label of each cluster
+        """
+        self.categories = list(categories)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.labels = np.asarray(labels, dtype=object)
+        self.version = version or time.strftime('%Y%m%d%H%M%S')
+        self._centroid_norms = (self.centroids ** 2).sum(axis=1)
+
+    @classmethod
+    def from_clustering(cls, clustering, previous=None):
+        """
+        The model of a fitted TrailClustering. With a previous model, labels are carried over
+        from it (see the class docstring) instead of taken from the centroid difficulty ranking.
+        """
+        scaler = clustering.transformer.named_transformers_['scaling']
+        encoder = clustering.transformer.named_transformers_['onehot']
+        model = cls(encoder.categories_[0], scaler.scale_, scaler.min_, clustering.model.cluster_centers_,
+                    clustering.cluster_labels)
+        if previous is not None:
+            model.labels = previous._inherit_labels(model)
+        return model
+
+    def _inherit_labels(self, new):
+        from scipy.optimize import linear_sum_assignment
+        # The new centroids in this model's feature space: undo the new scaling, apply this one,
+        # and move the one-hot weights to this model's type_factor columns
+        measurements = (new.centroids[:, len(new.categories):] - new.offset) / new.scale
+        centroids = np.zeros((len(new.centroids), self.centroids.shape[1]))
+        centroids[:, len(self.categories):] = measurements * self.scale + self.offset
+        for i, category in enumerate(new.categories):
+            if category in self.categories:
+                centroids[:, self.categories.index(category)] = new.centroids[:, i]
+        cost = ((centroids[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        labels = self.labels[cost.argmin(axis=1)]
+        # One-to-one where possible, so two previous clusters never collapse onto one label
+        rows, cols = linear_sum_assignment(cost)
+        labels[rows] = self.labels[cols]
+        return labels
+
+    def transform(self, batch):
+        """Feature rows of the trails of a DataFrame, as the fitted ColumnTransformer would produce them."""
+        type_factor = batch[CATEGORICAL_COLUMNS[0]].astype(object).to_numpy()
+        features = np.zeros((len(batch), len(self.categories) + len(NUMERIC_COLUMNS)))
+        for i, category in enumerate(self.categories):
+            if isinstance(category, float) and np.isnan(category):
+                features[:, i] = pd.isna(type_factor)
+            else:
+                features[:, i] = type_factor == category
+        features[:, len(self.categories):] = batch[NUMERIC_COLUMNS].to_numpy(dtype=np.float64) * self.scale + self.offset
+        return features
+
+    def assign_difficulty(self, batch):
+        """
+        Returns the difficulty label of each trail of batch (a DataFrame or a list of trail
+        dictionaries) by nearest centroid. Trails that cannot be rated (missing measurements,
+        or Shape_Leng of MIN_SHAPE_LENG or less) get None.
+        """
+        if not isinstance(batch, pd.DataFrame):
+            batch = pd.DataFrame(list(batch))
+        labels = np.full(len(batch), None, dtype=object)
+        data = prepare_trails(batch.reset_index(drop=True))
+        if len(data) == 0:
+            return labels
+        features = self.transform(data)
+        # Squared distances through one matrix product: |x|² - 2 x·c + |c|², |x|² being constant per row
+        nearest = np.argmin(self._centroid_norms - 2 * features @ self.centroids.T, axis=1)
+        labels[data.index.to_numpy()] = self.labels[nearest]
+        return labels
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        header = {'format_version': FORMAT_VERSION, 'version': self.version, 'categories': self.categories,
+                  'labels': list(self.labels), 'min_shape_leng': MIN_SHAPE_LENG, 'numeric_columns': NUMERIC_COLUMNS}
+        # Saved next to the target and renamed over it, so a reader never loads a partial model
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.tmp-{os.getpid()}.npz'
+        np.savez(tmp_path, header=np.array(json.dumps(header)), scale=self.scale, offset=self.offset,
+                 centroids=self.centroids)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        with np.load(path, allow_pickle=False) as saved:
+            header = json.loads(str(saved['header']))
+            if header.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} difficulty model")
+            return cls(header['categories'], saved['scale'], saved['offset'], saved['centroids'],
+                       header['labels'], header['version'])
+
+
+def label_trails(df, model):
+    """Returns the ratable trails of df with the columns TrailDifficulty consumes."""
+    data = prepare_trails(df)
+    data['Difficulty_rating_KModes'] = model.assign_difficulty(data)
+    return data
+
+
+def merge_labeled(catalog, labeled):
+    """
+    The difficulty catalog with the labeled trails added; a trail it already has is replaced
+    by its new label rather than duplicated, so labeling the same file twice changes nothing.
+    """
+    positions = pd.Index(trail_keys(catalog)).get_indexer(trail_keys(labeled))
+    replaced = positions >= 0
+    kept = np.setdiff1d(np.arange(len(catalog)), positions[replaced])
+    merged = pd.concat([catalog.iloc[kept], labeled], ignore_index=True)
+    # A replaced trail takes the place of the one it replaces, so the occurrence numbers of
+    # trails sharing its key do not move; added trails go last
+    slots = np.concatenate([kept, np.where(replaced, positions, len(catalog) + np.arange(len(labeled)))])
+    return merged.iloc[np.argsort(slots, kind='stable')].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', required=True)
+    parser.add_argument('--out', default=DIFFICULTY_CSV_PATH)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args()
+    model = DifficultyModel.load(args.model)
+    start = time.perf_counter()
+    labeled = label_trails(pd.read_csv(args.csv), model)
+    elapsed = time.perf_counter() - start
+    catalog = merge_labeled(pd.read_csv(args.out), labeled) if os.path.exists(args.out) else labeled
+    write_difficulty_csv(catalog, args.out)
+    print(f"Labeled {len(labeled)} trails in {elapsed * 1000:.1f}ms with model {model.version}; "
+          f"{args.out} now has {len(catalog)} trails")
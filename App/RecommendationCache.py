@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+from cachetools import TTLCache
+
+from TrailSpatialIndex import geohash_encode
+
+
+class RecommendationCache:
+    """
+    A bounded LRU/TTL cache of ranked candidate pools, keyed by a canonicalized query.
+
+    The key is built after the user's answers are binned, so answers that encode to the same
+    feature vector (a 2 and a 2.5 mile trail length, say) share an entry. With a radius, the
+    user's location is snapped to a geohash cell, so every ZIP in the same cell shares the
+    entry too; the recommender stores a pool that is valid for any point of the cell and
+    re-checks the exact distances on each hit. Without a radius the ranking does not depend
+    on location at all, so the cell is left out of the key.
+
+    Method:
+    make_key: the canonical key of a query
+    get / put: thread-safe lookup and insert; get counts hits and misses
+    invalidate: drops every entry (called when the catalog changes)
+    stats: hit/miss counters and the current size
+    """
+    def __init__(self, maxsize=4096, ttl=3600, geohash_precision=5, pool_size=200):
+        """
+        Parameters:
+        - maxsize (int): maximum number of cached queries, least recently used evicted first
+        - ttl (int): seconds an entry stays valid
+        - geohash_precision (int): geohash length of the location cell (5 is about 3 x 3 miles)
+        - pool_size (int): number of ranked trails kept per radius query
+        """
+        self.geohash_precision = geohash_precision
+        self.pool_size = pool_size
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def make_key(self, catalog_version, user_vector, radius, lat, lon, filters=None):
+        # The encoded vector only has equal non-zero entries, so their positions identify it;
+        # filters is the canonical TrailAmenityIndex.filter_key of the query, None when unfiltered
+        features = tuple(np.flatnonzero(user_vector).tolist())
+        if not radius:
+            return (catalog_version, features, 0, None, filters)
+        return (catalog_version, features, radius, geohash_encode(lat, lon, self.geohash_precision), filters)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+
+    def record_fallback(self):
+        # A cached pool that could not fill the page by itself after exact distance filtering
+        with self._lock:
+            self.fallbacks += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'fallbacks': self.fallbacks,
+                    'hit_rate': self.hits / lookups if lookups else 0.0, 'size': len(self._entries)}
@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import os
+import threading
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(app_root, 'static')
+
+
+class StaticAssets:
+    """
+    The app's static files (background image, map HTML, CSS), read once per process and served from memory.
+
+    A file is read the first time it is asked for and kept with the SHA-256 of its content.
+    Later calls only stat it, so an edited file is picked up without a restart. The forms
+    derived from a file (its text, its base64 encoding, a <style> block) are cached by content
+    hash, so a rewrite with the same bytes reuses them and no rerun encodes the image again.
+
+    Method:
+    digest: the SHA-256 of a file's content
+    data: a file's bytes
+    text: a file's content decoded as UTF-8
+    base64: a file's content encoded as base64 (for data: URLs)
+    style: a CSS file wrapped in a <style> block, ready for st.markdown
+    derive: any other form of a file, built by a function of its bytes
+    """
+    def __init__(self, static_dir=STATIC_DIR):
+        """
+        Parameters:
+        - static_dir (str): directory the asset names are relative to
+        """
+        self.static_dir = static_dir
+        self._files = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name):
+        # One stat per call; the file is only read again when its size or mtime changed
+        path = os.path.join(self.static_dir, name)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._files.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._files[name] = (version, digest, data)
+        return digest, data
+
+    def derive(self, name, form, make):
+        # make(data) runs once per content hash and form
+        digest, data = self._load(name)
+        key = (digest, form)
+        value = self._derived.get(key)
+        if value is None:
+            value = make(data)
+            with self._lock:
+                self._derived[key] = value
+        return value
+
+    def digest(self, name):
+        return self._load(name)[0]
+
+    def data(self, name):
+        return self._load(name)[1]
+
+    def text(self, name):
+        return self.derive(name, 'text', lambda data: data.decode('utf-8'))
+
+    def base64(self, name):
+        return self.derive(name, 'base64', lambda data: base64.b64encode(data).decode())
+
+    def style(self, name):
+        return self.derive(name, 'style', lambda data: f"<style>{data.decode('utf-8')}</style>")
+
+
+_default_assets = None
+_default_lock = threading.Lock()
+
+
+def get_static_assets():
+    """Returns the process-wide StaticAssets of App/static, shared by every Streamlit session."""
+    global _default_assets
+    if _default_assets is None:
+        with _default_lock:
+            if _default_assets is None:
+                _default_assets = StaticAssets()
+    return _default_assets
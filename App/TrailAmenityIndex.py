@@ -0,0 +1,167 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+TERM_PATTERN = re.compile(r'[a-z0-9]+')
+# Words too common in park descriptions to narrow anything down
+STOP_WORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+                        'of', 'on', 'or', 'the', 'to', 'with'])
+
+
+def split_amenities(text):
+    """The amenity names of a comma-separated amenities field ("Picnic Area, Hiking, ...")."""
+    if not isinstance(text, str):
+        return []
+    return [name.strip() for name in text.split(',') if name.strip()]
+
+
+def terms(text):
+    """The distinct lower-case search terms of a text, in order of appearance."""
+    if not isinstance(text, str):
+        return []
+    return list(dict.fromkeys(term for term in TERM_PATTERN.findall(text.lower()) if term not in STOP_WORDS))
+
+
+class TrailAmenityIndex:
+    """
+    An inverted index of the site amenities and descriptions, for filtering trails by amenity
+    ("Picnic Area") and by free-text keyword ("waterfall").
+
+    The amenities and description come from the site a trail belongs to, so trails are grouped
+    by their (site_name, amenities, description) and everything is indexed per group: a few
+    hundred groups instead of one entry per trail, plus one int32 group id per trail. Each
+    group's amenities are a bitset (one uint64 word per 64 amenity names), and each term of the
+    site name, amenities and description has a sorted postings list of the groups containing
+    it, all in one int32 array.
+
+    A filter is evaluated once per group (a bitwise AND over the bitsets, an intersection of
+    postings) and then spread to trails with a single gather, group_ok[groups[rows]], which
+    combines with the radius candidates or the difficulty partition in the same vectorized step.
+
+    Method:
+    from_frame: builds the index from a catalog with site_name, amenities and description columns
+    from_columns: builds it from the dictionary codes of those columns (e.g. a TrailTextStore)
+    from_codes: builds it from per-trail group ids and the text of each group
+    group_mask: which groups pass an amenity and keyword filter
+    trail_mask: which trails (or which of the given rows) pass it
+    filter_key: a canonical, hashable form of a filter (for result caches)
+    """
+    def __init__(self, groups, amenities, bitsets, term_bounds, postings):
+        """
+        Parameters:
+        - groups (int32 array): group id of every trail
+        - amenities (list): amenity names, in bit order
+        - bitsets (uint64 array): n_groups x n_words amenity bits of every group
+        - term_bounds (dict): term -> (start, end) of its postings
+        - postings (int32 array): sorted group ids of every term, one term after the other
+        """
+        self.groups = groups
+        self.amenities = amenities
+        self.amenity_bits = {name.lower(): bit for bit, name in enumerate(amenities)}
+        self.bitsets = bitsets
+        self.term_bounds = term_bounds
+        self.postings = postings
+        for array in (groups, bitsets, postings):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_codes(cls, groups, site_names, amenity_texts, descriptions):
+        """
+        Parameters:
+        - groups (int array): group id of every trail
+        - site_names, amenity_texts, descriptions (list): the text of every group, by group id
+        """
+        amenity_sets = [split_amenities(text) for text in amenity_texts]
+        amenities = sorted({name for names in amenity_sets for name in names}, key=str.lower)
+        bit_of = {name: bit for bit, name in enumerate(amenities)}
+        bitsets = np.zeros((len(amenity_sets), max(1, (len(amenities) + 63) // 64)), dtype=np.uint64)
+        for group, names in enumerate(amenity_sets):
+            for name in names:
+                bit = bit_of[name]
+                bitsets[group, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+
+        term_groups = {}
+        for group, texts in enumerate(zip(site_names, amenity_texts, descriptions)):
+            for term in dict.fromkeys(term for text in texts for term in terms(text)):
+                term_groups.setdefault(term, []).append(group)
+        term_bounds, position = {}, 0
+        for term, group_ids in term_groups.items():
+            term_bounds[term] = (position, position + len(group_ids))
+            position += len(group_ids)
+        postings = np.fromiter((group for group_ids in term_groups.values() for group in group_ids),
+                               dtype=np.int32, count=position)
+        return cls(np.asarray(groups, dtype=np.int32), amenities, bitsets, term_bounds, postings)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Builds the index from the (distinct values, per-trail codes) of the site_name, amenities
+        and description columns, codes being -1 for a missing value.
+        """
+        code_arrays = [np.asarray(codes) for _, codes in columns]
+        groups, keys = pd.MultiIndex.from_arrays(code_arrays).factorize()
+        texts = [[values[code] if code >= 0 else None for code in level_codes]
+                 for (values, _), level_codes in zip(columns, zip(*keys.tolist()) if len(keys) else [()] * 3)]
+        return cls.from_codes(groups, *texts)
+
+    @classmethod
+    def from_frame(cls, df):
+        columns = []
+        for name in ('site_name', 'amenities', 'description'):
+            if name in df.columns:
+                codes, values = pd.factorize(df[name])
+                columns.append((list(values), codes))
+            else:
+                columns.append(([], np.full(len(df), -1)))
+        return cls.from_columns(columns)
+
+    def _amenity_mask(self, amenities):
+        required = np.zeros(self.bitsets.shape[1], dtype=np.uint64)
+        for name in amenities:
+            bit = self.amenity_bits.get(name.strip().lower())
+            if bit is None:
+                # No group has an amenity the index has never seen
+                return np.zeros(len(self.bitsets), dtype=bool)
+            required[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return np.all((self.bitsets & required) == required, axis=1)
+
+    def _keyword_mask(self, keywords):
+        mask = np.zeros(len(self.bitsets), dtype=bool)
+        matches = None
+        for term in terms(keywords):
+            bounds = self.term_bounds.get(term)
+            if bounds is None:
+                return mask
+            group_ids = self.postings[bounds[0]:bounds[1]]
+            matches = group_ids if matches is None else np.intersect1d(matches, group_ids, assume_unique=True)
+        if matches is None:
+            # Only stop words: no keyword filter at all
+            mask[:] = True
+        else:
+            mask[matches] = True
+        return mask
+
+    def group_mask(self, amenities=None, keywords=None):
+        """Boolean per group, or None when there is no filter. Every amenity and every keyword must match."""
+        if not amenities and not keywords:
+            return None
+        mask = np.ones(len(self.bitsets), dtype=bool)
+        if amenities:
+            mask &= self._amenity_mask(amenities)
+        if keywords:
+            mask &= self._keyword_mask(keywords)
+        return mask
+
+    def trail_mask(self, amenities=None, keywords=None, rows=None):
+        """Boolean per trail (per row of rows when given), or None when there is no filter."""
+        group_ok = self.group_mask(amenities, keywords)
+        if group_ok is None:
+            return None
+        return group_ok[self.groups if rows is None else self.groups[rows]]
+
+    def filter_key(self, amenities=None, keywords=None):
+        if not amenities and not keywords:
+            return None
+        return (tuple(sorted({name.strip().lower() for name in amenities or ()})), tuple(sorted(terms(keywords))))
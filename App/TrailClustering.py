@@ -0,0 +1,208 @@
+"""
+Difficulty clustering of the trail catalog: the importable, scalable replacement for the
+TrailClusterer (HierarchialClustering.ipynb) and TrailKMeansClustering (K_MeansClusteringTrail.ipynb)
+notebooks that produce App/Trail_Difficulty.csv.
+
+Usage: python App/TrailClustering.py [--csv App/Finalized_Trail_paths.csv] [--out App/Trail_Difficulty.csv]
+Also saves the fitted model used by App/DifficultyModel.py to label new trails.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+TRAILS_CSV_PATH = os.path.join(app_root, 'Finalized_Trail_paths.csv')
+DIFFICULTY_CSV_PATH = os.path.join(app_root, 'Trail_Difficulty.csv')
+# Labels of the Difficulty page, easiest first
+DIFFICULTY_LABELS = ['Easy Peasy Lemon Squeezy', 'Medium – The Adventure Tickles',
+                     'Hard – The Thrill Kicks In', 'Very Hard – The Leg-Day Loco']
+CATEGORICAL_COLUMNS = ['type_factor']
+NUMERIC_COLUMNS = ['Shape_Leng', 'Elevation_Gain', 'Angle_of_Descent']
+# Trails this short (in meters) are left out, as in the notebooks
+MIN_SHAPE_LENG = 50
+# How much each type_factor adds to a cluster's difficulty, on the scale of one MinMax-scaled column
+TYPE_FACTOR_DIFFICULTY = {'easy': 0.0, 'medium': 0.5, 'hard': 1.0}
+
+
+def make_transformer():
+    """The notebooks' ColumnTransformer: one-hot type_factor, MinMax-scaled measurements."""
+    # sklearn is imported by the functions that fit, so the app can import the labels above without it
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
+    return ColumnTransformer([
+        ('onehot', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_COLUMNS),
+        ('scaling', MinMaxScaler(), NUMERIC_COLUMNS),
+    ], sparse_threshold=0)
+
+
+def prepare_trails(df):
+    """
+    Returns the trails that can be clustered, as a copy with type_factor mapped to its name
+    (easy/medium/hard) and the Length(miles) column TrailDifficulty filters on.
+    """
+    data = df.copy()
+    if pd.api.types.is_numeric_dtype(data['type_factor']):
+        data['type_factor'] = data['type_factor'].map({0: 'easy', 0.1: 'medium', 0.3: 'hard'})
+    data = data.loc[(data['Shape_Leng'] > MIN_SHAPE_LENG) & data[NUMERIC_COLUMNS].notna().all(axis=1)]
+    data['Length(miles)'] = round(data['Shape_Leng'] * 0.000621, 2)
+    return data
+
+
+_worker_features = None
+
+
+def _init_worker(features):
+    # The feature matrix is sent once per worker process instead of once per k
+    global _worker_features
+    _worker_features = features
+
+
+def _fit_k(k, batch_size, sample_size, random_state):
+    return fit_k(_worker_features, k, batch_size, sample_size, random_state)
+
+
+def fit_k(features, k, batch_size=4096, sample_size=10000, random_state=42):
+    """
+    Fits a MiniBatchKMeans with k clusters and returns (model, silhouette). The silhouette is
+    computed on a random sample of at most sample_size trails, which keeps it O(sample_size²)
+    instead of O(n²).
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+    model = MiniBatchKMeans(n_clusters=k, batch_size=batch_size, n_init=3, random_state=random_state)
+    labels = model.fit_predict(features)
+    if len(np.unique(labels)) < 2:
+        return model, -1.0
+    sample = min(sample_size, len(features))
+    return model, float(silhouette_score(features, labels, sample_size=sample, random_state=random_state))
+
+
+class TrailClustering:
+    """
+    A class to cluster trails by difficulty and label them for the Difficulty page.
+
+    Mini-batch k-means keeps memory linear in the number of trails (AgglomerativeClustering
+    needs the n x n distance matrix), the number of clusters is chosen by a sampled silhouette
+    score, and the candidate k values are fitted in parallel on a process pool. Clusters are
+    ranked by how difficult their centroid is and split evenly over DIFFICULTY_LABELS.
+
+    Method:
+    fit: chooses k and clusters the catalog
+    partial_fit: updates the centroids with new trails without re-clustering the catalog
+    predict: returns the cluster of each trail
+    label: returns the trails with the Cluster, Difficulty_rating_KModes and Length(miles) columns
+    """
+    def __init__(self, k_values=range(4, 11), batch_size=4096, sample_size=10000, random_state=42, n_jobs=None):
+        """
+        Parameters:
+        - k_values (iterable): numbers of clusters to try (at least 4 gives every label a cluster)
+        - batch_size (int): mini-batch size of the k-means updates
+        - sample_size (int): number of trails the silhouette score is computed on
+        - random_state (int): seed of the k-means initialization and of the silhouette sample
+        - n_jobs (int): processes of the k sweep; None uses every CPU, 1 runs it in this process
+        """
+        self.k_values = list(k_values)
+        self.batch_size = batch_size
+        self.sample_size = sample_size
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.transformer = None
+        self.model = None
+        self.silhouette_scores = {}
+        self.cluster_labels = None
+
+    def fit(self, df, prepared=None):
+        """
+        Chooses k and clusters the trails of df. prepared is an already fitted transformer and
+        its features for prepare_trails(df) (e.g. from the TrainModels cache), so they are not
+        fitted again.
+        """
+        if prepared is None:
+            data = prepare_trails(df)
+            self.transformer = make_transformer()
+            features = self.transformer.fit_transform(data)
+        else:
+            self.transformer, features = prepared
+        args = (self.batch_size, self.sample_size, self.random_state)
+        if self.n_jobs == 1 or len(self.k_values) == 1:
+            fits = [fit_k(features, k, *args) for k in self.k_values]
+        else:
+            workers = min(self.n_jobs or os.cpu_count() or 1, len(self.k_values))
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(features,)) as pool:
+                fits = list(pool.map(_fit_k, self.k_values, *[[arg] * len(self.k_values) for arg in args]))
+        self.silhouette_scores = {k: score for k, (_, score) in zip(self.k_values, fits)}
+        best = max(range(len(fits)), key=lambda i: fits[i][1])
+        self.model = fits[best][0]
+        self.cluster_labels = self._rank_clusters()
+        return self
+
+    def _rank_clusters(self):
+        """Label of each cluster, by the rank of its centroid's difficulty."""
+        centers = self.model.cluster_centers_
+        encoder = self.transformer.named_transformers_['onehot']
+        type_weights = [TYPE_FACTOR_DIFFICULTY.get(category, 0.0) for category in encoder.categories_[0]]
+        weights = np.concatenate([type_weights, np.ones(len(NUMERIC_COLUMNS))])
+        difficulty = centers @ weights
+        labels = np.empty(len(centers), dtype=object)
+        for rank, cluster in enumerate(np.argsort(difficulty, kind='stable')):
+            labels[cluster] = DIFFICULTY_LABELS[rank * len(DIFFICULTY_LABELS) // len(centers)]
+        return labels
+
+    def partial_fit(self, df):
+        """
+        Moves the centroids towards new trails (scaled with the fitted transformer) and keeps
+        each cluster's label, so the existing catalog does not need to be re-clustered.
+        """
+        data = prepare_trails(df)
+        if len(data):
+            self.model.partial_fit(self.transformer.transform(data))
+        return self
+
+    def predict(self, df):
+        return self.model.predict(self.transformer.transform(df))
+
+    def label(self, df):
+        """Returns the clusterable trails of df with the columns TrailDifficulty consumes."""
+        data = prepare_trails(df)
+        clusters = self.predict(data) if len(data) else np.empty(0, dtype=np.int64)
+        data['Cluster'] = clusters
+        data['Difficulty_rating_KModes'] = self.cluster_labels[clusters]
+        return data
+
+
+def write_difficulty_csv(df, csv_path=DIFFICULTY_CSV_PATH):
+    # Written next to the target and renamed over it, so get_difficulty_catalog never reads a partial file
+    tmp_path = f'{csv_path}.tmp-{os.getpid()}'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=TRAILS_CSV_PATH)
+    parser.add_argument('--out', default=DIFFICULTY_CSV_PATH)
+    parser.add_argument('--k', type=int, nargs=2, default=[4, 10], metavar=('MIN', 'MAX'))
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--model', default=None, help='where the fitted model is saved (App/models/difficulty_model.npz)')
+    args = parser.parse_args()
+    from DifficultyModel import DEFAULT_MODEL_PATH, DifficultyModel
+    model_path = args.model or DEFAULT_MODEL_PATH
+    start = time.perf_counter()
+    trails = pd.read_csv(args.csv)
+    clustering = TrailClustering(range(args.k[0], args.k[1] + 1), n_jobs=args.jobs).fit(trails)
+    for k, score in clustering.silhouette_scores.items():
+        print(f"k={k:>2} silhouette={score:.3f}")
+    # Keep the labels of the previous model, so a refit does not rename the clusters
+    previous = DifficultyModel.load(model_path) if os.path.exists(model_path) else None
+    model = DifficultyModel.from_clustering(clustering, previous)
+    clustering.cluster_labels = model.labels
+    labeled = clustering.label(trails)
+    write_difficulty_csv(labeled, args.out)
+    model.save(model_path)
+    print(f"Wrote {len(labeled)} trails in {clustering.model.n_clusters} clusters to {args.out} "
+          f"in {time.perf_counter() - start:.1f}s")
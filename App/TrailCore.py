@@ -0,0 +1,194 @@
+"""
+The recommendation core shared by the Streamlit app (App.py) and the JSON service
+(TrailService.py): loading the catalogs, turning the user's answers into the inputs of
+TrailRecommendation and TrailDifficulty, and rendering their results (TrailRender.py) and
+the trail map (TrailTiles.py).
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from CatalogStore import DEFAULT_STORE_PATH, CatalogStore
+from TrailClustering import DIFFICULTY_LABELS
+from TrailDifficulty import DIFFICULTY_CSV_PATH, TrailDifficulty
+from TrailRecommedations import TrailRecommendation
+from StaticAssets import get_static_assets
+from TrailRender import TrailRender
+from TrailTiles import DEFAULT_TILES_PATH, highlight_layer
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+TRAILS_CSV_PATH = os.path.join(app_root, 'Finalized_Trail_paths.csv')
+ZIP_PATTERN = r'^\d{5}$'
+# Answers of the Recommendation page and the user_input keys they set
+EXPLORATION_MODES = {'Walk': 'Foot', 'Horse riding': 'Horse', 'Bike': 'Bike', 'Snowmobile': 'Snowmb', 'Accessible': 'Accessible'}
+EXPERIENCE_LEVELS = ['Beginner', 'Moderate', 'Experienced']
+DISTANCE_FILTERS = {'All': 0, 'Within 10 miles': 10, 'Within 50 miles': 50, 'Within 100 miles': 100}
+# Columns returned to clients
+RECOMMENDATION_COLUMNS = ['site_name', 'website', 'Name', 'Elevation Gain(feet)', 'Length(miles)',
+                          'Distance From You(miles)', 'Similarity']
+DIFFICULTY_COLUMNS = ['site_name', 'website', 'Name', 'Length(miles)', 'Elevation Gain(feet)', 'type_factor',
+                      'Distance From You(miles)']
+# Columns of the HTML tables of the Streamlit pages
+RECOMMENDATION_TABLE = ['Site Name', 'Name', 'Elevation Gain(feet)', 'Length(miles)', 'Distance From You(miles)']
+DIFFICULTY_TABLE = ['Distance From You(miles)', 'Site Name', 'Name', 'Length(miles)', 'Elevation Gain(feet)', 'type_factor']
+# The difficulty catalog has no Elevation Gain(feet) column, the Difficulty page derives it
+DIFFICULTY_UNIT_COLUMNS = {'Elevation Gain(feet)': ('Elevation_Gain', 1 / 3.28)}
+# Renderers of the last few catalogs, so a catalog refresh does not keep the old ones alive
+MAX_RENDERERS = 4
+# Where the page fetches the map tiles: Streamlit serves App/static at /app/static
+# (enableStaticServing in .streamlit/config.toml)
+TILE_URL = '/app/static/tiles'
+TILE_MANIFEST = 'tiles/manifest.json'
+
+class CatalogUnavailable(Exception):
+    """A request needs a catalog that was not published (e.g. no difficulty catalog yet)."""
+
+
+_renderers = OrderedDict()
+_renderers_lock = threading.Lock()
+
+
+def current_store_version(store_path=DEFAULT_STORE_PATH):
+    """The live version of the binary catalog, or None when there is no store."""
+    store = CatalogStore(store_path)
+    return store.current_version() if store.exists() else None
+
+
+def load_recommender(version=None, store_path=DEFAULT_STORE_PATH, csv_path=TRAILS_CSV_PATH, geocoder=None):
+    """
+    Maps the given binary catalog version (python App/CatalogStore.py), or reads and
+    preprocesses the trail CSV when version is None.
+    """
+    if version is not None:
+        return CatalogStore(store_path).load(version, geocoder=geocoder)
+    recommender = TrailRecommendation(pd.read_csv(csv_path), geocoder=geocoder)
+    recommender.preprocess_data()
+    return recommender
+
+
+def load_difficulty(csv_path=DIFFICULTY_CSV_PATH, geocoder=None):
+    return TrailDifficulty(pd.read_csv(csv_path), geocoder=geocoder)
+
+
+def _check_filters(amenities, keywords):
+    if amenities is not None and (not isinstance(amenities, (list, tuple))
+                                  or not all(isinstance(name, str) for name in amenities)):
+        raise ValueError('Amenities should be a list of amenity names')
+    if keywords is not None and not isinstance(keywords, str):
+        raise ValueError('Keywords should be a text')
+    return {'amenities': list(amenities or []), 'keywords': keywords or ''}
+
+
+def build_user_input(zip_code, exploration_mode, elevation_gain, trail_length, experience, radius,
+                     amenities=None, keywords=None):
+    """
+    Returns the user_input of TrailRecommendation.get_recommendations for the answers of the
+    Recommendation page; radius is in miles, 0 for no distance filter, and amenities (names
+    such as "Picnic Area") and keywords (free text) optionally restrict the trails to sites
+    that have all of them. Raises ValueError with a message for the user when an answer is invalid.
+    """
+    if not isinstance(zip_code, str) or not re.match(ZIP_PATTERN, zip_code):
+        raise ValueError('Invalid zip code')
+    if exploration_mode not in EXPLORATION_MODES:
+        raise ValueError(f"Exploration mode should be one of {', '.join(EXPLORATION_MODES)}")
+    if not isinstance(trail_length, int) or isinstance(trail_length, bool) or trail_length <= 0:
+        raise ValueError('Trail length should be a positive integer')
+    if not isinstance(elevation_gain, int) or isinstance(elevation_gain, bool) or elevation_gain <= 0:
+        raise ValueError('Elevation gain should be a positive integer')
+    if experience not in EXPERIENCE_LEVELS:
+        raise ValueError(f"Experience level should be one of {', '.join(EXPERIENCE_LEVELS)}")
+    if not isinstance(radius, (int, float)) or isinstance(radius, bool) or not math.isfinite(radius) or radius < 0:
+        raise ValueError('Distance should be a number of miles, 0 for no limit')
+    user_input = {'Zip': zip_code}
+    user_input.update({feature: 'Y' if mode == exploration_mode else 'N' for mode, feature in EXPLORATION_MODES.items()})
+    user_input.update({
+        'Trail_Leng': trail_length,
+        'Elevation_Gain': elevation_gain,
+        'type_factor': experience.lower(),
+        'radius': radius,
+    })
+    user_input.update(_check_filters(amenities, keywords))
+    return user_input
+
+
+def user_input_from_json(payload):
+    """build_user_input for a JSON request body, e.g. {"zip": "13210", "exploration_mode": "Walk",
+    "elevation_gain": 80, "trail_length": 3, "experience": "Beginner", "radius": 10,
+    "amenities": ["Picnic Area"], "keywords": "waterfall"}."""
+    if not isinstance(payload, dict):
+        raise ValueError('The request body should be a JSON object')
+    return build_user_input(payload.get('zip'), payload.get('exploration_mode'), payload.get('elevation_gain'),
+                            payload.get('trail_length'), payload.get('experience'), payload.get('radius', 0),
+                            payload.get('amenities'), payload.get('keywords'))
+
+
+def build_difficulty_input(zip_code, difficulty, amenities=None, keywords=None):
+    if not isinstance(zip_code, str) or not re.match(ZIP_PATTERN, zip_code):
+        raise ValueError('Invalid zip code')
+    if difficulty not in DIFFICULTY_LABELS:
+        raise ValueError(f"Difficulty level should be one of {', '.join(DIFFICULTY_LABELS)}")
+    user_input = {'Zip': zip_code, 'Difficulty': difficulty}
+    user_input.update(_check_filters(amenities, keywords))
+    return user_input
+
+
+def difficulty_input_from_json(payload):
+    if not isinstance(payload, dict):
+        raise ValueError('The request body should be a JSON object')
+    return build_difficulty_input(payload.get('zip'), payload.get('difficulty'), payload.get('amenities'),
+                                  payload.get('keywords'))
+
+
+def get_difficulty_recommendations(difficulty, user_input):
+    """The nearest trails of the requested difficulty; difficulty_renderer adds the display columns."""
+    return difficulty.get_recommendations(user_input)
+
+
+def _get_renderer(catalog, kind, build):
+    # Keyed by the catalog object, which the cache keeps alive so its id is not reused
+    key = (id(catalog), kind)
+    with _renderers_lock:
+        cached = _renderers.get(key)
+        if cached is not None:
+            _renderers.move_to_end(key)
+            return cached[1]
+    renderer = build()
+    with _renderers_lock:
+        _renderers[key] = (catalog, renderer)
+        while len(_renderers) > MAX_RENDERERS:
+            _renderers.popitem(last=False)
+    return renderer
+
+
+def recommendation_renderer(recommender):
+    """The TrailRender of the recommender's current catalog, built once per catalog load."""
+    return _get_renderer(recommender.df, 'recommendations',
+                         lambda: TrailRender(recommender.df, RECOMMENDATION_TABLE))
+
+
+def difficulty_renderer(difficulty):
+    return _get_renderer(difficulty.df, 'difficulty',
+                         lambda: TrailRender(difficulty.df, DIFFICULTY_TABLE, DIFFICULTY_UNIT_COLUMNS,
+                                             table_attributes='border="0" class="dataframe table" id="recommendations-table"'))
+
+
+def tile_map_html(result=None):
+    """
+    The trail map page (static/tilemap.html) over the published tiles (python App/TrailTiles.py),
+    with the trails of a result frame highlighted; None when no tiles were published.
+    """
+    if not os.path.exists(os.path.join(DEFAULT_TILES_PATH, 'manifest.json')):
+        return None
+    assets = get_static_assets()
+    # Both files are cached by StaticAssets, so only the highlight is built per request
+    manifest = dict(json.loads(assets.text(TILE_MANIFEST)), url=TILE_URL)
+    highlight = highlight_layer(result) if result is not None else '{"type":"FeatureCollection","features":[]}'
+    return (assets.text('tilemap.html')
+            .replace('{{ tile_manifest }}', json.dumps(manifest).replace('<', '\\u003c'))
+            .replace('{{ highlight }}', highlight))
@@ -1,46 +1,105 @@
+import os
+import threading
+
 import pandas as pd
 import numpy as np
-from geopy.geocoders import Nominatim
-from geopy import distance
-from geopy.distance import geodesic
-import requests
-from TrailRecommedations import TrailRecommendation
+from TrailAmenityIndex import TrailAmenityIndex
+from TrailMetrics import get_metrics
+from TrailSpatialIndex import TrailSpatialIndex
+from ZipGeocoder import get_geocoder
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+DIFFICULTY_CSV_PATH = os.path.join(app_root, 'Trail_Difficulty.csv')
+# Trails this short are never recommended on the Difficulty page
+MIN_LENGTH_MILES = 0.3
 
 
 class TrailDifficulty:
-    def __init__(self, df):
+    """
+    A class to recommend the nearest trails of a chosen difficulty level.
+
+    The catalog is split once into one partition per difficulty label, with the minimum length
+    filter already applied. Each partition keeps its own coordinate arrays and spatial index,
+    so a query only ever touches the trails of the requested difficulty. The optional amenity and
+    keyword filters of user_input go through a TrailAmenityIndex built with the partitions.
+
+    Method:
+    get_recommendations: returns the 10 nearest trails of the difficulty (and amenities, keywords) in user_input
+    """
+    def __init__(self, df, geocoder=None, metrics=None):
         """
-        Initializes a TrailRecommendation object with a list of trail objects.
+        Initializes a TrailDifficulty object with the difficulty catalog (Trail_Difficulty.csv).
+        The geocoder and metrics default to the process-wide ZipGeocoder and TrailMetrics
+        shared by both recommenders.
         
         """
         self.df = df
-    def get_lat_long(self, zipcode):
-        url = "https://nominatim.openstreetmap.org/search.php"
-        params = {"q": zipcode, "format": "jsonv2", "countrycodes": "US"}
-
-        try:
-            response = requests.get(url, params=params)
-            response_json = response.json()
-            if len(response_json) > 0:
-                latitude = response_json[0]['lat']
-                longitude = response_json[0]['lon']
-                return latitude, longitude
-            else:
-                return None, None
-        except:
-            return None, None
+        self.geocoder = geocoder if geocoder is not None else get_geocoder()
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.partitions = {}
+        eligible = (self.df['Length(miles)'] > MIN_LENGTH_MILES).values # & (self.df['Length(miles)']>0.2)
+        labels = self.df['Difficulty_rating_KModes'].values
+        for label in pd.unique(labels[eligible]):
+            rows = np.flatnonzero(eligible & (labels == label))
+            rows.setflags(write=False)
+            index = TrailSpatialIndex(self.df['latitude'].values[rows], self.df['longitude'].values[rows])
+            self.partitions[label] = (rows, index)
+        self.amenity_index = TrailAmenityIndex.from_frame(self.df)
     
     def get_recommendations(self, user_input):
+        metrics = self.metrics
+        with metrics.request('difficulty'):
+            # Calculate distance between user's zipcode and each trail
+            with metrics.span('geocode'):
+                user_lat, user_long = self.geocoder.locate(user_input['Zip'])
+            if user_input['Difficulty'] not in self.partitions:
+                metrics.increment('empty_results_total', recommender='difficulty')
+                h = self.df.iloc[[]].copy()
+                h['Distance From You(miles)'] = []
+                return h
+            # Nearest trails within the partition of the requested difficulty
+            rows, index = self.partitions[user_input['Difficulty']]
+            with metrics.span('amenity_filter'):
+                mask = self.amenity_index.trail_mask(user_input.get('amenities'), user_input.get('keywords'), rows)
+            with metrics.span('nearest'):
+                nearest, distances = index.query_nearest(user_lat, user_long, 10, mask=mask)
+            if len(nearest) == 0:
+                metrics.increment('empty_results_total', recommender='difficulty')
+            with metrics.span('result_frame'):
+                h = self.df.iloc[rows[nearest]].copy()
+                h['Distance From You(miles)'] = distances
+            return h
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_difficulty_catalog(csv_path=DIFFICULTY_CSV_PATH):
+    """
+    Returns the process-wide TrailDifficulty for csv_path, reading the CSV only once.
+
+    The file's modification time is checked on every call (a single stat), so a new
+    Trail_Difficulty.csv is picked up on the next request without restarting the app.
+    """
+    mtime = os.stat(csv_path).st_mtime_ns
+    cached = _catalogs.get(csv_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _catalogs_lock:
+        cached = _catalogs.get(csv_path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, TrailDifficulty(pd.read_csv(csv_path)))
+            _catalogs[csv_path] = cached
+    return cached[1]
+
 
-        # Calculate distance between user's zipcode and each trail
-        user_lat, user_long = self.get_lat_long(user_input['Zip'])
-        print(self.df.head(20))
-        # Filter trails by zip code
-        self.df['Distance From You(miles)'] = self.df.apply(lambda row: geodesic((user_lat, user_long), (row['latitude'], row['longitude'])).miles, axis=1)
-        h=self.df[(self.df['Difficulty_rating_KModes']==user_input['Difficulty']) & (self.df['Length(miles)']>0.3)] # & (self.df['Length(miles)']>0.2)
-        h = h.sort_values('Distance From You(miles)')
-        #print(h.head(20))
-        return h.head(10)
+def reload_difficulty_catalog(csv_path=DIFFICULTY_CSV_PATH):
+    """Forces the next get_difficulty_catalog call to read csv_path again."""
+    with _catalogs_lock:
+        _catalogs.pop(csv_path, None)
+    return get_difficulty_catalog(csv_path)
 
 if __name__ == "__main__":
     # load data
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+# Mean earth radius (IUGG) used by the haversine mode, in miles
+EARTH_RADIUS_MILES = 3958.7613
+# WGS-84 ellipsoid, the same one geopy's geodesic uses
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+METERS_PER_MILE = 1609.344
+
+
+def haversine_miles(lat, lon, lats, lons):
+    """
+    Great-circle distance in miles between one point (or an array of points) and an array of points.
+
+    Parameters:
+    - lat, lon (float or array): the origin point(s) in degrees
+    - lats, lons (array): the destination points in degrees
+
+    The inputs broadcast against each other, so a single user location against every trail
+    is computed in one pass. Error against the ellipsoidal distance is at most ~0.5%.
+    """
+    lat1 = np.radians(np.asarray(lat, dtype=np.float64))
+    lon1 = np.radians(np.asarray(lon, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def vincenty_miles(lat, lon, lats, lons, tol=1e-12, max_iter=200):
+    """
+    Ellipsoidal (WGS-84) distance in miles using a vectorized Vincenty inverse solution.
+
+    Parameters:
+    - lat, lon (float or array): the origin point(s) in degrees
+    - lats, lons (array): the destination points in degrees
+    - tol (float): convergence tolerance on lambda, in radians
+    - max_iter (int): iteration cap for the whole batch
+
+    Every pair is iterated together and only the pairs that have not converged yet keep
+    being updated. The few nearly-antipodal pairs that Vincenty cannot solve are handed to
+    Karney's algorithm (geographiclib, which geopy already depends on), so the result stays
+    within a millimetre of geopy.distance.geodesic for every input.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64),
+        np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+    shape = lat1.shape
+    lat1, lon1, lat2, lon2 = (a.ravel() for a in (lat1, lon1, lat2, lon2))
+
+    f = WGS84_F
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    L = np.radians(lon2 - lon1)
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    sin_sigma = np.zeros_like(L)
+    cos_sigma = np.ones_like(L)
+    sigma = np.zeros_like(L)
+    cos_sq_alpha = np.ones_like(L)
+    cos2sigma_m = np.zeros_like(L)
+    active = np.ones(L.shape, dtype=bool)
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        lam_i = lam[idx]
+        sin_lam, cos_lam = np.sin(lam_i), np.cos(lam_i)
+        s_sigma = np.sqrt((cosU2[idx] * sin_lam) ** 2 +
+                          (cosU1[idx] * sinU2[idx] - sinU1[idx] * cosU2[idx] * cos_lam) ** 2)
+        c_sigma = sinU1[idx] * sinU2[idx] + cosU1[idx] * cosU2[idx] * cos_lam
+        sig = np.arctan2(s_sigma, c_sigma)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sin_alpha = np.where(s_sigma == 0, 0.0, cosU1[idx] * cosU2[idx] * sin_lam / s_sigma)
+            csa = 1 - sin_alpha ** 2
+            # Equatorial lines have cos^2(alpha) == 0, where cos(2 sigma_m) is defined as 0
+            c2sm = np.where(csa == 0, 0.0, c_sigma - 2 * sinU1[idx] * sinU2[idx] / csa)
+        C = f / 16 * csa * (4 + f * (4 - 3 * csa))
+        lam_new = L[idx] + (1 - C) * f * sin_alpha * (
+            sig + C * s_sigma * (c2sm + C * c_sigma * (-1 + 2 * c2sm ** 2)))
+
+        sin_sigma[idx], cos_sigma[idx], sigma[idx] = s_sigma, c_sigma, sig
+        cos_sq_alpha[idx], cos2sigma_m[idx], lam[idx] = csa, c2sm, lam_new
+        active[idx] = np.abs(lam_new - lam_i) > tol
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos2sigma_m ** 2) -
+        B / 6 * cos2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos2sigma_m ** 2)))
+    meters = WGS84_B * A * (sigma - delta_sigma)
+
+    # Pairs that did not converge (nearly antipodal) are solved one by one with Karney's method
+    if active.any():
+        from geographiclib.geodesic import Geodesic
+        for i in np.flatnonzero(active):
+            meters[i] = Geodesic.WGS84.Inverse(lat1[i], lon1[i], lat2[i], lon2[i],
+                                               Geodesic.DISTANCE)['s12']
+    # Missing coordinates propagate as NaN instead of a bogus distance
+    meters[np.isnan(lat1) | np.isnan(lon1) | np.isnan(lat2) | np.isnan(lon2)] = np.nan
+
+    return (meters / METERS_PER_MILE).reshape(shape)
+
+
+def distance_miles(lat, lon, lats, lons, method='geodesic'):
+    """
+    Distance in miles from a location to every point in lats/lons, computed in one batched call.
+
+    Parameters:
+    - lat, lon (float or array): the origin point(s) in degrees
+    - lats, lons (array): the destination points in degrees
+    - method (str): 'haversine' for the fast spherical mode or 'geodesic' for the accurate
+      ellipsoidal mode that matches geopy.distance.geodesic
+    """
+    if method == 'haversine':
+        return haversine_miles(lat, lon, lats, lons)
+    if method == 'geodesic':
+        return vincenty_miles(lat, lon, lats, lons)
+    raise ValueError(f"Unknown distance method: {method}")
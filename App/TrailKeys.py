@@ -0,0 +1,16 @@
+import pandas as pd
+
+
+# Columns that identify a trail across catalog versions
+KEY_COLUMNS = ['site_name', 'Name']
+
+
+def trail_keys(df):
+    """
+    Returns one uint64 key per trail of df: its KEY_COLUMNS plus its occurrence number among
+    the trails sharing them, so trails with the same site and name are still told apart.
+    Used to match trails across versions of the recommendation and difficulty catalogs.
+    """
+    keys = df[KEY_COLUMNS].copy()
+    keys['occurrence'] = df.groupby(KEY_COLUMNS, dropna=False, sort=False).cumcount()
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
@@ -0,0 +1,274 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SAMPLE_RATE = float(os.environ.get('TRAILS_METRICS_SAMPLE_RATE', '1.0'))
+logger = logging.getLogger('trails.metrics')
+
+# The trace of the request being handled in this thread or task, None when it is not sampled
+_current_trace = contextvars.ContextVar('trails_trace', default=None)
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum, as in a Prometheus histogram."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def add(self, counts, total, count):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.sum += total
+        self.count += count
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = self.trace['stages']
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Request:
+    __slots__ = ('metrics', 'name', 'trace', 'token', 'start')
+
+    def __init__(self, metrics, name, sampled):
+        self.metrics = metrics
+        self.name = name
+        self.trace = {'request': name, 'stages': {}} if sampled else None
+
+    def __enter__(self):
+        self.token = _current_trace.set(self.trace)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _current_trace.reset(self.token)
+        outcome = 'ok' if exc_type is None else 'error'
+        self.metrics.observe('request_seconds', seconds, request=self.name)
+        self.metrics.increment('requests_total', request=self.name, outcome=outcome)
+        if self.trace is not None:
+            self.metrics._record_trace(self.trace, seconds, outcome)
+        return False
+
+
+class TrailMetrics:
+    """
+    In-process instrumentation of the recommenders: timing spans, counters and histograms.
+
+    A request (metrics.request('recommend')) always counts and times the request itself. Only
+    a sample of requests (sample_rate) is traced: inside a traced request every
+    metrics.span('stage') adds its time to the stage_seconds histogram and to the request's
+    JSON log line (logger 'trails.metrics'); outside one, span returns a shared no-op, so an
+    unsampled request pays for one random draw and a few attribute lookups per stage.
+
+    Method:
+    request: context manager around one request, deciding whether it is traced
+    span: context manager timing one stage of the current request
+    increment: adds to a counter (cache hits, geocoder fallbacks, empty results, ...)
+    observe: records a value in a histogram
+    drain: returns what was recorded since the last drain and resets it (in a worker process)
+    merge: adds what drain returned (in the process that exports the metrics)
+    prometheus: every metric in the Prometheus text exposition format
+    snapshot: every metric as a JSON-serializable dictionary
+    serve: exports prometheus and snapshot over HTTP from a background thread
+
+    Metrics live in the process that records them. A process pool ships each worker's drain
+    back with every result and merges it into the parent (TrailService), so the parent's
+    /metrics covers the stages, caches and geocoder of every worker.
+    """
+    def __init__(self, sample_rate=SAMPLE_RATE, buckets=DEFAULT_BUCKETS, namespace='trails'):
+        """
+        Parameters:
+        - sample_rate (float): fraction of requests traced stage by stage, from 0 to 1
+        - buckets (tuple): upper bounds of the histogram buckets, in seconds
+        - namespace (str): prefix of the exported metric names
+        """
+        self.sample_rate = sample_rate
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def request(self, name):
+        return _Request(self, name, self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def span(self, name):
+        trace = _current_trace.get()
+        return _NO_SPAN if trace is None else _Span(trace, name)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def _record_trace(self, trace, seconds, outcome):
+        for stage, stage_seconds in trace['stages'].items():
+            self.observe('stage_seconds', stage_seconds, request=trace['request'], stage=stage)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'request': trace['request'], 'outcome': outcome, 'seconds': round(seconds, 6),
+                                    'stages': {k: round(v, 6) for k, v in trace['stages'].items()}}))
+
+    def drain(self):
+        with self._lock:
+            delta = {'counters': self._counters,
+                     'histograms': {key: (h.counts, h.sum, h.count) for key, h in self._histograms.items()}}
+            self._counters = {}
+            self._histograms = {}
+        return delta
+
+    def merge(self, delta):
+        with self._lock:
+            for key, value in delta['counters'].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total, count) in delta['histograms'].items():
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.buckets)
+                histogram.add(counts, total, count)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': h.count, 'sum': h.sum,
+                           'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], _cumulative(h.counts)))}
+                          for (name, labels), h in sorted(self._histograms.items())]
+        return {'counters': counters, 'histograms': histograms}
+
+    def prometheus(self):
+        lines = []
+        snapshot = self.snapshot()
+        typed = set()
+        for counter in snapshot['counters']:
+            name = f"{self.namespace}_{counter['name']}"
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot['histograms']:
+            name = f"{self.namespace}_{histogram['name']}"
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            for bound, count in histogram['buckets'].items():
+                lines.append(f"{name}_bucket{_labels(dict(histogram['labels'], le=bound))} {count}")
+            lines.append(f"{name}_sum{_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves GET /metrics (Prometheus text) and /metrics.json from a daemon thread, for
+        processes without an HTTP server of their own (the Streamlit app); returns the server.
+        """
+        # http.server is only imported by the processes that export this way
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body, content_type = metrics.prometheus(), 'text/plain; version=0.0.4'
+                elif path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='trails-metrics', daemon=True).start()
+        return server
+
+
+def _cumulative(counts):
+    total, result = 0, []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_metrics():
+    """Returns the process-wide TrailMetrics shared by the recommenders, the geocoder and the app."""
+    global _default_metrics
+    if _default_metrics is None:
+        with _default_lock:
+            if _default_metrics is None:
+                _default_metrics = TrailMetrics()
+    return _default_metrics
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def top_k(scores, k, mask=None, full_sort=False):
+    """
+    Selects the k highest scores from a score vector without sorting the whole vector.
+
+    Parameters:
+    - scores (array): one score per trail
+    - k (int): number of results to keep
+    - mask (bool array): optional filter (e.g. the radius mask), applied before selecting
+    - full_sort (bool): rank every eligible trail with a full sort instead of a partial selection
+
+    Returns (positions, scores) for at most k trails, best first. Equal scores are always
+    ordered by position, which is the same order the previous stable Python sort produced,
+    so results are reproducible from run to run.
+    """
+    scores = np.asarray(scores).ravel()
+    if mask is None:
+        positions = np.arange(len(scores))
+        values = scores
+    else:
+        positions = np.flatnonzero(mask)
+        values = scores[positions]
+    k = min(k, len(values))
+    if k <= 0:
+        return positions[:0], values[:0]
+
+    if full_sort or k == len(values):
+        chosen = np.arange(len(values))
+    else:
+        # argpartition finds the k-th best score in linear time; everything strictly better is
+        # kept, and the remaining slots go to the tied trails with the lowest positions
+        threshold = values[np.argpartition(-values, k - 1)[k - 1]]
+        better = np.flatnonzero(values > threshold)
+        tied = np.flatnonzero(values == threshold)[:k - len(better)]
+        chosen = np.concatenate([better, tied])
+
+    order = chosen[np.lexsort((chosen, -values[chosen]))][:k]
+    return positions[order], values[order]
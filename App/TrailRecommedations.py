@@ -1,11 +1,51 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import OneHotEncoder
-from geopy.geocoders import Nominatim
-from geopy import distance
-from geopy.distance import geodesic
-import requests
+from TrailAmenityIndex import TrailAmenityIndex
+from TrailDistance import distance_miles
+from TrailFeatures import TrailFeatures
+from TrailKeys import trail_keys
+from TrailRanking import top_k
+from RecommendationCache import RecommendationCache
+from TrailMetrics import get_metrics
+from TrailSpatialIndex import TrailSpatialIndex, geohash_cell
+from TrailTextStore import TrailTextStore
+from ZipGeocoder import get_geocoder
+
+
+# Number of trails shown on the Recommendation page
+RESULT_SIZE = 20
+BIN_LABELS = ['low', 'medium', 'high']
+ENCODED_COLUMNS = ['Shape_Leng', 'Elevation_Gain', 'type_factor']
+# Bin edges of the catalog: trail length in meters and elevation gain in meters
+TRAIL_LENGTH_BINS = [-np.inf, 1600, 4828, np.inf]
+TRAIL_ELEVATION_BINS = [-np.inf, 30, 120, np.inf]
+# Site metadata joined from Webscraped_NYS.csv: long text kept in a TrailTextStore, outside the
+# catalog DataFrame, and only decoded for the result rows
+TEXT_COLUMNS = ['address', 'phone', 'description', 'amenities']
+TYPE_FACTORS = ['easy', 'medium', 'hard']
+# Cut points for the user's answers: trail length in miles and elevation gain in meters
+USER_LENGTH_BINS = [1, 3]
+USER_ELEVATION_BINS = [30, 120]
+
+
+def compact_frame(df):
+    """
+    Returns the catalog columns in compact dtypes: float32 measures and coordinates, the
+    narrowest integer type, and category codes for text that repeats (units, sites, websites).
+    """
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series.dtype):
+            pass
+        elif pd.api.types.is_float_dtype(series.dtype):
+            series = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            series = pd.to_numeric(series, downcast='integer') if series.dtype.itemsize > 1 else series
+        elif series.nunique() <= len(series) // 2:
+            series = series.astype('category')
+        columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
 
 
 class TrailRecommendation:
@@ -17,106 +57,308 @@ class TrailRecommendation:
         
     Method:
     preprocess_data: a function to encode the trail data
-    get_lat_long: a helper function that finds the latitude and longitude based on zip code
+    encode_rows: encodes raw trails with the frozen bins and vocabulary (used by incremental refreshes)
+    encode_users: a function that encodes user inputs into normalized feature vectors
     get_recommendation: main function that generates recommedations to the user based on their input and returns top 20 matching trails.
+        The optional user_input['amenities'] (list) and user_input['keywords'] (str) keep only the trails
+        whose site has every amenity and every keyword (TrailAmenityIndex).
+    get_recommendations_batch: scores many users with one matrix multiply and returns their top 20 trails.
     """
-    def __init__(self, df):
+    def __init__(self, df, geocoder=None, metrics=None):
         """
         Initializes a TrailRecommendation object with a list of trail objects.
+        The geocoder and metrics default to the process-wide ZipGeocoder and TrailMetrics
+        shared by both recommenders.
         
         """
         self.df = df
+        self.geocoder = geocoder if geocoder is not None else get_geocoder()
+        self.metrics = metrics if metrics is not None else get_metrics()
+        # Set when the catalog comes from a CatalogStore version
+        self.catalog_version = None
+        self.result_cache = RecommendationCache()
         self.categorical_features = ['Foot', 'Horse', 'Bike', 'Snowmb', 'Accessible']
         self.numerical_features = ['Shape_Leng', 'Elevation_Gain']
         self.type_factor_mapping = {'easy': 0, 'medium': 0.1, 'hard': 0.3}
         
     def preprocess_data(self):
-        # One-hot encode categorical features
-        for feature in self.categorical_features:
-            self.df[feature] = self.df[feature].map({'Y': 1, 'N': 0})
-        self.df['type_factor'] = self.df['type_factor'].map({0.0: 'easy', 0.1: 'medium', 0.3: 'hard'})
-        #Storing the trail length and elevation length in units of meter and feet respectively
-        self.df['Elevation Gain(feet)'] = round(self.df['Elevation_Gain']*3.28)
-        self.df['Length(miles)'] = round(self.df['Shape_Leng']*0.000621, 2)
-        # Define the bins for the classes
-        elevation_bins = [self.df['Elevation_Gain'].min(), 30, 120, self.df['Elevation_Gain'].max()]
-        length_bins = [self.df['Shape_Leng'].min(), 1600, 4828, self.df['Shape_Leng'].max()]
-        self.df['Shape_Leng'] = pd.cut(self.df['Shape_Leng'], length_bins, labels=['low', 'medium', 'high'], include_lowest=True)
-        self.df['Elevation_Gain'] = pd.cut(self.df['Elevation_Gain'], elevation_bins, labels=['low', 'medium', 'high'], include_lowest=True)
+        # Encode a copy, so the caller's DataFrame is left alone and the catalog is only
+        # published once it is complete; after that it is never written to again
+        raw = self.df
+        binned = self._bin(raw)
+        # The one-hot vocabulary is learned here once and then frozen, so trails added later
+        # by an incremental refresh are encoded exactly like this full build encoded them.
+        # sklearn is only imported by a full build: workers that map a prebuilt catalog never load it
+        from sklearn.preprocessing import OneHotEncoder
         enc = OneHotEncoder()
-        encoded_data = enc.fit_transform(self.df[['Shape_Leng', 'Elevation_Gain', 'type_factor']])
-        encoded_features = enc.get_feature_names_out(['Shape_Leng', 'Elevation_Gain', 'type_factor'])
-        self.encoded_features = encoded_features
-        encoded_df = pd.DataFrame(encoded_data.toarray(), columns=encoded_features)
-        self.df = pd.concat([self.df, encoded_df], axis=1)
-        #print(self.df['Shape_Leng'])
-        print(self.df['Length(miles)'])
-        print("Hello")
-            
+        enc.fit(binned[ENCODED_COLUMNS])
+        self.encoder_categories = {column: list(categories) for column, categories in zip(ENCODED_COLUMNS, enc.categories_)}
+        self.encoded_features = enc.get_feature_names_out(ENCODED_COLUMNS)
+        self.feature_columns = self.categorical_features + list(self.encoded_features)
+        df, features = self._one_hot(binned)
+        row_keys, row_hashes = self.fingerprint(raw)
+        # Grid index over the trail coordinates so radius queries only touch nearby trails; it
+        # keeps float64 coordinates for exact distances, the DataFrame only float32 ones
+        spatial_index = TrailSpatialIndex(raw['latitude'].values, raw['longitude'].values)
+        self.set_catalog(compact_frame(df), features, spatial_index, row_keys, row_hashes,
+                         text_store=TrailTextStore.from_frame(raw, TEXT_COLUMNS))
         return self.df
-   
-    def get_lat_long(self, zipcode):
-        url = "https://nominatim.openstreetmap.org/search.php"
-        params = {"q": zipcode, "format": "jsonv2", "countrycodes": "US"}
-
-        try:
-            response = requests.get(url, params=params)
-            response_json = response.json()
-            if len(response_json) > 0:
-                latitude = response_json[0]['lat']
-                longitude = response_json[0]['lon']
-                return latitude, longitude
-            else:
-                return None, None
-        except:
-            return None, None
 
+    def _bin(self, raw):
+        # The long site text goes to the text store, not into the catalog
+        df = raw.drop(columns=[column for column in TEXT_COLUMNS if column in raw.columns])
+        # Mode flags as 0/1 bytes; a missing flag counts as N
+        for feature in self.categorical_features:
+            df[feature] = df[feature].map({'Y': 1, 'N': 0}).fillna(0).astype(np.uint8)
+        df['type_factor'] = pd.Categorical(df['type_factor'].map({0.0: 'easy', 0.1: 'medium', 0.3: 'hard'}),
+                                           categories=TYPE_FACTORS)
+        #Storing the trail length and elevation length in units of meter and feet respectively
+        df['Elevation Gain(feet)'] = round(df['Elevation_Gain']*3.28).astype(np.float32)
+        df['Length(miles)'] = round(df['Shape_Leng']*0.000621, 2).astype(np.float32)
+        # Fixed bin edges: the outer edges used to be the catalog's min()/max(), which made one
+        # new trail able to move them; open-ended edges bin every existing trail the same way
+        df['Shape_Leng'] = pd.cut(df['Shape_Leng'], TRAIL_LENGTH_BINS, labels=BIN_LABELS, include_lowest=True)
+        df['Elevation_Gain'] = pd.cut(df['Elevation_Gain'], TRAIL_ELEVATION_BINS, labels=BIN_LABELS, include_lowest=True)
+        return df
+
+    def _one_hot(self, binned):
+        """
+        Returns (df, TrailFeatures): the feature columns are the mode flags followed by the one-hot
+        columns of the frozen vocabulary (what OneHotEncoder(handle_unknown='ignore') would
+        produce), in feature_columns order. Every row is 0/1, so the features are bit-packed into
+        one mask per trail instead of being stored as a float matrix or DataFrame columns.
+        """
+        binary = np.zeros((len(binned), len(self.feature_columns)), dtype=np.uint8)
+        for position, feature in enumerate(self.categorical_features):
+            binary[:, position] = binned[feature].to_numpy() != 0
+        position = len(self.categorical_features)
+        for column in ENCODED_COLUMNS:
+            values = binned[column].astype(object).to_numpy()
+            for category in self.encoder_categories[column]:
+                if isinstance(category, float) and np.isnan(category):
+                    binary[:, position] = pd.isna(values)
+                else:
+                    binary[:, position] = values == category
+                position += 1
+        return binned, TrailFeatures.from_binary(binary)
+
+    def encode_rows(self, raw):
+        """Encodes raw catalog rows with the frozen bins and vocabulary; returns (df, TrailFeatures)."""
+        return self._one_hot(self._bin(raw))
+
+    @staticmethod
+    def fingerprint(raw):
+        """
+        Returns (row_keys, row_hashes) as uint64 arrays. The key identifies a trail across catalog
+        versions (TrailKeys.trail_keys) and the hash covers every raw column, so a changed trail
+        keeps its key but gets a new hash.
+        """
+        row_keys = trail_keys(raw)
+        row_hashes = pd.util.hash_pandas_object(raw, index=False).to_numpy()
+        return row_keys, row_hashes
+
+    def set_catalog(self, df, feature_matrix, spatial_index, row_keys, row_hashes, catalog_version=None, text_store=None):
+        """Publishes a fully built catalog; none of its arrays is written to afterwards."""
+        for array in (row_keys, row_hashes):
+            if array.flags.writeable:
+                array.setflags(write=False)
+        self.feature_matrix = feature_matrix
+        self.text_store = text_store if text_store is not None else TrailTextStore({}, n_rows=len(df))
+        self.spatial_index = spatial_index
+        self.row_keys = row_keys
+        self.row_hashes = row_hashes
+        self.catalog_version = catalog_version
+        self.df = df
+        # Built once per catalog, so a filtered query never scans the site text
+        self.amenity_index = self._build_amenity_index()
+        # Results cached for the previous catalog are no longer valid
+        self.result_cache.invalidate()
         
+    def _build_amenity_index(self):
+        # The site name is a catalog column, amenities and description are already dictionary
+        # encoded by the text store: the index is built from their codes
+        codes, values = pd.factorize(self.df['site_name'])
+        columns = [(list(values), codes)]
+        for name in ('amenities', 'description'):
+            if name in self.text_store.columns:
+                columns.append(self.text_store.values(name))
+            else:
+                columns.append(([], np.full(len(self.df), -1)))
+        return TrailAmenityIndex.from_columns(columns)
+
+    def encode_users(self, user_inputs):
+        """
+        Encodes user inputs into an (n_users, n_features) float32 matrix with L2-normalized rows,
+        in the same column order as the trail feature matrix.
+
+        The user's trail length (miles) and elevation gain (m) are binned with the same cut points
+        pd.cut used on a one-row DataFrame, and a bin or type_factor value that never appears in
+        the catalog simply sets no column.
+        """
+        column_position = {name: i for i, name in enumerate(self.feature_columns)}
+        users = np.zeros((len(user_inputs), len(self.feature_columns)), dtype=np.float32)
+        for row, user_input in enumerate(user_inputs):
+            for feature in self.categorical_features:
+                if user_input[feature] == 'Y':
+                    users[row, column_position[feature]] = 1
+            length_bin = BIN_LABELS[np.digitize(user_input['Trail_Leng'], USER_LENGTH_BINS, right=True)]
+            elevation_bin = BIN_LABELS[np.digitize(user_input['Elevation_Gain'], USER_ELEVATION_BINS, right=True)]
+            for column in (f'Shape_Leng_{length_bin}', f'Elevation_Gain_{elevation_bin}', f"type_factor_{user_input['type_factor']}"):
+                if column in column_position:
+                    users[row, column_position[column]] = 1
+        norms = np.linalg.norm(users, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return users / norms
+
     def get_recommendations(self, user_input):
-        # Preprocess user input
-        user_df = pd.DataFrame(user_input, index=[0])
-        for feature in self.categorical_features:
-            user_df[feature] = user_df[feature].map({'Y': 1, 'N': 0})
+        with self.metrics.request('recommend'):
+            return self._get_recommendations(user_input)
+
+    def _get_recommendations(self, user_input):
+        metrics = self.metrics
         # Calculate distance between user's zipcode and each trail
-        user_lat, user_long = self.get_lat_long(user_input['Zip'])
-        
-        user_df['Shape_Leng'] = pd.cut(user_df['Trail_Leng'], bins=[-np.inf, 1, 3, np.inf], labels=['low', 'medium', 'high'])
-        user_df['Elevation_Gain'] = pd.cut(user_df['Elevation_Gain'], bins=[-np.inf, 30, 120, np.inf], labels=['low', 'medium', 'high'])
-        user_df = pd.get_dummies(user_df, columns=['Shape_Leng', 'Elevation_Gain', 'type_factor'])
-        # Add missing type_factor columns
-        if 'type_factor_easy' not in user_df:
-            user_df['type_factor_easy'] = 0
-        if 'type_factor_medium' not in user_df:
-            user_df['type_factor_medium'] = 0
-        if 'type_factor_hard' not in user_df:
-            user_df['type_factor_hard'] = 0
-        dist=user_df['radius'].iloc[0]
-        
-        # Preprocess trail data
-        #self.preprocess_data()
-        # Filter trails by zip code
-        self.df['Distance From You(miles)'] = self.df.apply(lambda row: geodesic((user_lat, user_long), (row['latitude'], row['longitude'])).miles, axis=1)
-        #print(self.df['distance'])
-        # Calculate cosine similarity between user input and trails
-        X = self.df[self.categorical_features + list(self.encoded_features)]
-        y = self.df['Name']
-        user_X = user_df[X.columns]
-        cosine_sim = cosine_similarity(X, user_X)
-        sim_scores = list(enumerate(cosine_sim))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        #print(sim_scores)
-        trail_indices = [i[0] for i in sim_scores]
-        #print(trail_indices)
-        h=self.df.loc[trail_indices]
-        #print(h)
-        # filter the DataFrame by the 'B' column and show the top 20 rows
+        with metrics.span('geocode'):
+            user_lat, user_long = self.geocoder.locate(user_input['Zip'])
+        with metrics.span('encode'):
+            user_vector = self.encode_users([user_input])[0]
+        dist = user_input['radius']
+        amenities, keywords = user_input.get('amenities'), user_input.get('keywords')
+        with metrics.span('amenity_filter'):
+            group_ok = self.amenity_index.group_mask(amenities, keywords)
+
+        # Queries that bin to the same answers and filters from the same geohash cell share one ranked pool
+        key = self.result_cache.make_key(self.catalog_version, user_vector, dist, user_lat, user_long,
+                                         self.amenity_index.filter_key(amenities, keywords))
+        pool = self.result_cache.get(key)
+        metrics.increment('result_cache_total', result='miss' if pool is None else 'hit')
+        if pool is None:
+            pool = self._ranked_pool(user_vector, dist, key[3], group_ok)
+            self.result_cache.put(key, pool)
+        rows, scores, complete = pool
+        with metrics.span('distance'):
+            distances = distance_miles(user_lat, user_long, self.spatial_index.latitudes[rows], self.spatial_index.longitudes[rows])
         if dist != 0:
-            filtered_df = h[h['Distance From You(miles)'] <= dist].head(20)
+            keep = distances <= dist
+            if keep.sum() < RESULT_SIZE and not complete:
+                # Trails beyond the pool could still qualify from this exact location
+                self.result_cache.record_fallback()
+                metrics.increment('result_cache_total', result='fallback')
+                return self._recommend(user_vector, user_lat, user_long, dist, group_ok=group_ok)
+            rows, scores, distances = rows[keep], scores[keep], distances[keep]
+        return self._result_frame(rows[:RESULT_SIZE], scores[:RESULT_SIZE], distances[:RESULT_SIZE])
+
+    def _ranked_pool(self, user_vector, dist, geohash, group_ok=None):
+        """
+        Ranked (rows, scores, complete) that answer the query for any location in the geohash cell.
+        group_ok is the TrailAmenityIndex.group_mask of the query's filters, None when unfiltered.
+
+        Without a radius it is simply the top 20. With one, it is the best pool_size trails within
+        radius + cell reach of the cell center: by the triangle inequality this holds every trail
+        within the radius of any point of the cell, in rank order, so filtering it by the exact
+        distance gives the same page as a direct query unless it runs out (complete is False and
+        fewer than 20 survive), in which case the caller falls back to a direct query.
+        """
+        metrics = self.metrics
+        if dist == 0:
+            with metrics.span('similarity'):
+                all_scores = self.feature_matrix @ user_vector
+            with metrics.span('ranking'):
+                mask = None if group_ok is None else group_ok[self.amenity_index.groups]
+                rows, scores = top_k(all_scores, RESULT_SIZE, mask=mask)
+            complete = True
         else:
-            filtered_df = h.head(20)
-        print(filtered_df)
-        #return y.iloc[trail_indices]
-        return filtered_df
+            center_lat, center_long, reach = geohash_cell(geohash)
+            with metrics.span('radius_query'):
+                candidates, _ = self.spatial_index.query_radius(center_lat, center_long, dist + reach)
+                if group_ok is not None:
+                    candidates = candidates[group_ok[self.amenity_index.groups[candidates]]]
+            with metrics.span('similarity'):
+                candidate_scores = self.feature_matrix[candidates] @ user_vector
+            with metrics.span('ranking'):
+                top, scores = top_k(candidate_scores, self.result_cache.pool_size)
+            rows = candidates[top]
+            complete = len(candidates) <= self.result_cache.pool_size
+        rows.setflags(write=False)
+        scores.setflags(write=False)
+        return rows, scores, complete
+
+    def get_recommendations_batch(self, user_inputs, batch_size=256, locations=None):
+        """
+        Recommendations for many users at once, returned in the same order as user_inputs.
+
+        Users are encoded into one matrix and scored against every trail with a single matrix
+        multiply per batch of batch_size users (batching only bounds the n_trails x batch_size
+        score matrix in memory). locations are the users' (lat, lon) when the caller already
+        geocoded their ZIP codes; otherwise they are looked up here.
+        """
+        metrics = self.metrics
+        results = []
+        with metrics.request('recommend_batch'):
+            for start in range(0, len(user_inputs), batch_size):
+                batch = user_inputs[start:start + batch_size]
+                if locations is None:
+                    with metrics.span('geocode'):
+                        batch_locations = [self.geocoder.locate(user_input['Zip']) for user_input in batch]
+                else:
+                    batch_locations = locations[start:start + batch_size]
+                with metrics.span('encode'):
+                    users = self.encode_users(batch)
+                with metrics.span('similarity'):
+                    scores = self.feature_matrix @ users.T
+                for j, user_input in enumerate(batch):
+                    user_lat, user_long = batch_locations[j]
+                    group_ok = self.amenity_index.group_mask(user_input.get('amenities'), user_input.get('keywords'))
+                    results.append(self._recommend(users[j], user_lat, user_long, user_input['radius'], scores[:, j],
+                                                   group_ok))
+        return results
+
+    def _recommend(self, user_vector, user_lat, user_long, dist, scores=None, group_ok=None):
+        metrics = self.metrics
+        # Only the trails inside the radius are scored; with no radius every trail is a candidate
+        if dist != 0:
+            with metrics.span('radius_query'):
+                candidates, distances = self.spatial_index.query_radius(user_lat, user_long, dist)
+        else:
+            candidates, distances = np.arange(len(self.df)), None
+        if group_ok is not None:
+            # The amenity and keyword filter, one gather over the candidates
+            keep = group_ok[self.amenity_index.groups[candidates]]
+            candidates = candidates[keep]
+            distances = None if distances is None else distances[keep]
+        filtered = dist != 0 or group_ok is not None
+        if len(candidates) == 0:
+            return self._result_frame(candidates, np.empty(0, dtype=np.float32), np.empty(0))
+
+        # Cosine similarity is a dot product, since trail rows and the user vector are normalized
+        with metrics.span('similarity'):
+            if scores is not None:
+                candidate_scores = scores[candidates]
+            elif not filtered:
+                candidate_scores = self.feature_matrix @ user_vector
+            else:
+                candidate_scores = self.feature_matrix[candidates] @ user_vector
+        # Partial selection of the top 20 rows instead of sorting every candidate
+        with metrics.span('ranking'):
+            top, top_scores = top_k(candidate_scores, RESULT_SIZE)
+        rows = candidates[top]
+        if dist == 0:
+            with metrics.span('distance'):
+                distances = distance_miles(user_lat, user_long, self.spatial_index.latitudes[rows], self.spatial_index.longitudes[rows])
+        else:
+            distances = distances[top]
+        return self._result_frame(rows, top_scores, distances)
+
+    def _result_frame(self, rows, scores, distances):
+        if len(rows) == 0:
+            self.metrics.increment('empty_results_total', recommender='recommend')
+        with self.metrics.span('result_frame'):
+            filtered_df = self.df.iloc[rows]
+            # Only the result rows of the long text columns are decoded; the added columns are
+            # joined in one concat, which costs half as much as assigning them one by one
+            extra = self.text_store.take_all(rows)
+            extra['Similarity'] = scores
+            extra['Distance From You(miles)'] = distances
+            return pd.concat([filtered_df, pd.DataFrame(extra, index=filtered_df.index)], axis=1)
     
 if __name__ == "__main__":
     # load data
@@ -0,0 +1,116 @@
+import html
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# Display format of the numeric columns; other numbers are shown with 2 decimals
+NUMBER_FORMATS = {
+    'Elevation Gain(feet)': '{:.0f}',
+    'Length(miles)': '{:.2f}',
+    'Distance From You(miles)': '{:.2f}',
+    'Similarity': '{:.3f}',
+}
+LINK_COLUMN = 'Site Name'
+LINK_SCHEMES = ('http://', 'https://')
+
+
+def site_link(site_name, website):
+    """The escaped HTML anchor of a site; plain escaped text when the website is not an http(s) URL."""
+    name = html.escape(site_name)
+    if not website.lower().startswith(LINK_SCHEMES):
+        return name
+    return f'<a href="{html.escape(website)}">{name}</a>'
+
+
+def _text(values):
+    return ['' if value is None or value != value else str(value) for value in values]
+
+
+class TrailRender:
+    """
+    Renders the result tables of one catalog as HTML (Streamlit pages) or compact JSON (service).
+
+    Everything that only depends on the catalog is computed once, when the renderer is built:
+    the site links are escaped once per distinct (site_name, website) pair and each trail keeps
+    the code of its pair, and the display unit columns become float arrays. A request then only
+    formats its k result rows: the rows are found in the catalog by index, their cells are
+    gathered from those arrays and joined into a precompiled row template, with no per-row
+    DataFrame.apply and no DataFrame.to_html. Every text cell is HTML-escaped.
+
+    Method:
+    positions: catalog row positions of a result frame
+    html: the result rows as an HTML table
+    json: the result rows as a JSON array of objects
+    """
+    def __init__(self, catalog, columns, unit_columns=None, table_attributes='border="1" class="dataframe"'):
+        """
+        Parameters:
+        - catalog (DataFrame): the catalog the results are taken from; its index must be unique
+        - columns (list): columns of the HTML table; 'Site Name' is the site link, the others
+          are catalog columns, unit columns, or per request columns of the result frame
+          (Distance From You(miles), Similarity)
+        - unit_columns (dict): display columns derived from the catalog, name -> (source column, factor)
+        - table_attributes (str): attributes of the <table> tag
+        """
+        self.catalog_index = catalog.index
+        self.columns = list(columns)
+        # One escaped link per distinct site, and the site code of every trail
+        names = catalog['site_name'].astype(object).fillna('').astype(str)
+        websites = catalog['website'].astype(object).fillna('').astype(str)
+        self.site_codes, sites = pd.MultiIndex.from_arrays([names, websites]).factorize()
+        self.site_links = np.array([site_link(name, website) for name, website in sites], dtype=object)
+        self.values = {}
+        for name, (source, factor) in (unit_columns or {}).items():
+            self.values[name] = catalog[source].to_numpy(dtype=np.float64) * factor
+        self.catalog = catalog
+        header = ''.join(f'<th>{html.escape(name)}</th>' for name in self.columns)
+        self._head = f'<table {table_attributes}><thead><tr style="text-align: right;">{header}</tr></thead><tbody>'
+        self._row = '<tr>' + '<td>{}</td>' * len(self.columns) + '</tr>'
+
+    def positions(self, result):
+        return self.catalog_index.get_indexer(result.index)
+
+    def _column(self, name, result, rows):
+        # Per request columns come from the result frame, the rest from the catalog arrays,
+        # which are taken out of the catalog the first time a column is shown
+        values = self.values.get(name)
+        if values is None:
+            if name not in self.catalog.columns:
+                return result[name].to_numpy()
+            values = self.values[name] = self.catalog[name].to_numpy()
+        return values[rows]
+
+    def _cells(self, name, result, rows):
+        if name == LINK_COLUMN:
+            return self.site_links[self.site_codes[rows]].tolist()
+        values = self._column(name, result, rows)
+        if values.dtype.kind in 'fiu':
+            number = NUMBER_FORMATS.get(name, '{:.2f}')
+            return ['' if value != value else number.format(value) for value in values.tolist()]
+        return [html.escape(value) for value in _text(values.tolist())]
+
+    def html(self, result):
+        rows = self.positions(result)
+        cells = [self._cells(name, result, rows) for name in self.columns]
+        row = self._row.format
+        return self._head + ''.join([row(*values) for values in zip(*cells)]) + '</tbody></table>'
+
+    def json(self, result, columns):
+        """
+        A JSON array with one object per result row and the given columns; missing values are
+        null. Like the tile JSON, it is safe to embed in a <script> block.
+        """
+        rows = self.positions(result)
+        values = []
+        for name in columns:
+            column = self._column(name, result, rows)
+            if column.dtype.kind == 'f':
+                values.append([None if value != value else round(value, 6) for value in column.tolist()])
+            elif column.dtype.kind in 'iub':
+                values.append(column.tolist())
+            else:
+                values.append([None if value is None or value != value else str(value) for value in column.tolist()])
+        records = [dict(zip(columns, record)) for record in zip(*values)]
+        return json.dumps(records, separators=(',', ':'), ensure_ascii=False).replace('<', '\\u003c')
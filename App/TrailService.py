@@ -0,0 +1,378 @@
+"""
+Headless JSON API over the recommendation core (TrailCore.py), for clients other than the
+Streamlit app.
+
+    GET  /health                   {"status": "ok", "catalog_version": ..., "trails": ...}
+    POST /recommendations          {"zip": "13210", "exploration_mode": "Walk", "elevation_gain": 80,
+                                    "trail_length": 3, "experience": "Beginner", "radius": 10,
+                                    "amenities": ["Picnic Area"], "keywords": "waterfall"}
+    POST /recommendations/batch    {"requests": [<recommendation request>, ...]}
+    POST /difficulty               {"zip": "13210", "difficulty": "Hard – The Thrill Kicks In",
+                                    "amenities": [...], "keywords": "..."}
+    GET  /metrics, /metrics.json   request counts and latencies, and the stage timings, cache,
+                                   geocoder and empty result counters of every worker
+                                   (Prometheus text / JSON)
+
+amenities and keywords are optional in recommendation and difficulty requests: only trails
+whose site has every amenity and every keyword are returned.
+
+Usage: python App/TrailService.py [--port 8080] [--workers 4] [--timeout 5]
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import TrailCore
+from CatalogStore import DEFAULT_STORE_PATH
+from TrailDifficulty import DIFFICULTY_CSV_PATH
+from TrailMetrics import get_metrics
+from ZipGeocoder import DEFAULT_TABLE_PATH, ZipGeocoder
+
+
+MAX_BODY_BYTES = 1 << 20
+MAX_BATCH_SIZE = 1000
+logger = logging.getLogger('trails.service')
+
+
+# Per worker process state, set once by _init_worker
+_recommender = None
+_difficulty = None
+
+
+def _init_worker(store_path, trails_csv, difficulty_csv, zip_table, allow_network, log_traces):
+    global _recommender, _difficulty
+    if log_traces:
+        # One JSON line per sampled request, with its stage timings, on the worker's stderr
+        logging.basicConfig(format='%(message)s')
+        logging.getLogger('trails.metrics').setLevel(logging.INFO)
+    geocoder = ZipGeocoder(table_path=zip_table, allow_network=allow_network)
+    _recommender = TrailCore.load_recommender(TrailCore.current_store_version(store_path), store_path,
+                                              trails_csv, geocoder=geocoder)
+    _difficulty = TrailCore.load_difficulty(difficulty_csv, geocoder=geocoder) if os.path.exists(difficulty_csv) else None
+
+
+def _call(function, *args):
+    # Runs in a worker, one call at a time: what the call recorded travels back with its result
+    # (TrailMetrics.drain), and errors are returned rather than raised so their metrics do too
+    metrics = get_metrics()
+    try:
+        return function(*args), None, metrics.drain()
+    except Exception as e:
+        # The worker's traceback, which pickling the exception would lose, for the parent's log
+        e.worker_traceback = traceback.format_exc()
+        return None, e, metrics.drain()
+
+
+def _health():
+    return {'catalog_version': _recommender.catalog_version, 'trails': len(_recommender.df),
+            'difficulty_trails': len(_difficulty.df) if _difficulty is not None else 0}
+
+
+def _recommend(payload):
+    user_input = TrailCore.user_input_from_json(payload)
+    recommendations = _recommender.get_recommendations(user_input)
+    renderer = TrailCore.recommendation_renderer(_recommender)
+    return '{"trails":%s}' % renderer.json(recommendations, TrailCore.RECOMMENDATION_COLUMNS)
+
+
+def _recommend_batch(payloads):
+    # Invalid requests and unknown ZIPs get their own error, the rest are scored together; the
+    # locations found while checking the ZIPs are passed on, so each one is geocoded once
+    results = [None] * len(payloads)
+    valid, user_inputs, locations = [], [], []
+    for i, payload in enumerate(payloads):
+        try:
+            user_input = TrailCore.user_input_from_json(payload)
+            with _recommender.metrics.span('geocode'):
+                location = _recommender.geocoder.locate(user_input['Zip'])
+        except ValueError as e:
+            results[i] = json.dumps({'error': str(e)})
+            continue
+        valid.append(i)
+        user_inputs.append(user_input)
+        locations.append(location)
+    renderer = TrailCore.recommendation_renderer(_recommender)
+    for i, recommendations in zip(valid, _recommender.get_recommendations_batch(user_inputs, locations=locations)):
+        results[i] = '{"trails":%s}' % renderer.json(recommendations, TrailCore.RECOMMENDATION_COLUMNS)
+    return '{"results":[%s]}' % ','.join(results)
+
+
+def _difficulty_recommend(payload):
+    if _difficulty is None:
+        raise TrailCore.CatalogUnavailable('The difficulty catalog is not available')
+    user_input = TrailCore.difficulty_input_from_json(payload)
+    recommendations = TrailCore.get_difficulty_recommendations(_difficulty, user_input)
+    renderer = TrailCore.difficulty_renderer(_difficulty)
+    return '{"trails":%s}' % renderer.json(recommendations, TrailCore.DIFFICULTY_COLUMNS)
+
+
+class TrailService:
+    """
+    An asyncio HTTP/1.1 server (keep-alive, JSON bodies) in front of a pool of worker processes.
+
+    Each worker loads the catalogs once, in its initializer; with a binary catalog store the
+    arrays are memory-mapped, so the workers share them through the page cache. The event
+    loop only parses requests and writes responses: geocoding and scoring run in the pool,
+    so a slow request never stalls the others. Every request has a deadline (504 when it
+    passes) and at most max_pending requests wait for a worker (503 beyond that). A worker
+    cannot be interrupted, so a request past its deadline keeps its pending slot until the
+    worker is done with it: slow requests cannot pile up behind the pool.
+
+    Method:
+    start: starts the worker pool, waits for every worker to load the catalog, then listens
+    serve_forever: runs until cancelled
+    close: stops listening and shuts the pool down
+    """
+    def __init__(self, host='127.0.0.1', port=8080, workers=None, timeout=5.0, max_pending=256,
+                 store_path=DEFAULT_STORE_PATH, trails_csv=TrailCore.TRAILS_CSV_PATH,
+                 difficulty_csv=DIFFICULTY_CSV_PATH, zip_table=DEFAULT_TABLE_PATH, allow_network=True,
+                 idle_timeout=30.0, log_traces=False):
+        """
+        Parameters:
+        - workers (int): worker processes; defaults to the number of CPUs
+        - timeout (float): seconds a request may take before the client gets a 504
+        - max_pending (int): requests in flight before new ones get a 503
+        - store_path, trails_csv, difficulty_csv, zip_table: where the catalogs and ZIP table are
+        - allow_network (bool): whether unknown ZIPs may be looked up online
+        - idle_timeout (float): seconds an idle keep-alive connection stays open
+        - log_traces (bool): whether workers log the stage timings of sampled requests as JSON lines
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.initargs = (store_path, trails_csv, difficulty_csv, zip_table, allow_network, log_traces)
+        # Request counts and latencies as seen by clients, plus what the workers record, merged
+        # in as their results come back
+        self.metrics = get_metrics()
+        self._pending = asyncio.Semaphore(max_pending)
+        self._pool = None
+        self._server = None
+        self._routes = {
+            ('POST', '/recommendations'): self._post_recommendations,
+            ('POST', '/recommendations/batch'): self._post_recommendations_batch,
+            ('POST', '/difficulty'): self._post_difficulty,
+            ('GET', '/health'): self._get_health,
+            ('GET', '/metrics'): self._get_metrics,
+            ('GET', '/metrics.json'): self._get_metrics_json,
+        }
+
+    async def start(self):
+        # Spawned rather than forked: the parent is already running an event loop
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_init_worker, initargs=self.initargs)
+        loop = asyncio.get_running_loop()
+        # One call per worker starts them all, so the catalog is loaded before the first request
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _health) for _ in range(self.workers)])
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, function, *args, timeout=None):
+        if self._pending.locked():
+            raise _HttpError(HTTPStatus.SERVICE_UNAVAILABLE, 'The service is busy, retry later')
+        await self._pending.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._pool, _call, function, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+        # Released when the worker finishes, not when the client stops waiting
+        future.add_done_callback(self._release)
+        try:
+            # Shielded, so a timeout or a dropped connection does not cancel the future (and
+            # release the slot) while the worker is still computing
+            result, error, _ = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+            if error is not None:
+                raise error
+            return result
+        except asyncio.TimeoutError:
+            raise _HttpError(HTTPStatus.GATEWAY_TIMEOUT, 'The request timed out')
+        except ValueError as e:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, str(e))
+        except TrailCore.CatalogUnavailable as e:
+            raise _HttpError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+
+    def _release(self, future):
+        self._pending.release()
+        # Merged here rather than in _run, so the metrics of a request past its deadline count too
+        if not future.cancelled() and future.exception() is None:
+            self.metrics.merge(future.result()[2])
+
+    async def _get_health(self, body):
+        health = await self._run(_health)
+        return json.dumps(dict(status='ok', workers=self.workers, **health))
+
+    async def _get_metrics(self, body):
+        return _Text(self.metrics.prometheus())
+
+    async def _get_metrics_json(self, body):
+        return json.dumps(self.metrics.snapshot())
+
+    async def _post_recommendations(self, body):
+        return await self._run(_recommend, _parse_json(body))
+
+    async def _post_recommendations_batch(self, body):
+        payload = _parse_json(body)
+        requests = payload.get('requests') if isinstance(payload, dict) else None
+        if not isinstance(requests, list):
+            raise _HttpError(HTTPStatus.BAD_REQUEST, 'The request body should be {"requests": [...]}')
+        if len(requests) > MAX_BATCH_SIZE:
+            raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'A batch holds at most {MAX_BATCH_SIZE} requests')
+        # A batch gets more time, in proportion to its size
+        return await self._run(_recommend_batch, requests, timeout=self.timeout * max(1, len(requests) / 50))
+
+    async def _post_difficulty(self, body):
+        return await self._run(_difficulty_recommend, _parse_json(body))
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                start = time.perf_counter()
+                route_path, status, response = await self._respond(method, path, body)
+                seconds = time.perf_counter() - start
+                self.metrics.observe('http_request_seconds', seconds, path=route_path)
+                self.metrics.increment('http_requests_total', path=route_path, status=status.value)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, response, keep_alive, seconds)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except _HttpError as e:
+            # The request itself could not be read (e.g. the body is too large)
+            _write_response(writer, e.status, json.dumps({'error': e.message}), False, 0.0)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method, path, body):
+        """Returns (route path for the metrics, status, response body)."""
+        path = path.split('?', 1)[0]
+        route = self._routes.get((method, path))
+        if route is None:
+            known = any(route_path == path for _, route_path in self._routes)
+            status = HTTPStatus.METHOD_NOT_ALLOWED if known else HTTPStatus.NOT_FOUND
+            # Unknown paths share one label, so scanners cannot grow the metrics without bound
+            return (path if known else 'other'), status, json.dumps({'error': status.phrase})
+        try:
+            return path, HTTPStatus.OK, await route(body)
+        except _HttpError as e:
+            return path, e.status, json.dumps({'error': e.message})
+        except Exception as e:
+            # The details go to the log, not to the client
+            logger.error('%s %s failed\n%s', method, path, getattr(e, 'worker_traceback', None) or traceback.format_exc())
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            return path, status, json.dumps({'error': status.phrase})
+
+
+class _Text(str):
+    """A plain text response body (the default is JSON)."""
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _parse_json(body):
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        raise _HttpError(HTTPStatus.BAD_REQUEST, 'The request body is not valid JSON')
+
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise _HttpError(HTTPStatus.BAD_REQUEST, 'Malformed request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise _HttpError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length')
+    if length < 0:
+        raise _HttpError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length')
+    if length > MAX_BODY_BYTES:
+        raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'The request body is too large')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+def _write_response(writer, status, body, keep_alive, seconds):
+    payload = body.encode('utf-8')
+    content_type = 'text/plain; version=0.0.4' if isinstance(body, _Text) else 'application/json'
+    head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: {content_type}; charset=utf-8\r\n'
+            f'Content-Length: {len(payload)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            f'Server-Timing: total;dur={seconds * 1000:.1f}\r\n\r\n')
+    writer.write(head.encode('latin-1') + payload)
+
+
+async def _main(args):
+    service = TrailService(args.host, args.port, args.workers, args.timeout, store_path=args.store,
+                           trails_csv=args.trails_csv, difficulty_csv=args.difficulty_csv,
+                           zip_table=args.zip_table, allow_network=not args.offline, log_traces=args.log_traces)
+    await service.start()
+    print(f"Serving {service.workers} workers on http://{service.host}:{service.port}", flush=True)
+    try:
+        await service.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds before a request gets a 504')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    parser.add_argument('--trails-csv', default=TrailCore.TRAILS_CSV_PATH)
+    parser.add_argument('--difficulty-csv', default=DIFFICULTY_CSV_PATH)
+    parser.add_argument('--zip-table', default=DEFAULT_TABLE_PATH)
+    parser.add_argument('--offline', action='store_true', help='never look ZIPs up online')
+    parser.add_argument('--log-traces', action='store_true',
+                        help='log the stage timings of sampled requests (TRAILS_METRICS_SAMPLE_RATE) as JSON lines')
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
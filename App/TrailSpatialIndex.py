@@ -0,0 +1,220 @@
+import numpy as np
+from TrailDistance import distance_miles
+
+
+# A degree of latitude is 68.7 to 69.4 miles; using a slightly smaller value keeps the
+# bounding boxes conservative so no trail inside the radius is ever missed.
+MILES_PER_DEGREE_LAT = 68.0
+
+
+class TrailSpatialIndex:
+    """
+    A bucket-grid index over trail coordinates for radius and nearest-N queries.
+
+    Trails are bucketed into fixed-size latitude/longitude cells and stored sorted by cell id,
+    so the trails of one grid row inside a bounding box are a single contiguous slice found
+    with a binary search. A query only computes exact distances for the trails in the cells
+    around the user, which keeps the work proportional to the number of nearby trails
+    instead of the size of the catalog.
+
+    Method:
+    query_radius: returns the trails within a radius and their distances
+    query_nearest: returns the N nearest trails (optionally restricted by a boolean mask)
+    updated: returns the index of a new catalog version, recomputing only the changed trails
+    """
+    def __init__(self, latitudes, longitudes, cell_size=0.1):
+        """
+        Parameters:
+        - latitudes, longitudes (array): trail coordinates in degrees, in catalog row order
+        - cell_size (float): size of a grid cell in degrees (0.1 is about 7 miles)
+        """
+        self.latitudes = np.array(latitudes, dtype=np.float64)
+        self.longitudes = np.array(longitudes, dtype=np.float64)
+        self.cell_size = cell_size
+        self.n_rows = int(np.ceil(180 / cell_size)) + 1
+        self.n_cols = int(np.ceil(360 / cell_size))
+        self._sort(self._trail_cells(self.latitudes, self.longitudes))
+
+    def _trail_cells(self, latitudes, longitudes):
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        cell_ids = np.full(len(latitudes), -1, dtype=np.int64)
+        cell_ids[valid] = self._cell_ids(latitudes[valid], longitudes[valid])
+        # Trails without coordinates get cell -1, which no query ever touches
+        return cell_ids
+
+    def _sort(self, cell_ids):
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.sorted_cells = cell_ids[self.order]
+        # The index is shared by concurrent requests, so nothing may write to it after this
+        for array in (self.latitudes, self.longitudes, self.order, self.sorted_cells):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_arrays(cls, latitudes, longitudes, order, sorted_cells, cell_size=0.1):
+        """
+        Rebuilds an index from arrays saved by a previous build (e.g. memory-mapped from the
+        binary catalog) without copying or re-sorting them.
+        """
+        index = cls.__new__(cls)
+        index.latitudes, index.longitudes = latitudes, longitudes
+        index.order, index.sorted_cells = order, sorted_cells
+        index.cell_size = cell_size
+        index.n_rows = int(np.ceil(180 / cell_size)) + 1
+        index.n_cols = int(np.ceil(360 / cell_size))
+        return index
+
+    def updated(self, source_rows, latitudes, longitudes):
+        """
+        Returns a new index for a new version of the catalog, leaving this one untouched for
+        the queries still using it.
+
+        Parameters:
+        - source_rows (int array): for each row of the new catalog, its row in this index,
+          or -1 for a trail that was added or changed
+        - latitudes, longitudes (array): coordinates of the new catalog
+
+        Only the added and changed trails get their cell computed; every other trail keeps
+        the cell it already has.
+        """
+        source_rows = np.asarray(source_rows, dtype=np.int64)
+        index = self.__class__.__new__(self.__class__)
+        index.latitudes = np.array(latitudes, dtype=np.float64)
+        index.longitudes = np.array(longitudes, dtype=np.float64)
+        index.cell_size, index.n_rows, index.n_cols = self.cell_size, self.n_rows, self.n_cols
+        old_cells = np.empty(len(self), dtype=np.int64)
+        old_cells[self.order] = self.sorted_cells
+        kept = source_rows >= 0
+        cell_ids = np.empty(len(source_rows), dtype=np.int64)
+        cell_ids[kept] = old_cells[source_rows[kept]]
+        cell_ids[~kept] = index._trail_cells(index.latitudes[~kept], index.longitudes[~kept])
+        index._sort(cell_ids)
+        return index
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_size).astype(np.int64), 0, self.n_rows - 1)
+
+    def _col(self, lon):
+        return np.floor(((np.asarray(lon) + 180) % 360) / self.cell_size).astype(np.int64) % self.n_cols
+
+    def _cell_ids(self, lat, lon):
+        return self._row(lat) * self.n_cols + self._col(lon)
+
+    def _candidates(self, lat, lon, radius_miles):
+        """Catalog row numbers of every trail in the cells overlapping the radius' bounding box."""
+        dlat = radius_miles / MILES_PER_DEGREE_LAT
+        lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        cos_lat = np.cos(np.radians(max(abs(lat_min), abs(lat_max))))
+        rows = np.arange(self._row(lat_min), self._row(lat_max) + 1)
+
+        if cos_lat <= 1e-9 or dlat / cos_lat >= 180:
+            col_ranges = [(0, self.n_cols - 1)]
+        else:
+            dlon = dlat / cos_lat
+            first, last = int(self._col(lon - dlon)), int(self._col(lon + dlon))
+            # The box may wrap around the antimeridian
+            col_ranges = [(first, last)] if first <= last else [(first, self.n_cols - 1), (0, last)]
+
+        slices = []
+        for first, last in col_ranges:
+            starts = np.searchsorted(self.sorted_cells, rows * self.n_cols + first, side='left')
+            ends = np.searchsorted(self.sorted_cells, rows * self.n_cols + last, side='right')
+            slices.extend(self.order[s:e] for s, e in zip(starts, ends) if e > s)
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(slices))
+
+    def query_radius(self, lat, lon, radius_miles):
+        """
+        Returns (rows, distances) for the trails within radius_miles of (lat, lon), with rows
+        in catalog order and distances in miles.
+        """
+        candidates = self._candidates(lat, lon, radius_miles)
+        distances = distance_miles(lat, lon, self.latitudes[candidates], self.longitudes[candidates])
+        keep = distances <= radius_miles
+        return candidates[keep], distances[keep]
+
+    def query_nearest(self, lat, lon, n, mask=None):
+        """
+        Returns (rows, distances) for the n trails nearest to (lat, lon), closest first.
+
+        Parameters:
+        - mask (bool array): only trails where mask is True are considered
+
+        The search radius doubles until it holds n eligible trails, so only the neighbourhood
+        of the user is ever scanned unless the catalog is sparse around them.
+        """
+        eligible = np.ones(len(self), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        eligible = eligible & ~(np.isnan(self.latitudes) | np.isnan(self.longitudes))
+        total = int(eligible.sum())
+        n = min(n, total)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        radius = self.cell_size * MILES_PER_DEGREE_LAT
+        # Half the earth's circumference covers every point, so the loop always ends
+        while True:
+            rows, distances = self.query_radius(lat, lon, radius)
+            keep = eligible[rows]
+            rows, distances = rows[keep], distances[keep]
+            if len(rows) >= n or radius >= 12500:
+                break
+            radius *= 2
+        # Ties on distance are broken by catalog order, so results are reproducible
+        nearest = np.lexsort((rows, distances))[:n]
+        return rows[nearest], distances[nearest]
+
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lon, precision=5):
+    """Standard base-32 geohash of a point; precision 5 is a cell of about 3 x 3 miles."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """Returns (lat_min, lat_max, lon_min, lon_max) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_cell(geohash):
+    """
+    Returns (center_lat, center_lon, reach_miles) of a geohash cell, where every point of the
+    cell is within reach_miles of the center (the corner distance plus a 1% margin).
+    """
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(geohash)
+    center_lat, center_lon = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    corners = distance_miles(center_lat, center_lon, [lat_min, lat_min, lat_max, lat_max], [lon_min, lon_max, lon_min, lon_max])
+    return center_lat, center_lon, float(corners.max()) * 1.01
@@ -0,0 +1,100 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class TrailTextStore:
+    """
+    The bulky text of the trails (site address, phone, description, amenities), kept out of the
+    catalog DataFrame and only decoded for the rows a request returns.
+
+    Each column is dictionary encoded: the site metadata is the same for every trail of a park,
+    so a trail costs one int32 code per column, and the distinct values are held once as a
+    single UTF-8 blob with offsets instead of as Python strings. A store opened from a
+    CatalogStore version maps its files the first time a column is read: amenities and
+    description when the catalog's TrailAmenityIndex is built, address and phone only once a
+    worker shows them.
+
+    Method:
+    from_frame: encodes text columns of a DataFrame
+    open: lazily opens the files written by save
+    take: the values of one column for some rows
+    take_all: every column for some rows, as a dictionary of lists
+    values: the distinct values of a column and the code of every row
+    save: writes the store into a directory
+    """
+    def __init__(self, columns, loader=None, n_rows=0):
+        """
+        Parameters:
+        - columns (dict): column name -> (codes, blob, offsets), or None when the column is still on disk
+        - loader (function): loads a column that is still on disk, given its name
+        - n_rows (int): number of trails
+        """
+        self.columns = columns
+        self.loader = loader
+        self.n_rows = n_rows
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        encoded = {}
+        for name in columns:
+            if name not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[name])
+            values = [str(value).encode('utf-8') for value in uniques]
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in values], out=offsets[1:])
+            encoded[name] = (codes.astype(np.int32), np.frombuffer(b''.join(values), dtype=np.uint8), offsets)
+        return cls(encoded, n_rows=len(df))
+
+    @classmethod
+    def open(cls, directory, names, n_rows):
+        def load(name):
+            stem = os.path.join(directory, f'text_{names.index(name)}')
+            return tuple(np.load(f'{stem}.{part}.npy', mmap_mode='r', allow_pickle=False)
+                         for part in ('codes', 'blob', 'offsets'))
+        return cls(dict.fromkeys(names), loader=load, n_rows=n_rows)
+
+    def _column(self, name):
+        column = self.columns[name]
+        if column is None:
+            with self._lock:
+                column = self.columns[name]
+                if column is None:
+                    column = self.columns[name] = self.loader(name)
+        return column
+
+    def take(self, name, rows):
+        codes, blob, offsets = self._column(name)
+        values = []
+        for code in np.asarray(codes[rows]).tolist():
+            if code < 0:
+                values.append(None)
+            else:
+                values.append(bytes(blob[offsets[code]:offsets[code + 1]]).decode('utf-8'))
+        return values
+
+    def take_all(self, rows):
+        return {name: self.take(name, rows) for name in self.columns}
+
+    def values(self, name):
+        """(list of the distinct values, int32 code of every row, -1 for missing) of a column."""
+        codes, blob, offsets = self._column(name)
+        raw = bytes(blob)
+        bounds = np.asarray(offsets).tolist()
+        return [raw[start:end].decode('utf-8') for start, end in zip(bounds[:-1], bounds[1:])], codes
+
+    @property
+    def nbytes(self):
+        # Only counts the columns that are loaded
+        return sum(array.nbytes for column in self.columns.values() if column is not None for array in column)
+
+    def save(self, directory):
+        names = list(self.columns)
+        for i, name in enumerate(names):
+            for part, array in zip(('codes', 'blob', 'offsets'), self._column(name)):
+                np.save(os.path.join(directory, f'text_{i}.{part}.npy'), np.ascontiguousarray(array))
+        return names
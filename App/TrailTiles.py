@@ -0,0 +1,413 @@
+"""
+Level-of-detail map tiles of the trail catalog, replacing the single folium map.html that
+had every trail baked in.
+
+The map is cut into the usual web map tiles (zoom z has 2^z x 2^z tiles of 256 pixels) and
+every tile is a small GeoJSON file, precomputed once per catalog:
+
+    zoom <= cluster_max_zoom  trails are clustered on the server: one point per cluster_radius
+                              pixel cell with its trail count, a single trail as itself
+    zoom >  cluster_max_zoom  every trail, as a point or, when trail geometry is given, as its
+                              line simplified with Douglas-Peucker to one pixel at that zoom
+
+The page (static/tilemap.html) only fetches the tiles of its viewport, and highlights the
+top-k results of a query as a separate small overlay (highlight_layer), so the tiles never
+change between queries. Tiles are written as versioned directories next to a manifest.json
+naming the live one, like the CatalogStore versions.
+
+Usage: python App/TrailTiles.py [--csv Finalized_Trail_paths.csv] [--geometry trails.geojson]
+           [--out App/static/tiles]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from VersionedDirectory import new_version
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TILES_PATH = os.path.join(app_root, 'static', 'tiles')
+TILE_SIZE = 256
+# New York State fills the view around zoom 6; past MAX_ZOOM the page scales the last tiles
+MIN_ZOOM = 5
+MAX_ZOOM = 13
+CLUSTER_MAX_ZOOM = 11
+CLUSTER_RADIUS = 40
+# 5 decimals of a degree is about a meter
+COORDINATE_DIGITS = 5
+MAX_LATITUDE = 85.05112878
+# Catalog columns shown in a trail's popup and their property names
+FEATURE_PROPERTIES = {'Name': 'name', 'site_name': 'site', 'Length(miles)': 'miles'}
+
+
+def mercator(lat, lon):
+    """Web Mercator (x, y) of coordinates, both in [0, 1) with y growing southwards."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    x = (np.asarray(lon, dtype=np.float64) + 180) / 360
+    y = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / np.pi) / 2
+    return x, y
+
+
+def unmercator(x, y):
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y)))))
+    return lat, np.asarray(x) * 360 - 180
+
+
+def tiles_in_view(south, west, north, east, zoom):
+    """(z, x, y) of every tile a viewport overlaps at zoom, the same tiles the page fetches."""
+    n = 1 << zoom
+    x0, y0 = mercator(north, west)
+    x1, y1 = mercator(south, east)
+    xs = range(max(0, int(x0 * n)), min(n - 1, int(x1 * n)) + 1)
+    ys = range(max(0, int(y0 * n)), min(n - 1, int(y1 * n)) + 1)
+    return [(zoom, x, y) for x in xs for y in ys]
+
+
+def simplify_lines(points, starts, ends, tolerance):
+    """
+    Douglas-Peucker over many lines at once: keeps the end points of each line, and recursively
+    the point farthest from the chord while it is more than tolerance away. Distances are to the
+    chord segment, not its line, so a line that doubles back past the end of a chord is kept
+    too: every dropped point is within tolerance of the simplified line. Every pending chord
+    of every line is split in the same vectorized step, so the loop runs once per level of the
+    recursion instead of once per chord.
+
+    Parameters:
+    - points (array): (n, 2) points of all the lines, one line after the other
+    - starts, ends (int array): index of the first and of the last point of each line
+
+    Returns a boolean mask of the points kept.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    while True:
+        pending = ends - starts > 1
+        starts, ends = starts[pending], ends[pending]
+        if len(starts) == 0:
+            return keep
+        counts = ends - starts - 1
+        firsts = np.cumsum(counts) - counts
+        chord_of = np.repeat(np.arange(len(starts)), counts)
+        inner = np.arange(counts.sum()) - firsts[chord_of] + starts[chord_of] + 1
+        chords = points[ends] - points[starts]
+        squared_lengths = (chords ** 2).sum(axis=1)
+        squared_lengths[squared_lengths == 0] = 1
+        offsets = points[inner] - points[starts][chord_of]
+        chord_x, chord_y = chords[chord_of, 0], chords[chord_of, 1]
+        offset_x, offset_y = offsets[:, 0], offsets[:, 1]
+        # Projection of each point on its chord, clamped to the segment (its start for a closed
+        # chord); squared distances, which have the same maximum
+        along = offset_x * chord_x
+        along += offset_y * chord_y
+        along /= squared_lengths[chord_of]
+        np.clip(along, 0, 1, out=along)
+        offset_x -= along * chord_x
+        offset_y -= along * chord_y
+        distances = offset_x * offset_x
+        distances += offset_y * offset_y
+        farthest = np.maximum.reduceat(distances, firsts)
+        # The first point at the farthest distance, like np.argmax
+        positions = np.where(distances == farthest[chord_of], np.arange(len(distances)), len(distances))
+        middles = inner[np.minimum.reduceat(positions, firsts)]
+        split = farthest > tolerance * tolerance
+        keep[middles[split]] = True
+        starts = np.concatenate([starts[split], middles[split]])
+        ends = np.concatenate([middles[split], ends[split]])
+
+
+def simplify(points, tolerance):
+    """Indices of the points of one line that Douglas-Peucker keeps (see simplify_lines)."""
+    if len(points) <= 2:
+        return np.arange(len(points))
+    return np.flatnonzero(simplify_lines(np.asarray(points, dtype=np.float64), [0], [len(points) - 1], tolerance))
+
+
+def _round(values):
+    return np.round(np.asarray(values, dtype=np.float64), COORDINATE_DIGITS).tolist()
+
+
+def _point(lon, lat):
+    return f'{{"type":"Point","coordinates":[{lon},{lat}]}}'
+
+
+def _collection(features):
+    return '{"type":"FeatureCollection","features":[' + ','.join(features) + ']}'
+
+
+def _json(value):
+    # Safe to embed in a <script> block
+    return json.dumps(value, separators=(',', ':')).replace('<', '\\u003c')
+
+
+def highlight_layer(result, limit=None):
+    """
+    GeoJSON of a result frame (the recommendations or difficulty results), one point per
+    trail with its rank, drawn by the page on top of the tiles.
+    """
+    rows = result if limit is None else result.iloc[:limit]
+    features = []
+    for rank, (lat, lon, name, site) in enumerate(zip(rows['latitude'].tolist(), rows['longitude'].tolist(),
+                                                      rows['Name'].tolist(), rows['site_name'].tolist()), 1):
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            continue
+        properties = {'rank': rank, 'name': None if pd.isna(name) else str(name),
+                      'site': None if pd.isna(site) else str(site)}
+        features.append('{"type":"Feature","geometry":' + _point(*_round([lon, lat])) +
+                        ',"properties":' + _json(properties) + '}')
+    return _collection(features)
+
+
+def read_geometries(geojson_path, df):
+    """
+    Trail lines of a GeoJSON FeatureCollection (LineString or MultiLineString features with
+    site_name and Name properties), matched to the catalog rows on those two columns: one
+    list of (n, 2) lon/lat arrays per row, None for a trail without geometry.
+    """
+    with open(geojson_path) as f:
+        features = json.load(f)['features']
+    lines = {}
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        properties = feature.get('properties') or {}
+        if geometry.get('type') == 'LineString':
+            parts = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            parts = geometry['coordinates']
+        else:
+            continue
+        key = (properties.get('site_name'), properties.get('Name'))
+        lines.setdefault(key, [np.asarray(part, dtype=np.float64)[:, :2] for part in parts if len(part) >= 2])
+    return [lines.get(key) for key in zip(df['site_name'].astype(object), df['Name'].astype(object))]
+
+
+class TrailTileSet:
+    """
+    The precomputed GeoJSON tiles of a trail catalog.
+
+    Everything that does not depend on the zoom (a trail's properties, its point feature, its
+    projected coordinates) is built once; each zoom then only adds its clusters or simplified
+    lines, bucketed by tile with one sort. Clusters are a grid over the Web Mercator pixels of
+    the zoom, so clustering a zoom is a single np.unique over the trail cells.
+
+    Method:
+    build: computes every tile of a catalog
+    write: publishes the tiles as a new version next to manifest.json
+    tile: the GeoJSON text of one tile ('' when the tile is empty)
+    """
+    def __init__(self, tiles, manifest):
+        """
+        Parameters:
+        - tiles (dict): (z, x, y) -> GeoJSON text of the tile
+        - manifest (dict): zoom range, bounds and sizes of the tile set
+        """
+        self.tiles = tiles
+        self.manifest = manifest
+
+    @classmethod
+    def build(cls, df, latitudes=None, longitudes=None, geometries=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+              cluster_max_zoom=CLUSTER_MAX_ZOOM, cluster_radius=CLUSTER_RADIUS):
+        """
+        Parameters:
+        - df (DataFrame): the trail catalog, with latitude, longitude and the FEATURE_PROPERTIES columns
+        - latitudes, longitudes (array): exact coordinates (e.g. the spatial index's float64 ones), default df's
+        - geometries (list): optional trail lines, one list of (n, 2) lon/lat arrays (or None) per row
+        - cluster_radius (int): size in pixels of a cluster cell
+        """
+        latitudes = np.asarray(df['latitude'] if latitudes is None else latitudes, dtype=np.float64)
+        longitudes = np.asarray(df['longitude'] if longitudes is None else longitudes, dtype=np.float64)
+        rows = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        x, y = mercator(latitudes[rows], longitudes[rows])
+
+        # Per trail, once: its properties and its point feature
+        columns = {name: [None if pd.isna(value) else value for value in df[column].iloc[rows].tolist()]
+                   for column, name in FEATURE_PROPERTIES.items() if column in df.columns}
+        if 'miles' in columns:
+            columns['miles'] = [None if value is None else round(float(value), 2) for value in columns['miles']]
+        names = list(columns)
+        properties = [_json(dict(zip(['id'] + names, values)))
+                      for values in zip(rows.tolist(), *(columns[name] for name in names))]
+        points = [_point(lon, lat) for lon, lat in zip(_round(longitudes[rows]), _round(latitudes[rows]))]
+        trail_features = ['{"type":"Feature","geometry":' + point + ',"properties":' + props + '}'
+                          for point, props in zip(points, properties)]
+        # Every line of every trail end to end, projected once
+        lines = None
+        if geometries is not None:
+            parts, part_trails = [], []
+            for i, row in enumerate(rows.tolist()):
+                for part in geometries[row] or ():
+                    parts.append(part)
+                    part_trails.append(i)
+            if parts:
+                lonlat = np.concatenate(parts)
+                sizes = np.array([len(part) for part in parts])
+                part_ends = np.cumsum(sizes) - 1
+                lines = (lonlat, np.column_stack(mercator(lonlat[:, 1], lonlat[:, 0])), part_ends - sizes + 1,
+                         part_ends, np.array(part_trails))
+
+        tiles = {}
+        for zoom in range(min_zoom, max_zoom + 1):
+            n = 1 << zoom
+            if zoom <= cluster_max_zoom:
+                keys, features = cls._clusters(x, y, zoom, cluster_radius, trail_features)
+            else:
+                keys, features = cls._trails(x, y, zoom, trail_features, properties, lines)
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            bounds = np.flatnonzero(np.diff(keys)) + 1
+            for start, end in zip(np.concatenate([[0], bounds]).tolist(), np.concatenate([bounds, [len(keys)]]).tolist()):
+                if start == end:
+                    continue
+                tile_x, tile_y = divmod(int(keys[start]), n)
+                tiles[(zoom, tile_x, tile_y)] = _collection([features[i] for i in order[start:end].tolist()])
+
+        south, west, north, east = (float(latitudes[rows].min()), float(longitudes[rows].min()),
+                                    float(latitudes[rows].max()), float(longitudes[rows].max())) if len(rows) else (0, 0, 0, 0)
+        if lines is not None:
+            # Lines reach past their trail's point: the bounds cover every tile that has one
+            lonlat = lines[0]
+            south, west = min(south, float(lonlat[:, 1].min())), min(west, float(lonlat[:, 0].min()))
+            north, east = max(north, float(lonlat[:, 1].max())), max(east, float(lonlat[:, 0].max()))
+        manifest = {
+            'min_zoom': min_zoom,
+            'max_zoom': max_zoom,
+            'cluster_max_zoom': cluster_max_zoom,
+            'bounds': [[south, west], [north, east]],
+            'trails': int(len(rows)),
+            'tiles': len(tiles),
+            'bytes': sum(len(text.encode('utf-8')) for text in tiles.values()),
+        }
+        return cls(tiles, manifest)
+
+    @staticmethod
+    def _clusters(x, y, zoom, cluster_radius, trail_features):
+        n = 1 << zoom
+        cells_per_axis = -(-n * TILE_SIZE // cluster_radius)
+        cells = (x * n * TILE_SIZE // cluster_radius).astype(np.int64) * cells_per_axis + \
+            (y * n * TILE_SIZE // cluster_radius).astype(np.int64)
+        unique_cells, members, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        center_x = np.bincount(members, weights=x) / counts
+        center_y = np.bincount(members, weights=y) / counts
+        # A trail alone in its cell is shown as itself
+        first = np.zeros(len(unique_cells), dtype=np.int64)
+        first[members] = np.arange(len(members))
+        lat, lon = unmercator(center_x, center_y)
+        features = []
+        for count, trail, point_lon, point_lat in zip(counts.tolist(), first.tolist(), _round(lon), _round(lat)):
+            if count == 1:
+                features.append(trail_features[trail])
+            else:
+                features.append('{"type":"Feature","geometry":' + _point(point_lon, point_lat) +
+                                f',"properties":{{"cluster":{count}}}}}')
+        keys = np.minimum((center_x * n).astype(np.int64), n - 1) * n + np.minimum((center_y * n).astype(np.int64), n - 1)
+        return keys, features
+
+    @staticmethod
+    def _trails(x, y, zoom, trail_features, properties, lines):
+        n = 1 << zoom
+        keys = (np.minimum((x * n).astype(np.int64), n - 1) * n + np.minimum((y * n).astype(np.int64), n - 1)).tolist()
+        features = list(trail_features)
+        if lines is None:
+            return np.asarray(keys, dtype=np.int64), features
+        lonlat, xy, starts, ends, part_trails = lines
+        # Simplified to one pixel of this zoom, in Mercator units
+        kept = np.flatnonzero(simplify_lines(xy, starts, ends, 1 / (n * TILE_SIZE)))
+        coordinates = np.round(lonlat[kept], COORDINATE_DIGITS).tolist()
+        first_kept = np.searchsorted(kept, starts).tolist()
+        last_kept = np.searchsorted(kept, ends, side='right').tolist()
+        low = (np.minimum.reduceat(xy, starts) * n).astype(np.int64)
+        high = (np.maximum.reduceat(xy, starts) * n).astype(np.int64)
+        part_trails = part_trails.tolist()
+        part = 0
+        while part < len(part_trails):
+            i = part_trails[part]
+            end = part
+            while end < len(part_trails) and part_trails[end] == i:
+                end += 1
+            texts = [json.dumps(coordinates[first_kept[p]:last_kept[p]], separators=(',', ':')) for p in range(part, end)]
+            geometry = ('{"type":"LineString","coordinates":' + texts[0] + '}' if len(texts) == 1 else
+                        '{"type":"MultiLineString","coordinates":[' + ','.join(texts) + ']}')
+            features[i] = '{"type":"Feature","geometry":' + geometry + ',"properties":' + properties[i] + '}'
+            # A line is in every tile its bounding box overlaps; the others are extra entries
+            tile_x0, tile_y0 = low[part:end].min(axis=0).tolist()
+            tile_x1, tile_y1 = high[part:end].max(axis=0).tolist()
+            for tile_x in range(max(0, tile_x0), min(n - 1, tile_x1) + 1):
+                for tile_y in range(max(0, tile_y0), min(n - 1, tile_y1) + 1):
+                    tile_key = tile_x * n + tile_y
+                    if tile_key != keys[i]:
+                        keys.append(tile_key)
+                        features.append(features[i])
+            part = end
+        return np.asarray(keys, dtype=np.int64), features
+
+    def tile(self, z, x, y):
+        return self.tiles.get((z, x, y), '')
+
+    def write(self, path=DEFAULT_TILES_PATH, version=None, keep=2):
+        """
+        Writes the tiles under path/<version>/<z>/<x>/<y>.json, then points path/manifest.json at
+        the new version and removes all but the newest `keep` versions. Pages that already
+        loaded the previous manifest keep fetching its tiles until they reload.
+        """
+        version = version or new_version()
+        os.makedirs(path, exist_ok=True)
+        final_dir = os.path.join(path, version)
+        if os.path.exists(final_dir):
+            # Open pages may still be fetching the tiles of any version
+            raise ValueError(f"Tile version {version} already exists in {path}")
+        tmp_dir = os.path.join(path, f'.{version}.tmp-{os.getpid()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for (z, x, y), text in self.tiles.items():
+            tile_dir = os.path.join(tmp_dir, str(z), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f'{y}.json'), 'w', encoding='utf-8') as f:
+                f.write(text)
+        os.makedirs(tmp_dir, exist_ok=True)
+        os.replace(tmp_dir, final_dir)
+
+        manifest = dict(self.manifest, version=version)
+        tmp_path = os.path.join(path, f'manifest.json.tmp-{os.getpid()}')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(path, 'manifest.json'))
+        versions = sorted(d for d in os.listdir(path) if not d.startswith('.') and os.path.isdir(os.path.join(path, d)))
+        for old in versions[:-keep] if keep else []:
+            if old != version:
+                shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+        return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=None, help='trail CSV (default: the binary catalog, else Finalized_Trail_paths.csv)')
+    parser.add_argument('--geometry', default=None, help='GeoJSON of the trail lines, matched on site_name and Name')
+    parser.add_argument('--out', default=DEFAULT_TILES_PATH)
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--cluster-max-zoom', type=int, default=CLUSTER_MAX_ZOOM)
+    args = parser.parse_args()
+
+    import TrailCore
+    if args.csv:
+        recommender = TrailCore.load_recommender(csv_path=args.csv)
+    else:
+        recommender = TrailCore.load_recommender(TrailCore.current_store_version())
+    df = recommender.df
+    geometries = read_geometries(args.geometry, df) if args.geometry else None
+    start = time.perf_counter()
+    tile_set = TrailTileSet.build(df, recommender.spatial_index.latitudes, recommender.spatial_index.longitudes,
+                                  geometries, args.min_zoom, args.max_zoom, args.cluster_max_zoom)
+    version = tile_set.write(args.out)
+    manifest = tile_set.manifest
+    print(f"{manifest['trails']} trails -> {manifest['tiles']} tiles, {manifest['bytes'] / 2 ** 20:.1f} MB "
+          f"in {time.perf_counter() - start:.1f}s: {os.path.join(args.out, version)}")
+
+
+if __name__ == "__main__":
+    main()
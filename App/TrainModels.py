@@ -0,0 +1,366 @@
+"""
+Unattended training of the difficulty models, the scriptable replacement for the notebook
+cells that ran them by hand (and blocked on plt.show()):
+
+    regressor     the TrailDifficultyRegressor of DataProcessng.ipynb: a RandomForestRegressor
+                  predicting DR, with a hyperparameter grid scored by cross-validation
+    kmeans        the mini-batch k-means sweep of TrailClustering (K_MeansClusteringTrail.ipynb),
+                  which labels the Difficulty page
+    hierarchical  the AgglomerativeClustering sweep of HierarchialClustering.ipynb, on a sample
+                  (it needs the n x n distances), for comparison with k-means
+
+Every (grid candidate, CV fold) pair and every k is one task on a process pool. The
+preprocessing transformers are fitted once per fold and once on the whole catalog, never per
+candidate, and kept in a cache keyed by a hash of the data they were fitted on, so a run on
+an unchanged catalog does not fit them at all.
+
+Each run is saved as a version of a ModelStore (App/models by default): the regressor
+pipeline, the DifficultyModel and a metrics.json with the CV scores, silhouettes and stage
+timings, next to a CURRENT file naming the live version. --publish also writes the
+DifficultyModel and Trail_Difficulty.csv the app reads, keeping the labels of the previous model.
+
+Usage: python App/TrainModels.py [--csv App/Finalized_Trail_paths.csv] [--jobs 8] [--folds 5]
+           [--k 4 10] [--grid '{"n_estimators": [300, 1000]}'] [--stages regressor kmeans hierarchical] [--publish]
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from DifficultyModel import DEFAULT_MODEL_PATH, DifficultyModel
+from TrailClustering import (CATEGORICAL_COLUMNS, DIFFICULTY_CSV_PATH, NUMERIC_COLUMNS, TRAILS_CSV_PATH,
+                             TrailClustering, make_transformer, prepare_trails, write_difficulty_csv)
+from VersionedDirectory import VersionedDirectory
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODELS_PATH = os.path.join(app_root, 'models')
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_MODELS_PATH, 'cache')
+STAGES = ['regressor', 'kmeans', 'hierarchical']
+# The notebook's regressor: features, target and held-out share
+REGRESSOR_FEATURES = NUMERIC_COLUMNS + CATEGORICAL_COLUMNS
+REGRESSOR_TARGET = 'DR'
+TEST_SIZE = 0.2
+# The notebook used 1000 trees with the defaults; the grid searches around it
+REGRESSOR_GRID = {'n_estimators': [300, 1000], 'max_depth': [None, 16], 'min_samples_leaf': [1, 4]}
+# AgglomerativeClustering keeps the n x n distances, so it is run on a sample
+HIERARCHICAL_SAMPLE = 5000
+
+
+def make_regressor_transformer():
+    """The notebook's preprocessor: standardized measurements, one-hot type_factor."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+    return ColumnTransformer([
+        ('num', StandardScaler(), NUMERIC_COLUMNS),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_COLUMNS),
+    ], sparse_threshold=0)
+
+
+def data_hash(*frames):
+    """SHA-256 of the content of DataFrames (values and index)."""
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame).to_numpy().tobytes())
+        digest.update(repr(list(frame.columns)).encode())
+    return digest.hexdigest()
+
+
+class TransformerCache:
+    """
+    Fitted preprocessing transformers and what they produced, on disk.
+
+    An entry is keyed by the transformer's name, the scikit-learn version and the hash of the
+    data it was fitted on and applied to; it holds the fitted transformer (joblib) and the
+    transformed arrays (.npy). Entries are written to a temporary directory and renamed into
+    place, so concurrent runs never read a partial entry.
+
+    Method:
+    fit_transform: the fitted transformer and transformed arrays, from the cache when possible
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        """
+        Parameters:
+        - path (str): cache directory, None to keep nothing between runs
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def fit_transform(self, name, make, fit_frame, transform_frames=()):
+        """
+        Returns (transformer, [make().fit_transform(fit_frame)] + [transformer.transform(frame) ...]).
+        """
+        import joblib
+        import sklearn
+        key = hashlib.sha256(f'{name}:{sklearn.__version__}:{data_hash(fit_frame, *transform_frames)}'.encode()).hexdigest()
+        entry = os.path.join(self.path, key) if self.path else None
+        if entry is not None and os.path.exists(os.path.join(entry, 'transformer.joblib')):
+            self.hits += 1
+            arrays = [np.load(os.path.join(entry, f'{i}.npy'), allow_pickle=False) for i in range(1 + len(transform_frames))]
+            return joblib.load(os.path.join(entry, 'transformer.joblib')), arrays
+        self.misses += 1
+        transformer = make()
+        arrays = [transformer.fit_transform(fit_frame)] + [transformer.transform(frame) for frame in transform_frames]
+        if entry is not None:
+            tmp_dir = f'{entry}.tmp-{os.getpid()}'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for i, array in enumerate(arrays):
+                np.save(os.path.join(tmp_dir, f'{i}.npy'), np.asarray(array, dtype=np.float64))
+            joblib.dump(transformer, os.path.join(tmp_dir, 'transformer.joblib'))
+            try:
+                os.replace(tmp_dir, entry)
+            except OSError:
+                # Another run stored the same entry first
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        return transformer, arrays
+
+
+_worker_data = None
+
+
+def _init_worker(data):
+    # The fold matrices (or clustering features) are sent once per worker process, not once per task
+    global _worker_data
+    _worker_data = data
+
+
+def _score_candidate(params, fold, random_state):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import r2_score
+    x_train, y_train, x_val, y_val = _worker_data[fold]
+    # One core per task: the pool already runs a task per core
+    model = RandomForestRegressor(random_state=random_state, n_jobs=1, **params)
+    model.fit(x_train, y_train)
+    return r2_score(y_val, model.predict(x_val))
+
+
+def _fit_agglomerative(k):
+    from sklearn.cluster import AgglomerativeClustering
+    from sklearn.metrics import silhouette_score
+    features = _worker_data
+    labels = AgglomerativeClustering(n_clusters=k, linkage='average').fit_predict(features)
+    return float(silhouette_score(features, labels)) if len(np.unique(labels)) > 1 else -1.0
+
+
+def run_tasks(function, tasks, data, jobs):
+    """function(*task) for every task, in order, on a process pool of `jobs` workers (inline for 1)."""
+    global _worker_data
+    if jobs == 1 or len(tasks) <= 1:
+        _worker_data = data
+        try:
+            return [function(*task) for task in tasks]
+        finally:
+            _worker_data = None
+    with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=_init_worker, initargs=(data,)) as pool:
+        return list(pool.map(function, *zip(*tasks)))
+
+
+class ModelStore:
+    """
+    Versioned training artifacts: a VersionedDirectory, like the CatalogStore, with one
+    sub-directory per run and a CURRENT file naming the live one.
+
+    A version holds regressor.joblib (the fitted preprocessing and random forest, a Pipeline
+    whose predict takes REGRESSOR_FEATURES), difficulty_model.npz (DifficultyModel) and
+    metrics.json.
+
+    Method:
+    write: saves the artifacts of a run as a new version and makes it CURRENT
+    load_regressor / load_difficulty_model / metrics: read the CURRENT (or a given) version
+    """
+    def __init__(self, path=DEFAULT_MODELS_PATH):
+        self.path = path
+        # The transformer cache lives next to the versions by default
+        self.versions = VersionedDirectory(path, 'Model version', ignore=['cache'])
+
+    def exists(self):
+        return self.versions.exists()
+
+    def current_version(self):
+        return self.versions.current_version()
+
+    def _version_dir(self, version):
+        return os.path.join(self.path, version or self.current_version())
+
+    def write(self, metrics, regressor=None, difficulty_model=None, version=None, keep=5):
+        import joblib
+        version, tmp_dir = self.versions.create(version)
+        if regressor is not None:
+            joblib.dump(regressor, os.path.join(tmp_dir, 'regressor.joblib'))
+        if difficulty_model is not None:
+            difficulty_model.save(os.path.join(tmp_dir, 'difficulty_model.npz'))
+        with open(os.path.join(tmp_dir, 'metrics.json'), 'w') as f:
+            json.dump(dict(metrics, version=version), f, indent=1)
+        self.versions.publish(version, tmp_dir, keep)
+        return version
+
+    def load_regressor(self, version=None):
+        import joblib
+        return joblib.load(os.path.join(self._version_dir(version), 'regressor.joblib'))
+
+    def load_difficulty_model(self, version=None):
+        return DifficultyModel.load(os.path.join(self._version_dir(version), 'difficulty_model.npz'))
+
+    def metrics(self, version=None):
+        with open(os.path.join(self._version_dir(version), 'metrics.json')) as f:
+            return json.load(f)
+
+
+def train_regressor(trails, cache, jobs, folds=5, grid=REGRESSOR_GRID, random_state=42):
+    """
+    Grid search of the random forest by K-fold cross-validation on the training split, then
+    the best candidate refitted on the whole training split and scored on the held-out one.
+    Returns (Pipeline, metrics).
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_squared_error, r2_score
+    from sklearn.model_selection import KFold, train_test_split
+    from sklearn.pipeline import Pipeline
+    data = prepare_trails(trails)
+    data = data.loc[data[REGRESSOR_TARGET].notna()]
+    train, test = train_test_split(data[REGRESSOR_FEATURES + [REGRESSOR_TARGET]], test_size=TEST_SIZE,
+                                   random_state=random_state)
+
+    # One transformer per fold, fitted on the fold's training rows only, shared by every candidate
+    fold_data = []
+    for fold_train, fold_val in KFold(folds).split(train):
+        fit_rows, val_rows = train.iloc[fold_train], train.iloc[fold_val]
+        _, (x_fit, x_val) = cache.fit_transform('regressor', make_regressor_transformer,
+                                                fit_rows[REGRESSOR_FEATURES], [val_rows[REGRESSOR_FEATURES]])
+        fold_data.append((x_fit, fit_rows[REGRESSOR_TARGET].to_numpy(), x_val, val_rows[REGRESSOR_TARGET].to_numpy()))
+
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    tasks = [(params, fold, random_state) for params in candidates for fold in range(folds)]
+    scores = np.array(run_tasks(_score_candidate, tasks, fold_data, jobs)).reshape(len(candidates), folds)
+    best = int(np.argmax(scores.mean(axis=1)))
+
+    transformer, (x_train, x_test) = cache.fit_transform('regressor', make_regressor_transformer,
+                                                         train[REGRESSOR_FEATURES], [test[REGRESSOR_FEATURES]])
+    forest = RandomForestRegressor(random_state=random_state, n_jobs=jobs, **candidates[best])
+    forest.fit(x_train, train[REGRESSOR_TARGET].to_numpy())
+    predicted = forest.predict(x_test)
+    forest.set_params(n_jobs=None)
+    metrics = {
+        'trails': int(len(data)),
+        'folds': folds,
+        'grid': [{'params': params, 'cv_r2': row.tolist(), 'mean_r2': float(row.mean()), 'std_r2': float(row.std())}
+                 for params, row in zip(candidates, scores)],
+        'best_params': candidates[best],
+        'holdout_r2': float(r2_score(test[REGRESSOR_TARGET], predicted)),
+        'holdout_mse': float(mean_squared_error(test[REGRESSOR_TARGET], predicted)),
+    }
+    return Pipeline([('preprocessor', transformer), ('regressor', forest)]), metrics
+
+
+def train_kmeans(trails, cache, jobs, k_values, previous=None):
+    """The TrailClustering k sweep on the cached transformer; returns (TrailClustering, DifficultyModel, metrics)."""
+    data = prepare_trails(trails)
+    transformer, (features,) = cache.fit_transform('clustering', make_transformer, data)
+    clustering = TrailClustering(k_values, n_jobs=jobs).fit(trails, prepared=(transformer, features))
+    # Keep the labels of the previous model, so a refit does not rename the clusters
+    model = DifficultyModel.from_clustering(clustering, previous)
+    clustering.cluster_labels = model.labels
+    metrics = {'silhouette': {str(k): score for k, score in clustering.silhouette_scores.items()},
+               'best_k': int(clustering.model.n_clusters)}
+    return clustering, model, metrics
+
+
+def train_hierarchical(trails, cache, jobs, k_values, sample_size=HIERARCHICAL_SAMPLE, random_state=42):
+    """Silhouette of average-linkage AgglomerativeClustering for each k, on a sample of the trails."""
+    data = prepare_trails(trails)
+    _, (features,) = cache.fit_transform('clustering', make_transformer, data)
+    if len(features) > sample_size:
+        rows = np.random.default_rng(random_state).choice(len(features), sample_size, replace=False)
+        features = features[np.sort(rows)]
+    scores = run_tasks(_fit_agglomerative, [(k,) for k in k_values], features, jobs)
+    return {'sample': int(len(features)), 'silhouette': {str(k): score for k, score in zip(k_values, scores)},
+            'best_k': int(k_values[int(np.argmax(scores))])}
+
+
+def train(trails, stages=STAGES, jobs=None, folds=5, k_values=range(4, 11), cache=None, previous=None,
+          grid=REGRESSOR_GRID):
+    """
+    Runs the given stages on a trail catalog. Returns (artifacts, metrics), artifacts holding
+    'regressor', 'clustering' and 'difficulty_model' for the stages that ran.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    cache = cache if cache is not None else TransformerCache()
+    k_values = list(k_values)
+    artifacts = {}
+    metrics = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'trails': int(len(trails)),
+               'data_hash': data_hash(trails), 'jobs': jobs, 'seconds': {}}
+    for stage in stages:
+        start = time.perf_counter()
+        if stage == 'regressor':
+            artifacts['regressor'], metrics['regressor'] = train_regressor(trails, cache, jobs, folds, grid)
+        elif stage == 'kmeans':
+            artifacts['clustering'], artifacts['difficulty_model'], metrics['kmeans'] = \
+                train_kmeans(trails, cache, jobs, k_values, previous)
+        elif stage == 'hierarchical':
+            metrics['hierarchical'] = train_hierarchical(trails, cache, jobs, k_values)
+        else:
+            raise ValueError(f"Unknown stage {stage!r}, expected one of {', '.join(STAGES)}")
+        metrics['seconds'][stage] = time.perf_counter() - start
+    metrics['transformer_cache'] = {'hits': cache.hits, 'misses': cache.misses}
+    return artifacts, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=TRAILS_CSV_PATH)
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: every CPU)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--k', type=int, nargs=2, default=[4, 10], metavar=('MIN', 'MAX'))
+    parser.add_argument('--grid', type=json.loads, default=REGRESSOR_GRID,
+                        help='random forest grid as JSON, e.g. \'{"n_estimators": [300, 1000]}\'')
+    parser.add_argument('--models', default=DEFAULT_MODELS_PATH, help='ModelStore directory')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="transformer cache directory, '' for none")
+    parser.add_argument('--publish', action='store_true',
+                        help='also write the difficulty model and Trail_Difficulty.csv the app reads')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    trails = pd.read_csv(args.csv)
+    store = ModelStore(args.models)
+    previous = None
+    if args.publish and os.path.exists(DEFAULT_MODEL_PATH):
+        previous = DifficultyModel.load(DEFAULT_MODEL_PATH)
+    elif store.exists():
+        try:
+            previous = store.load_difficulty_model()
+        except FileNotFoundError:
+            # The last run did not train the clustering
+            pass
+    artifacts, metrics = train(trails, args.stages, args.jobs, args.folds, range(args.k[0], args.k[1] + 1),
+                               TransformerCache(args.cache or None), previous, args.grid)
+    version = store.write(metrics, artifacts.get('regressor'), artifacts.get('difficulty_model'))
+
+    if 'regressor' in metrics:
+        best = metrics['regressor']
+        print(f"regressor: best {best['best_params']} holdout R2={best['holdout_r2']:.3f} MSE={best['holdout_mse']:.4f}")
+    for stage in ('kmeans', 'hierarchical'):
+        if stage in metrics:
+            scores = ' '.join(f"k={k}:{score:.3f}" for k, score in metrics[stage]['silhouette'].items())
+            print(f"{stage}: best k={metrics[stage]['best_k']} silhouette {scores}")
+    if args.publish and 'difficulty_model' in artifacts:
+        labeled = artifacts['clustering'].label(trails)
+        write_difficulty_csv(labeled, DIFFICULTY_CSV_PATH)
+        artifacts['difficulty_model'].save(DEFAULT_MODEL_PATH)
+        print(f"Published {len(labeled)} labeled trails to {DIFFICULTY_CSV_PATH}")
+    timings = ', '.join(f'{stage} {seconds:.1f}s' for stage, seconds in metrics['seconds'].items())
+    print(f"Saved version {version} to {args.models} in {time.perf_counter() - start:.1f}s ({timings}; "
+          f"transformer cache {metrics['transformer_cache']['hits']} hits, {metrics['transformer_cache']['misses']} misses)")
+
+
+if __name__ == "__main__":
+    main()
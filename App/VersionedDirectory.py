@@ -0,0 +1,89 @@
+import itertools
+import os
+import shutil
+import time
+
+
+_version_counter = itertools.count()
+
+
+def new_version():
+    """
+    A version name that sorts by creation time and never repeats: the time to the microsecond,
+    the process id and a per-process counter, so two writes in the same second (or from two
+    processes) never pick the same directory.
+    """
+    now = time.time()
+    return (f"{time.strftime('%Y%m%d%H%M%S', time.localtime(now))}{int(now % 1 * 1e6):06d}"
+            f"-{os.getpid()}-{next(_version_counter)}")
+
+
+class VersionedDirectory:
+    """
+    A directory of immutable versions, one sub-directory each, and a CURRENT file naming the
+    live one: the publishing shared by CatalogStore and the TrainModels ModelStore.
+
+    A version is written into a hidden temporary directory and renamed into place, so readers
+    never see a partial version. Its name is never reused, since readers may have any version
+    open, and pruning never removes the version CURRENT names.
+
+    Method:
+    current_version: returns the name of the live version
+    create: returns (version, temporary directory) for a new version
+    publish: moves a created version into place, makes it CURRENT and prunes the old ones
+    versions: returns the names of the stored versions, oldest first
+    """
+    def __init__(self, path, kind='Version', ignore=()):
+        """
+        Parameters:
+        - path (str): the directory
+        - kind (str): what the versions are, for error messages
+        - ignore (iterable): names of sub-directories that are not versions
+        """
+        self.path = path
+        self.kind = kind
+        self.ignore = set(ignore)
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'CURRENT'))
+
+    def current_version(self):
+        with open(os.path.join(self.path, 'CURRENT')) as f:
+            return f.read().strip()
+
+    def create(self, version=None):
+        """Raises ValueError if the version already exists instead of ever replacing it."""
+        version = version or new_version()
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(os.path.join(self.path, version)):
+            raise ValueError(f"{self.kind} {version} already exists in {self.path}")
+        tmp_dir = os.path.join(self.path, f'.{version}.tmp-{os.getpid()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        return version, tmp_dir
+
+    def publish(self, version, tmp_dir, keep):
+        """Renames tmp_dir to the version, points CURRENT at it and keeps the newest `keep` versions."""
+        # A version is never empty, so this fails rather than replaces one another writer
+        # published under the same name meanwhile
+        os.rename(tmp_dir, os.path.join(self.path, version))
+        # Readers either see the old or the new pointer, never a partial write
+        tmp_path = os.path.join(self.path, f'CURRENT.tmp-{os.getpid()}')
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, 'CURRENT'))
+        self.prune(keep, version)
+
+    def versions(self):
+        # Version names sort by creation time (new_version)
+        return sorted(d for d in os.listdir(self.path) if not d.startswith('.') and d not in self.ignore
+                      and os.path.isdir(os.path.join(self.path, d)))
+
+    def prune(self, keep, current):
+        # Never the version CURRENT names, even when another writer published it meanwhile
+        live = {current, self.current_version()}
+        for old in self.versions()[:-keep] if keep else []:
+            if old not in live:
+                shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
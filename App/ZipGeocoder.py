@@ -0,0 +1,232 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cachetools import TTLCache
+
+from TrailMetrics import get_metrics
+
+
+app_root = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TABLE_PATH = os.path.join(app_root, 'zip_centroids.sqlite')
+# Census ZCTA gazetteer (~33k ZIP centroids), the source of the table: python App/ZipGeocoder.py --seed
+GAZETTEER_URL = "https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2023_Gazetteer/2023_Gaz_zcta_national.zip"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search.php"
+
+
+class ZipGeocoder:
+    """
+    A geocoder that turns US ZIP codes into latitude and longitude without a network round trip.
+
+    Lookups go through an in-process LRU cache with a TTL, then a local SQLite table of ZIP
+    centroids that is read into memory once. Only ZIP codes missing from the table fall back
+    to Nominatim, through a pooled session, and whatever it returns is written back to the
+    table so the next process finds it locally.
+
+    The table is not part of the repository: it starts empty, and every ZIP goes to Nominatim
+    once, until it is seeded from the Census gazetteer (python App/ZipGeocoder.py --seed).
+
+    Method:
+    get_lat_long: returns (latitude, longitude) as floats, or (None, None) if the ZIP can't be located
+    locate: same as get_lat_long but raises ValueError for a ZIP that can't be located
+    import_csv: bulk loads ZIP centroids (e.g. the Census ZCTA gazetteer file) into the table
+    seed: imports the Census ZCTA gazetteer (GAZETTEER_URL)
+    """
+    def __init__(self, table_path=DEFAULT_TABLE_PATH, cache_size=4096, ttl=24 * 3600, miss_ttl=300,
+                 allow_network=True, timeout=5, min_interval=1.0, metrics=None):
+        """
+        Parameters:
+        - table_path (str): path of the SQLite ZIP table, created if it does not exist
+        - cache_size (int): number of ZIP codes kept in the LRU cache
+        - ttl (int): seconds a resolved ZIP stays cached
+        - miss_ttl (int): seconds an unresolved ZIP is remembered, so rate limits are not hammered
+        - allow_network (bool): whether ZIPs missing from the table may be looked up on Nominatim
+        - timeout (float): network timeout in seconds
+        - min_interval (float): minimum seconds between Nominatim requests (their usage policy is 1/s)
+        - metrics (TrailMetrics): where lookups are counted by source; defaults to the process-wide one
+        """
+        self.table_path = table_path
+        self.allow_network = allow_network
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._misses = TTLCache(maxsize=cache_size, ttl=miss_ttl)
+        self._table = None
+        self._session = None
+        self._lock = threading.Lock()
+        self._network_lock = threading.Lock()
+        self._last_request = 0.0
+        self.metrics = metrics if metrics is not None else get_metrics()
+
+    @staticmethod
+    def normalize_zip(zipcode):
+        # Accept 5 digit ZIPs, ZIP+4 and ZIPs that lost their leading zeros (e.g. read as int)
+        match = re.match(r'^\s*(\d{1,5})(?:-\d{4})?\s*$', str(zipcode))
+        if match is None:
+            return None
+        return match.group(1).zfill(5)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.table_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS zip_centroids "
+                     "(zip TEXT PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL) WITHOUT ROWID")
+        return conn
+
+    def _load_table(self):
+        # The table is small (~33k ZCTAs), so it is read once and served from a dict
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    conn = self._connect()
+                    try:
+                        rows = conn.execute("SELECT zip, latitude, longitude FROM zip_centroids").fetchall()
+                    finally:
+                        conn.close()
+                    self._table = {zipcode: (lat, lon) for zipcode, lat, lon in rows}
+        return self._table
+
+    def _persist(self, rows):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO zip_centroids (zip, latitude, longitude) VALUES (?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+    def _get_session(self):
+        # requests is only imported once a ZIP has to be looked up on the network
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            session = requests.Session()
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=retry))
+            session.headers['User-Agent'] = 'TrailsToHealth/1.0'
+            self._session = session
+        return self._session
+
+    def _fetch(self, zipcode):
+        import requests
+        params = {"q": zipcode, "format": "jsonv2", "countrycodes": "US", "limit": 1}
+        with self._network_lock:
+            wait = self.min_interval - (time.monotonic() - self._last_request)
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+            try:
+                response = self._get_session().get(NOMINATIM_URL, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                response_json = response.json()
+            except (requests.RequestException, ValueError):
+                return None
+        if len(response_json) == 0:
+            return None
+        return float(response_json[0]['lat']), float(response_json[0]['lon'])
+
+    def get_lat_long(self, zipcode):
+        zipcode = self.normalize_zip(zipcode)
+        if zipcode is None:
+            self.metrics.increment('geocoder_lookups_total', source='invalid')
+            return None, None
+        # cachetools caches are not thread-safe, so every access goes through the lock
+        with self._lock:
+            location = self._cache.get(zipcode)
+            missed = zipcode in self._misses
+        if location is not None:
+            self.metrics.increment('geocoder_lookups_total', source='cache')
+            return location
+        if missed:
+            self.metrics.increment('geocoder_lookups_total', source='cached_miss')
+            return None, None
+
+        table = self._load_table()
+        location = table.get(zipcode)
+        source = 'table'
+        if location is None and self.allow_network:
+            # The slow path: a Nominatim request, rate limited to one per min_interval
+            source = 'network'
+            location = self._fetch(zipcode)
+            if location is not None:
+                with self._lock:
+                    table[zipcode] = location
+                try:
+                    self._persist([(zipcode, location[0], location[1])])
+                except sqlite3.Error:
+                    # A read-only deployment still keeps the result in memory
+                    pass
+        with self._lock:
+            if location is None:
+                self._misses[zipcode] = True
+            else:
+                self._cache[zipcode] = location
+        self.metrics.increment('geocoder_lookups_total', source=source if location is not None else 'miss')
+        return location if location is not None else (None, None)
+
+    def locate(self, zipcode):
+        # Like get_lat_long, but an unknown ZIP is an error the caller can report to the user
+        latitude, longitude = self.get_lat_long(zipcode)
+        if latitude is None:
+            raise ValueError(f"Could not find a location for zip code {zipcode}")
+        return latitude, longitude
+
+    def import_csv(self, csv_path, zip_column='GEOID', lat_column='INTPTLAT', lon_column='INTPTLONG', sep=None):
+        """
+        Loads ZIP centroids from a delimited file (a path or URL, optionally zipped) into the
+        table and returns the number of rows. The defaults match the Census ZCTA gazetteer
+        (tab separated, GEOID/INTPTLAT/INTPTLONG).
+        """
+        import pandas as pd
+        df = pd.read_csv(csv_path, sep=sep, engine='python', dtype={zip_column: str})
+        df.columns = df.columns.str.strip()
+        df = df.dropna(subset=[zip_column, lat_column, lon_column])
+        rows = [(self.normalize_zip(z), float(lat), float(lon))
+                for z, lat, lon in zip(df[zip_column], df[lat_column], df[lon_column])
+                if self.normalize_zip(z) is not None]
+        self._persist(rows)
+        with self._lock:
+            self._table = None
+            self._cache.clear()
+            self._misses.clear()
+        return len(rows)
+
+    def seed(self, url=GAZETTEER_URL):
+        # The gazetteer is a zipped tab separated file, which pandas reads straight from the URL
+        return self.import_csv(url, sep='\t')
+
+
+_default_geocoder = None
+_default_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Returns the process-wide geocoder shared by the recommenders."""
+    global _default_geocoder
+    if _default_geocoder is None:
+        with _default_lock:
+            if _default_geocoder is None:
+                _default_geocoder = ZipGeocoder()
+    return _default_geocoder
+
+
+def get_lat_long(zipcode):
+    return get_geocoder().get_lat_long(zipcode)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or query the local ZIP centroid table.")
+    parser.add_argument('--seed', action='store_true', help=f'download and load the Census gazetteer ({GAZETTEER_URL})')
+    parser.add_argument('--import-csv', help='gazetteer file (path or URL) to load into the table')
+    parser.add_argument('--table', default=DEFAULT_TABLE_PATH)
+    parser.add_argument('zips', nargs='*')
+    args = parser.parse_args()
+    geocoder = ZipGeocoder(table_path=args.table)
+    if args.seed:
+        print(f"Imported {geocoder.seed()} ZIP codes into {args.table}")
+    if args.import_csv:
+        print(f"Imported {geocoder.import_csv(args.import_csv)} ZIP codes into {args.table}")
+    for z in args.zips:
+        print(z, geocoder.get_lat_long(z))
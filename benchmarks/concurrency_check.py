@@ -0,0 +1,91 @@
+"""
+Runs many recommendation queries from different ZIP codes at the same time against one
+shared TrailRecommendation and TrailDifficulty, and checks every answer against the same
+query run alone on a separately built TrailRecommendation whose result cache is cleared
+before every query, so the reference is always computed from scratch and the shared
+instance starts with a cold cache. Exits with status 1 if any concurrent answer differs.
+
+Also run as a test by tests/test_concurrency.py.
+
+Usage: python benchmarks/concurrency_check.py [--trails 20000] [--queries 400] [--threads 32]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_catalog import (DIFFICULTY_LABELS, ZIP_CENTROIDS, make_catalog,  # noqa: E402
+                               make_difficulty_catalog, make_geocoder, make_user_inputs)
+from TrailDifficulty import TrailDifficulty  # noqa: E402
+from TrailRecommedations import TrailRecommendation  # noqa: E402
+
+
+def fingerprint(result):
+    return list(result.index), np.round(result['Distance From You(miles)'].to_numpy(dtype=float), 9).tolist()
+
+
+def build_recommender(df, geocoder):
+    with contextlib.redirect_stdout(io.StringIO()):
+        recommender = TrailRecommendation(df, geocoder=geocoder)
+        recommender.preprocess_data()
+    return recommender
+
+
+def check(trails=20000, queries=400, threads=32, repeats=4):
+    """
+    Returns (concurrent queries, mismatches, result cache stats of the shared recommender).
+    """
+    geocoder = make_geocoder()
+    df = make_catalog(trails)
+    recommender = build_recommender(df, geocoder)
+    reference = build_recommender(df.copy(), geocoder)
+    difficulty = TrailDifficulty(make_difficulty_catalog(trails), geocoder=geocoder)
+
+    cases = [('recommend', user_input) for user_input in make_user_inputs(queries)]
+    cases += [('difficulty', {'Zip': z, 'Difficulty': label}) for z in ZIP_CENTROIDS for label in DIFFICULTY_LABELS]
+
+    def expected_result(case):
+        kind, user_input = case
+        if kind == 'difficulty':
+            return fingerprint(difficulty.get_recommendations(user_input))
+        reference.result_cache.invalidate()
+        return fingerprint(reference.get_recommendations(user_input))
+
+    def run(case):
+        kind, user_input = case
+        model = recommender if kind == 'recommend' else difficulty
+        return fingerprint(model.get_recommendations(user_input))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = [expected_result(case) for case in cases]
+        # Every query runs several times, interleaved with queries from other ZIP codes
+        jobs = list(range(len(cases))) * repeats
+        random.Random(0).shuffle(jobs)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(lambda i: run(cases[i]), jobs))
+
+    failures = sum(result != expected[i] for i, result in zip(jobs, results))
+    return len(jobs), failures, recommender.result_cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trails', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    jobs, failures, stats = check(args.trails, args.queries, args.threads)
+    print(f"{jobs} concurrent queries on {args.threads} threads, {failures} mismatches "
+          f"(shared result cache: {stats['hits']} hits, {stats['misses']} misses)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares the batched distance engine in App/TrailDistance.py against the per-row
+`df.apply(geodesic)` path the recommenders used before.
+
+Usage: python benchmarks/distance_benchmark.py [--sizes 10000 100000 1000000] [--full]
+
+The apply path takes minutes at 1M rows, so unless --full is given it is timed on
+a 10k-row sample and scaled linearly (marked with '*' in the output).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'App'))
+from TrailDistance import distance_miles  # noqa: E402
+
+USER_LAT, USER_LONG = 43.0481, -76.1474  # Syracuse, NY
+APPLY_SAMPLE = 10000
+
+
+def make_trails(n, seed=0):
+    # Random points over the New York State bounding box
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'latitude': rng.uniform(40.5, 45.0, n), 'longitude': rng.uniform(-79.8, -71.8, n)})
+
+
+def time_apply(df):
+    start = time.perf_counter()
+    result = df.apply(lambda row: geodesic((USER_LAT, USER_LONG), (row['latitude'], row['longitude'])).miles, axis=1)
+    return time.perf_counter() - start, result.values
+
+
+def time_batched(df, method):
+    start = time.perf_counter()
+    result = distance_miles(USER_LAT, USER_LONG, df['latitude'].values, df['longitude'].values, method=method)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--full', action='store_true', help='time the apply path on every row instead of a sample')
+    args = parser.parse_args()
+
+    print(f"{'trails':>9} {'apply (s)':>11} {'haversine (s)':>14} {'geodesic (s)':>13} "
+          f"{'speedup':>8} {'max err geodesic (mi)':>22} {'max err haversine (mi)':>23}")
+    for n in args.sizes:
+        df = make_trails(n)
+        sample = df if args.full or n <= APPLY_SAMPLE else df.iloc[:APPLY_SAMPLE]
+        apply_time, reference = time_apply(sample)
+        extrapolated = len(sample) < n
+        if extrapolated:
+            apply_time *= n / len(sample)
+        hav_time, hav = time_batched(df, 'haversine')
+        geo_time, geo = time_batched(df, 'geodesic')
+        geo_err = np.max(np.abs(geo[:len(sample)] - reference))
+        hav_err = np.max(np.abs(hav[:len(sample)] - reference))
+        print(f"{n:>9} {apply_time:>10.3f}{'*' if extrapolated else ' '} {hav_time:>14.4f} {geo_time:>13.4f} "
+              f"{apply_time / geo_time:>7.0f}x {geo_err:>22.2e} {hav_err:>23.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Startup-time report: what importing the app's entry modules costs in a fresh interpreter,
+broken down by top-level package (python -X importtime), so a heavy import that creeps back
+onto the startup path shows up.
+
+sklearn, scipy, requests and geopy must not be imported at startup: sklearn is only needed
+to build a catalog from the CSV or to fit the clustering, requests only for a ZIP that has to
+be looked up on the network. A module that imports one of them makes the exit status 1, as
+does a module that got slower than baseline * (1 + --threshold).
+
+Usage: python benchmarks/import_time_report.py [--modules TrailCore TrailService StaticAssets]
+           [--top 15] [--out imports.json] [--baseline imports.json] [--threshold 0.25]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(benchmarks_dir, '..', 'App')
+DEFAULT_MODULES = ['TrailCore', 'TrailService', 'StaticAssets']
+# Packages only the code paths that need them may import
+LAZY_PACKAGES = ['sklearn', 'scipy', 'requests', 'urllib3', 'geopy']
+
+
+def import_times(module):
+    """(total seconds, {top-level package: seconds}) of importing module in a new interpreter."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    packages = {}
+    total = 0.0
+    # Lines look like "import time:      1234 |       5678 |   package.module"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+        if name == module:
+            total = int(cumulative_us) / 1e6
+    return total, packages
+
+
+def report(modules, repeat):
+    results = []
+    for module in modules:
+        # Best of several runs, so a cold page cache does not dominate
+        total, packages = min((import_times(module) for _ in range(repeat)), key=lambda run: run[0])
+        results.append({'module': module, 'seconds': total, 'packages': packages,
+                        'lazy_imported': [package for package in LAZY_PACKAGES if package in packages]})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10, help='packages shown per module')
+    parser.add_argument('--out', default=None, help='write the results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    results = report(args.modules, args.repeat)
+    failures = []
+    for result in results:
+        print(f"{result['module']}: {result['seconds'] * 1000:.1f} ms")
+        top = sorted(result['packages'].items(), key=lambda item: -item[1])[:args.top]
+        for package, seconds in top:
+            print(f"    {package:<24} {seconds * 1000:>9.1f} ms")
+        if result['lazy_imported']:
+            print(f"    imports {', '.join(result['lazy_imported'])} at startup")
+            failures.append(result['module'])
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            previous = {r['module']: r['seconds'] for r in json.load(f)['results']}
+        print(f"\n{'module':<20} {'baseline (ms)':>14} {'now (ms)':>11} {'change':>8}")
+        for result in results:
+            before = previous.get(result['module'])
+            if before is None:
+                continue
+            change = result['seconds'] / before - 1 if before > 0 else 0.0
+            flag = ' REGRESSION' if change > args.threshold else ''
+            print(f"{result['module']:<20} {before * 1000:>14.1f} {result['seconds'] * 1000:>11.1f} {change:>+8.0%}{flag}")
+            if flag:
+                failures.append(result['module'])
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Local load test of the JSON service (App/TrailService.py): starts the service on a synthetic
+catalog, sends requests from many concurrent keep-alive connections and reports p50/p99
+latency and requests per second for each endpoint.
+
+Usage: python benchmarks/load_test.py [--trails 100000] [--requests 2000] [--concurrency 32] [--workers 2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_dir)
+from synthetic_catalog import (DIFFICULTY_LABELS, ZIP_CENTROIDS, make_catalog,  # noqa: E402
+                               make_difficulty_catalog, make_geocoder)
+
+SERVICE = os.path.join(benchmarks_dir, '..', 'App', 'TrailService.py')
+
+
+def make_requests(n, seed=0):
+    """(path, body) pairs: mostly single recommendations, some difficulty queries and small batches."""
+    rng = random.Random(seed)
+
+    def recommendation():
+        return {'zip': rng.choice(list(ZIP_CENTROIDS)),
+                'exploration_mode': rng.choice(['Walk', 'Bike', 'Horse riding', 'Snowmobile', 'Accessible']),
+                'elevation_gain': rng.randint(1, 300), 'trail_length': rng.randint(1, 8),
+                'experience': rng.choice(['Beginner', 'Moderate', 'Experienced']), 'radius': rng.choice([0, 10, 50, 100])}
+
+    requests = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.7:
+            requests.append(('/recommendations', recommendation()))
+        elif kind < 0.95:
+            requests.append(('/difficulty', {'zip': rng.choice(list(ZIP_CENTROIDS)), 'difficulty': rng.choice(DIFFICULTY_LABELS)}))
+        else:
+            requests.append(('/recommendations/batch', {'requests': [recommendation() for _ in range(16)]}))
+    return requests
+
+
+async def send(reader, writer, path, body):
+    payload = json.dumps(body).encode('utf-8')
+    writer.write(f'POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(payload)}\r\n\r\n'.encode('latin-1') + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_load(port, requests, concurrency):
+    queue = list(reversed(requests))
+    latencies = {}
+    statuses = {}
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while queue:
+            path, body = queue.pop()
+            start = time.perf_counter()
+            status = await send(reader, writer, path, body)
+            latencies.setdefault(path, []).append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, statuses, time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trails', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'App'))
+    from CatalogStore import build_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'trails.csv')
+        store_path = os.path.join(tmp, 'catalog')
+        difficulty_csv = os.path.join(tmp, 'difficulty.csv')
+        make_catalog(args.trails).to_csv(csv_path, index=False)
+        make_difficulty_catalog(args.trails).to_csv(difficulty_csv, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_store(csv_path, store_path)
+        make_geocoder(tmp)
+
+        port = free_port()
+        log_path = os.path.join(tmp, 'service.log')
+        with open(log_path, 'w') as log:
+            service = subprocess.Popen(
+                [sys.executable, SERVICE, '--port', str(port), '--workers', str(args.workers), '--timeout', str(args.timeout),
+                 '--store', store_path, '--difficulty-csv', difficulty_csv,
+                 '--zip-table', os.path.join(tmp, 'zip_centroids.sqlite'), '--offline'],
+                stdout=log, stderr=subprocess.STDOUT)
+        try:
+            started = time.perf_counter()
+            # The service prints its address once every worker has loaded the catalog
+            while not any(line.startswith('Serving') for line in open(log_path)):
+                if service.poll() is not None:
+                    raise SystemExit(f"The service did not start:\n{open(log_path).read()}")
+                time.sleep(0.05)
+            print(f"service ready in {time.perf_counter() - started:.2f}s with {args.workers} worker(s), "
+                  f"{args.trails} trails, {args.concurrency} connections")
+
+            requests = make_requests(args.requests)
+            latencies, statuses, elapsed = asyncio.run(run_load(port, requests, args.concurrency))
+        finally:
+            service.terminate()
+            service.wait()
+
+    print(f"{'endpoint':<24} {'requests':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+    for path, values in sorted(latencies.items()):
+        values = np.array(values) * 1000
+        print(f"{path:<24} {len(values):>9} {np.percentile(values, 50):>9.1f} {np.percentile(values, 99):>9.1f} "
+              f"{values.max():>9.1f}")
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s: {total / elapsed:.0f} requests/s, status codes {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Offline benchmark of the tiled trail map (App/TrailTiles.py) as the catalog grows, on synthetic
+catalogs with synthetic trail lines (see synthetic_catalog.py):
+
+    build          seconds to compute every tile (TrailTileSet.build)
+    tiles          number of non-empty tiles, and their total bytes
+    monolithic     bytes of one GeoJSON with every trail at full detail, what a single map
+                   page with every trail baked in (the old map.html) has to ship and render
+    state/region/local
+                   bytes the page fetches for a 1024 x 768 viewport over the state (zoom 7),
+                   around Syracuse (zoom 10) and zoomed in on it (zoom 13), and the tile count
+    highlight      bytes of the top-20 overlay sent with a query's results
+
+Results are written as JSON (--out) and can be compared with a saved baseline: a build time or
+viewport payload that grew by more than --threshold makes the exit status 1.
+
+Usage: python benchmarks/map_benchmark.py [--sizes 1000 10000 100000] [--points-only]
+           [--out map.json] [--baseline map.json] [--threshold 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_catalog import make_catalog, make_trail_geometries  # noqa: E402
+from TrailTiles import TILE_SIZE, TrailTileSet, highlight_layer, mercator, tiles_in_view, unmercator  # noqa: E402
+
+VIEWPORT = (1024, 768)
+# (name, latitude, longitude, zoom) of the viewports measured
+VIEWS = [('state', 42.9, -75.5, 7), ('region', 43.04, -76.13, 10), ('local', 43.04, -76.13, 13)]
+
+
+def view_bounds(lat, lon, zoom):
+    """(south, west, north, east) of a VIEWPORT sized map centered on (lat, lon)."""
+    x, y = mercator(lat, lon)
+    half_width, half_height = (size / 2 / (TILE_SIZE * (1 << zoom)) for size in VIEWPORT)
+    north, west = unmercator(x - half_width, y - half_height)
+    south, east = unmercator(x + half_width, y + half_height)
+    return float(south), float(west), float(north), float(east)
+
+
+def monolithic_bytes(df, geometries):
+    """Bytes of one FeatureCollection of every trail, lines at full detail."""
+    features = []
+    for i, (lat, lon, name, site) in enumerate(zip(df['latitude'], df['longitude'], df['Name'], df['site_name'])):
+        if geometries is None:
+            geometry = {'type': 'Point', 'coordinates': [round(lon, 5), round(lat, 5)]}
+        else:
+            geometry = {'type': 'LineString', 'coordinates': np.round(geometries[i][0], 5).tolist()}
+        features.append({'type': 'Feature', 'geometry': geometry, 'properties': {'name': name, 'site': site}})
+    return len(json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':')).encode('utf-8'))
+
+
+def run(sizes, points_only):
+    results = []
+    for n in sizes:
+        df = make_catalog(n)
+        df['Length(miles)'] = np.round(df['Shape_Leng'] * 0.000621, 2)
+        geometries = None if points_only else make_trail_geometries(df)
+        start = time.perf_counter()
+        tile_set = TrailTileSet.build(df, geometries=geometries)
+        result = {'trails': n, 'build_seconds': time.perf_counter() - start, 'tiles': len(tile_set.tiles),
+                  'tile_bytes': tile_set.manifest['bytes'], 'monolithic_bytes': monolithic_bytes(df, geometries)}
+        for name, lat, lon, zoom in VIEWS:
+            keys = tiles_in_view(*view_bounds(lat, lon, zoom), zoom)
+            result[f'{name}_bytes'] = sum(len(tile_set.tile(*key).encode('utf-8')) for key in keys)
+            result[f'{name}_tiles'] = sum(1 for key in keys if key in tile_set.tiles)
+        result['highlight_bytes'] = len(highlight_layer(df.iloc[:20]).encode('utf-8'))
+        results.append(result)
+        print(f"{n:>8} {result['build_seconds']:>9.2f} {result['tiles']:>7} {result['tile_bytes'] / 2 ** 20:>9.1f} "
+              f"{result['monolithic_bytes'] / 2 ** 20:>11.2f} "
+              + ' '.join(f"{result[f'{name}_bytes'] / 1024:>9.1f} ({result[f'{name}_tiles']:>2})" for name, *_ in VIEWS)
+              + f" {result['highlight_bytes'] / 1024:>9.1f}", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of the build time and viewport payloads found in the baseline; returns the regressions."""
+    previous = {r['trails']: r for r in baseline['results']}
+    metrics = ['build_seconds'] + [f'{name}_bytes' for name, *_ in VIEWS]
+    regressions = []
+    print(f"\n{'trails':>8} {'metric':<15} {'baseline':>12} {'now':>12} {'change':>8}")
+    for result in results:
+        before = previous.get(result['trails'])
+        if before is None:
+            continue
+        for metric in metrics:
+            change = result[metric] / before[metric] - 1 if before.get(metric) else 0.0
+            flag = ' REGRESSION' if change > threshold else ''
+            print(f"{result['trails']:>8} {metric:<15} {before[metric]:>12.3f} {result[metric]:>12.3f} {change:>+8.0%}{flag}")
+            if flag:
+                regressions.append((result['trails'], metric))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--points-only', action='store_true', help='no trail lines, like the current catalog')
+    parser.add_argument('--out', default=None, help='write the results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed growth, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    print(f"{'trails':>8} {'build (s)':>9} {'tiles':>7} {'all (MB)':>9} {'single (MB)':>11} "
+          + ' '.join(f"{name + ' (KB)':>14}" for name, *_ in VIEWS) + f" {'top 20 (KB)':>9}")
+    results = run(args.sizes, args.points_only)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'points_only': args.points_only,
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) grew by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Memory report of the trail catalog: bytes per trail of the raw catalog as read from the CSV
+(what every worker used to keep) and of the compact catalog, component by component:
+
+    dataframe      the catalog DataFrame (uint8 flags, category codes, float32 measures)
+    features       the bit-packed feature masks (TrailFeatures)
+    spatial_index  coordinates, sort order and cells of the spatial index
+    keys           trail keys and content hashes used by catalog refreshes
+    text_store     the site address, phone, description and amenities (TrailTextStore)
+
+It also reports the private RSS of a fresh worker process that maps the store, the number
+that bounds how many workers fit on a host.
+
+Usage: python benchmarks/memory_report.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_dir)
+from synthetic_catalog import make_catalog, make_geocoder  # noqa: E402
+from CatalogStore import CatalogStore  # noqa: E402
+from TrailRecommedations import TrailRecommendation  # noqa: E402
+
+WORKER = r'''
+import json, sys
+sys.path.insert(0, {app_dir!r})
+from CatalogStore import CatalogStore
+before = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+recommender = CatalogStore({store_path!r}).load()
+after = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+kb = lambda status, key: int(status.get(key, '0 kB').split()[0])
+print(json.dumps({{'rss_anon_kb': kb(after, 'RssAnon') - kb(before, 'RssAnon'),
+                  'rss_file_kb': kb(after, 'RssFile') - kb(before, 'RssFile')}}))
+'''
+
+
+def components(recommender):
+    """Bytes of each part of a preprocessed catalog."""
+    index = recommender.spatial_index
+    return {
+        'dataframe': int(recommender.df.memory_usage(deep=True).sum()),
+        'features': int(recommender.feature_matrix.nbytes),
+        'spatial_index': int(sum(a.nbytes for a in (index.latitudes, index.longitudes, index.order, index.sorted_cells))),
+        'keys': int(recommender.row_keys.nbytes + recommender.row_hashes.nbytes),
+        'text_store': int(recommender.text_store.nbytes),
+    }
+
+
+def worker_memory(store_path):
+    code = WORKER.format(app_dir=os.path.join(benchmarks_dir, '..', 'App'), store_path=store_path)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    geocoder = make_geocoder()
+    print(f"{'trails':>8} {'raw CSV':>9} {'compact':>9} {'dataframe':>10} {'features':>9} {'spatial':>8} {'keys':>6} "
+          f"{'text':>6} {'worker private':>15} {'worker mapped':>14}   (bytes per trail)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            csv_path = os.path.join(tmp, f'trails_{n}.csv')
+            make_catalog(n).to_csv(csv_path, index=False)
+            raw = pd.read_csv(csv_path)
+            raw_bytes = raw.memory_usage(deep=True).sum()
+            recommender = TrailRecommendation(raw, geocoder=geocoder)
+            with contextlib.redirect_stdout(io.StringIO()):
+                recommender.preprocess_data()
+            parts = components(recommender)
+            store_path = os.path.join(tmp, f'store_{n}')
+            CatalogStore(store_path).write(recommender)
+            worker = worker_memory(store_path)
+            print(f"{n:>8} {raw_bytes / n:>9.0f} {sum(parts.values()) / n:>9.0f} {parts['dataframe'] / n:>10.0f} "
+                  f"{parts['features'] / n:>9.1f} {parts['spatial_index'] / n:>8.0f} {parts['keys'] / n:>6.0f} "
+                  f"{parts['text_store'] / n:>6.1f} {worker['rss_anon_kb'] * 1024 / n:>15.0f} "
+                  f"{worker['rss_file_kb'] * 1024 / n:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
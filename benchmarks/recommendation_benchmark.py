@@ -0,0 +1,189 @@
+"""
+Benchmark suite for the recommendation hot paths, on synthetic catalogs with the real schema
+(see synthetic_catalog.py) and an offline geocoder, so it runs without data files or network.
+
+Each stage is timed on its own (median of --repeat runs) and then run once more under
+tracemalloc for its peak Python/NumPy allocation:
+
+    preprocess       TrailRecommendation.preprocess_data
+    encode           encode_users for one user
+    geocode          ZIP lookup (warm cache)
+    distance         distances from the user to every trail
+    radius_query     spatial index query within 50 miles
+    similarity       feature matrix x user vector
+    ranking          top 20 of the similarity scores
+    recommend        TrailRecommendation.get_recommendations, result cache bypassed
+    recommend_cached TrailRecommendation.get_recommendations, result cache hit
+    amenity_filter   TrailAmenityIndex.trail_mask of an amenity and a keyword, every trail
+    recommend_filter get_recommendations with that filter, result cache bypassed
+    difficulty       TrailDifficulty.get_recommendations
+    difficulty_filter the same with that filter
+    render_html      the Recommendation page's HTML table (TrailRender, renderer already built)
+    render_json      the service's JSON body of the same results
+
+Results are written as JSON (--out) and can be compared with a saved baseline: a stage that
+got slower than baseline * (1 + --threshold) is reported and makes the exit status 1.
+
+Usage: python benchmarks/recommendation_benchmark.py [--sizes 1000 10000 100000 1000000]
+           [--out results.json] [--baseline baseline.json] [--threshold 0.25]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_catalog import make_catalog, make_difficulty_catalog, make_geocoder, make_user_inputs  # noqa: E402
+import TrailCore  # noqa: E402
+from TrailDifficulty import TrailDifficulty  # noqa: E402
+from TrailDistance import distance_miles  # noqa: E402
+from TrailRanking import top_k  # noqa: E402
+from TrailRecommedations import RESULT_SIZE, TrailRecommendation  # noqa: E402
+
+
+def measure(function, repeat):
+    """(median seconds, peak MB) of function(); the peak comes from one extra traced run."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()  # warm-up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return statistics.median(timings), peak / 2 ** 20
+
+
+def stages(n, geocoder, seed=0):
+    """(stage name, function) pairs for a catalog of n trails."""
+    raw = make_catalog(n, seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        recommender = TrailRecommendation(raw, geocoder=geocoder)
+        recommender.preprocess_data()
+    difficulty = TrailDifficulty(make_difficulty_catalog(n, seed), geocoder=geocoder)
+    user_input = dict(make_user_inputs(1, seed)[0], radius=50)
+    lat, lon = geocoder.locate(user_input['Zip'])
+    user_vector = recommender.encode_users([user_input])[0]
+    scores = recommender.feature_matrix @ user_vector
+    latitudes, longitudes = recommender.spatial_index.latitudes, recommender.spatial_index.longitudes
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = recommender.get_recommendations(user_input)
+    renderer = TrailCore.recommendation_renderer(recommender)
+    # "bike trails near a picnic area": the most common amenity and a description term
+    index = recommender.amenity_index
+    filters = {'amenities': [index.amenities[int(np.argmax(np.unpackbits(
+                   index.bitsets.view(np.uint8), axis=1, bitorder='little').sum(axis=0)[:len(index.amenities)]))]],
+               'keywords': 'lake'}
+    filtered_input = dict(user_input, **filters)
+    difficulty_input = {'Zip': user_input['Zip'], 'Difficulty': difficulty.df['Difficulty_rating_KModes'].iloc[0]}
+
+    def preprocess():
+        TrailRecommendation(raw, geocoder=geocoder).preprocess_data()
+
+    def recommend():
+        recommender.result_cache.invalidate()
+        recommender.get_recommendations(user_input)
+
+    def recommend_filter():
+        recommender.result_cache.invalidate()
+        recommender.get_recommendations(filtered_input)
+
+    return [
+        ('preprocess', preprocess),
+        ('encode', lambda: recommender.encode_users([user_input])),
+        ('geocode', lambda: geocoder.locate(user_input['Zip'])),
+        ('distance', lambda: distance_miles(lat, lon, latitudes, longitudes)),
+        ('radius_query', lambda: recommender.spatial_index.query_radius(lat, lon, 50)),
+        ('similarity', lambda: recommender.feature_matrix @ user_vector),
+        ('ranking', lambda: top_k(scores, RESULT_SIZE)),
+        ('recommend', recommend),
+        ('recommend_cached', lambda: recommender.get_recommendations(user_input)),
+        ('amenity_filter', lambda: index.trail_mask(filters['amenities'], filters['keywords'])),
+        ('recommend_filter', recommend_filter),
+        ('difficulty', lambda: difficulty.get_recommendations(difficulty_input)),
+        ('difficulty_filter', lambda: difficulty.get_recommendations(dict(difficulty_input, **filters))),
+        ('render_html', lambda: renderer.html(result)),
+        ('render_json', lambda: renderer.json(result, TrailCore.RECOMMENDATION_COLUMNS)),
+    ]
+
+
+def run(sizes, repeat, only=None):
+    geocoder = make_geocoder()
+    results = []
+    for n in sizes:
+        for stage, function in stages(n, geocoder):
+            if only and stage not in only:
+                continue
+            # The slow stages get fewer repeats on big catalogs
+            seconds, peak_mb = measure(function, 1 if stage == 'preprocess' and n >= 100000 else repeat)
+            results.append({'trails': n, 'stage': stage, 'seconds': seconds, 'peak_mb': round(peak_mb, 3)})
+            print(f"{n:>8} {stage:<17} {seconds * 1000:>11.3f} {peak_mb:>10.2f}", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of every stage found in the baseline; returns the regressions."""
+    previous = {(r['trails'], r['stage']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    print(f"\n{'trails':>8} {'stage':<17} {'baseline (ms)':>14} {'now (ms)':>11} {'change':>8}")
+    for result in results:
+        before = previous.get((result['trails'], result['stage']))
+        if before is None:
+            continue
+        change = result['seconds'] / before - 1 if before > 0 else 0.0
+        flag = ' REGRESSION' if change > threshold else ''
+        print(f"{result['trails']:>8} {result['stage']:<17} {before * 1000:>14.3f} {result['seconds'] * 1000:>11.3f} "
+              f"{change:>+8.0%}{flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stages', nargs='+', default=None, help='only run these stages')
+    parser.add_argument('--out', default=None, help='write the results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    print(f"{'trails':>8} {'stage':<17} {'median (ms)':>11} {'peak (MB)':>10}")
+    results = run(args.sizes, args.repeat, args.stages)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cold-start benchmark: a fresh worker process loading the catalog from the CSV
+(read_csv + preprocess_data) versus mapping the binary catalog written by
+App/CatalogStore.py. Each measurement runs in its own interpreter, with a
+synthetic catalog, and reports import time, load time and the worker's memory.
+
+Private RSS (RssAnon) is the memory a worker does not share; the store's
+memory-mapped arrays show up as RssFile, which the page cache shares between
+every worker on the host.
+
+Usage: python benchmarks/startup_benchmark.py [--sizes 10000 100000 500000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_dir)
+from synthetic_catalog import make_catalog  # noqa: E402
+
+WORKER = r'''
+import contextlib, io, json, sys, time
+sys.path.insert(0, {app_dir!r})
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import pandas as pd
+    from TrailRecommedations import TrailRecommendation
+    from CatalogStore import CatalogStore
+    imported = time.perf_counter()
+    if {mode!r} == 'csv':
+        recommender = TrailRecommendation(pd.read_csv({csv_path!r}))
+        recommender.preprocess_data()
+    else:
+        recommender = CatalogStore({store_path!r}).load()
+loaded = time.perf_counter()
+status = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+kb = lambda key: int(status.get(key, '0 kB').split()[0])
+print(json.dumps({{'import_seconds': imported - start, 'seconds': loaded - imported,
+                  'rss_kb': kb('VmRSS'), 'rss_anon_kb': kb('RssAnon'), 'rss_file_kb': kb('RssFile')}}))
+'''
+
+
+def run_worker(mode, csv_path, store_path):
+    code = WORKER.format(app_dir=os.path.join(benchmarks_dir, '..', 'App'), mode=mode,
+                         csv_path=csv_path, store_path=store_path)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'App'))
+    from CatalogStore import build_store
+
+    print(f"{'trails':>8} {'source':>7} {'imports (s)':>12} {'load (s)':>9} {'RSS (MB)':>9} {'private (MB)':>13} "
+          f"{'shared file (MB)':>17}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            csv_path = os.path.join(tmp, f'trails_{n}.csv')
+            store_path = os.path.join(tmp, f'store_{n}')
+            make_catalog(n).to_csv(csv_path, index=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_store(csv_path, store_path)
+            for mode in ('csv', 'store'):
+                # Best of several runs, so a one-off page cache miss does not dominate
+                runs = [run_worker(mode, csv_path, store_path) for _ in range(args.repeat)]
+                best = min(runs, key=lambda r: r['seconds'])
+                print(f"{n:>8} {mode:>7} {best['import_seconds']:>12.3f} {best['seconds']:>9.3f} {best['rss_kb'] / 1024:>9.1f} "
+                      f"{best['rss_anon_kb'] / 1024:>13.1f} {best['rss_file_kb'] / 1024:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
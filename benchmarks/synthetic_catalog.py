@@ -0,0 +1,122 @@
+"""
+Synthetic trail catalogs with the same schema as App/Finalized_Trail_paths.csv and
+App/Trail_Difficulty.csv, plus an offline ZIP geocoder, so benchmarks and checks
+run without the real data files or network access.
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'App'))
+from ZipGeocoder import ZipGeocoder  # noqa: E402
+
+SITES_CSV = os.path.join(repo_root, 'data', 'Webscraped_NYS.csv')
+UNITS = ['Allegany', 'Central', 'Finger Lakes', 'Genesee', 'Long Island', 'New York City', 'Niagara',
+         'Palisades', 'Saratoga', 'Taconic', 'Thousand Islands']
+# Site metadata the real catalog gets from its join with Webscraped_NYS.csv
+SITE_TEXT_COLUMNS = ['address', 'phone', 'description', 'amenities']
+DIFFICULTY_LABELS = ['Easy Peasy Lemon Squeezy', 'Medium – The Adventure Tickles',
+                     'Hard – The Thrill Kicks In', 'Very Hard – The Leg-Day Loco']
+# A few real ZIP centroids around the state, used as the offline geocoder table
+ZIP_CENTROIDS = {
+    '10001': (40.7506, -73.9972), '11201': (40.6940, -73.9903), '12207': (42.6547, -73.7478),
+    '13210': (43.0351, -76.1270), '13211': (43.1037, -76.1195), '14201': (42.8967, -78.8846),
+    '14607': (43.1507, -77.5856), '14850': (42.4491, -76.4974), '12901': (44.6963, -73.4739),
+    '13601': (43.9748, -75.9108),
+}
+
+
+def make_catalog(n, seed=0):
+    """A raw trail catalog of n rows, before TrailRecommendation.preprocess_data."""
+    rng = np.random.default_rng(seed)
+    sites = pd.read_csv(SITES_CSV)
+    site = rng.integers(0, len(sites), n)
+    # Trails are scattered around their park, like the real catalog
+    latitude = sites['latitude'].values[site] + rng.normal(0, 0.02, n)
+    longitude = sites['longitude'].values[site] + rng.normal(0, 0.02, n)
+    df = pd.DataFrame({
+        'Unit': rng.choice(UNITS, n),
+        'site_name': sites['site_name'].values[site],
+        'website': sites['website'].values[site],
+        'Name': [f'Trail {i}' for i in range(n)],
+        'Asset': rng.choice(['Trail', 'Multi-Use Trail', 'Nature Trail'], n),
+        'Shape_Leng': np.round(rng.lognormal(7.8, 1.0, n), 3),
+        'DR': np.round(rng.random(n), 3),
+        'Foot': rng.choice(['Y', 'N'], n, p=[0.8, 0.2]),
+        'Horse': rng.choice(['Y', 'N'], n, p=[0.2, 0.8]),
+        'Bike': rng.choice(['Y', 'N'], n, p=[0.4, 0.6]),
+        'Snowmb': rng.choice(['Y', 'N'], n, p=[0.15, 0.85]),
+        'Accessible': rng.choice(['Y', 'N'], n, p=[0.1, 0.9]),
+        'Elevation_Gain': np.round(rng.gamma(1.5, 40, n), 2),
+        'Angle_of_Descent': np.round(rng.gamma(2, 2, n), 3),
+        'type_factor': rng.choice([0.0, 0.1, 0.3], n, p=[0.5, 0.3, 0.2]),
+        'latitude': latitude,
+        'longitude': longitude,
+    })
+    for column in SITE_TEXT_COLUMNS:
+        df[column] = sites[column].values[site]
+    return df
+
+
+def make_difficulty_catalog(n, seed=0):
+    """A catalog shaped like App/Trail_Difficulty.csv, the clustering notebook's output."""
+    rng = np.random.default_rng(seed + 1)
+    df = make_catalog(n, seed)
+    df['type_factor'] = df['type_factor'].map({0.0: 'easy', 0.1: 'medium', 0.3: 'hard'})
+    df['Length(miles)'] = round(df['Shape_Leng'] * 0.000621, 2)
+    df['Difficulty_rating_KModes'] = rng.choice(DIFFICULTY_LABELS, n)
+    return df
+
+
+def make_trail_geometries(df, seed=0, spacing=25):
+    """
+    Trail lines for a catalog (the real one only has each trail's coordinates): a random walk
+    from the trail's point, one vertex per `spacing` meters of its Shape_Leng, in the format of
+    TrailTiles.read_geometries.
+    """
+    rng = np.random.default_rng(seed + 2)
+    geometries = []
+    for lat, lon, length in zip(df['latitude'].tolist(), df['longitude'].tolist(), df['Shape_Leng'].tolist()):
+        n = int(min(max(length / spacing, 2), 400))
+        heading = np.cumsum(rng.normal(0, 0.35, n - 1)) + rng.uniform(0, 2 * np.pi)
+        step = length / (n - 1) / 111320
+        points = np.empty((n, 2))
+        points[0] = lon, lat
+        points[1:, 0] = lon + np.cumsum(np.cos(heading)) * step / np.cos(np.radians(lat))
+        points[1:, 1] = lat + np.cumsum(np.sin(heading)) * step
+        geometries.append([points])
+    return geometries
+
+
+def make_geocoder(table_dir=None):
+    """A ZipGeocoder seeded with ZIP_CENTROIDS that never goes to the network."""
+    table_dir = table_dir or tempfile.mkdtemp(prefix='trails-geocoder-')
+    csv_path = os.path.join(table_dir, 'zips.csv')
+    pd.DataFrame([(z, lat, lon) for z, (lat, lon) in ZIP_CENTROIDS.items()],
+                 columns=['GEOID', 'INTPTLAT', 'INTPTLONG']).to_csv(csv_path, index=False)
+    geocoder = ZipGeocoder(table_path=os.path.join(table_dir, 'zip_centroids.sqlite'), allow_network=False)
+    geocoder.import_csv(csv_path, sep=',')
+    return geocoder
+
+
+def make_user_inputs(n, seed=0):
+    """Random Recommendation-page answers, in the dictionary format App.py builds."""
+    rng = np.random.default_rng(seed)
+    modes = ['Foot', 'Horse', 'Bike', 'Snowmb', 'Accessible']
+    users = []
+    for _ in range(n):
+        mode = modes[rng.integers(0, len(modes))]
+        user_input = {'Zip': str(rng.choice(list(ZIP_CENTROIDS)))}
+        user_input.update({m: 'Y' if m == mode else 'N' for m in modes})
+        user_input.update({
+            'Trail_Leng': int(rng.integers(1, 8)),
+            'Elevation_Gain': int(rng.integers(1, 300)),
+            'type_factor': str(rng.choice(['beginner', 'moderate', 'experienced', 'easy', 'medium', 'hard'])),
+            'radius': int(rng.choice([0, 10, 50, 100])),
+        })
+        users.append(user_input)
+    return users
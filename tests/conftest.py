@@ -0,0 +1,18 @@
+import os
+import sys
+
+# The app modules import each other by their flat names (python App/<Module>.py), and the
+# checks reuse the synthetic catalogs of the benchmarks and the scraper in trails/
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('App', 'benchmarks', 'trails'):
+    sys.path.insert(0, os.path.join(root, directory))
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def geocoder(tmp_path_factory):
+    """A ZipGeocoder seeded with the synthetic ZIP codes, never going to the network."""
+    from synthetic_catalog import make_geocoder
+    return make_geocoder(str(tmp_path_factory.mktemp('geocoder')))
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic_catalog import DIFFICULTY_LABELS, make_catalog, make_difficulty_catalog, make_user_inputs
+from TrailAmenityIndex import split_amenities, terms
+from TrailDifficulty import MIN_LENGTH_MILES, TrailDifficulty
+from TrailDistance import distance_miles
+from TrailRecommedations import RESULT_SIZE, TrailRecommendation
+
+FILTERS = [
+    {'amenities': ['Hiking']},
+    {'amenities': ['Hiking', 'Fishing', 'Showers']},
+    # Amenity names are matched case-insensitively, and an unknown one matches nothing
+    {'amenities': [' snowshoeing/x-country skiing', 'Grills']},
+    {'amenities': ['Helipad']},
+    {'keywords': 'golf'},
+    {'keywords': 'golf courses beaches'},
+    # Keywords also match the site name and its amenities; stop words are ignored
+    {'keywords': 'the State Park and hiking'},
+    {'keywords': 'and the'},
+    {'keywords': 'golf xylophone'},
+    {'amenities': ['Fishing', 'Campsites'], 'keywords': 'boardwalks'},
+]
+
+
+def reference_mask(df, amenities=None, keywords=None):
+    """The filter of one query, spelled out row by row: every amenity and every keyword is required."""
+    mask = pd.Series(True, index=df.index)
+    if amenities:
+        required = {name.strip().lower() for name in amenities}
+        mask &= df['amenities'].map(lambda text: required <= {name.lower() for name in split_amenities(text)})
+    if keywords:
+        required = set(terms(keywords))
+        text = df['site_name'].fillna('') + ' ' + df['amenities'].fillna('') + ' ' + df['description'].fillna('')
+        mask &= text.map(lambda text: required <= set(terms(text)))
+    return mask.to_numpy()
+
+
+@pytest.fixture(scope='module')
+def recommender(geocoder):
+    recommender = TrailRecommendation(make_catalog(1500), geocoder=geocoder)
+    recommender.preprocess_data()
+    return recommender
+
+
+def test_filters_select_something():
+    raw = make_catalog(1500)
+    counts = [reference_mask(raw, **query).sum() for query in FILTERS]
+    assert counts[0] > counts[1] > 0
+    assert counts[3] == counts[8] == 0
+    assert counts[7] == len(raw)
+
+
+@pytest.mark.parametrize('query', FILTERS)
+def test_recommendations_match_a_pandas_filter(recommender, geocoder, query):
+    raw = make_catalog(1500)
+    passes = reference_mask(raw, **query)
+    for user_input in make_user_inputs(12, seed=4):
+        for radius in (0, 15, 60):
+            user_input = dict(user_input, radius=radius, **query)
+            lat, lon = geocoder.locate(user_input['Zip'])
+            distances = distance_miles(lat, lon, raw['latitude'].to_numpy(), raw['longitude'].to_numpy())
+            scores = recommender.feature_matrix @ recommender.encode_users([user_input])[0]
+            # The filter, then the radius, then the 20 best scores, ties in catalog order
+            eligible = np.flatnonzero(passes & ((distances <= radius) if radius else True))
+            expected = eligible[np.argsort(-scores[eligible], kind='stable')[:RESULT_SIZE]]
+
+            result = recommender.get_recommendations(user_input)
+            assert list(result.index) == list(raw.index[expected])
+            np.testing.assert_allclose(result['Distance From You(miles)'].to_numpy(dtype=float), distances[expected])
+
+
+@pytest.mark.parametrize('query', FILTERS)
+def test_difficulty_matches_a_pandas_filter(geocoder, query):
+    raw = make_difficulty_catalog(1500)
+    difficulty = TrailDifficulty(raw, geocoder=geocoder)
+    passes = reference_mask(raw, **query)
+    for zipcode in ('13210', '10001', '14850'):
+        lat, lon = geocoder.locate(zipcode)
+        distances = distance_miles(lat, lon, raw['latitude'].to_numpy(), raw['longitude'].to_numpy())
+        for label in DIFFICULTY_LABELS:
+            # The filter within the difficulty partition, then the 10 nearest
+            eligible = np.flatnonzero(passes & (raw['Difficulty_rating_KModes'] == label).to_numpy()
+                                      & (raw['Length(miles)'] > MIN_LENGTH_MILES).to_numpy())
+            expected = eligible[np.argsort(distances[eligible], kind='stable')[:10]]
+
+            result = difficulty.get_recommendations(dict(query, Zip=zipcode, Difficulty=label))
+            assert sorted(result.index) == sorted(raw.index[expected])
+            np.testing.assert_allclose(np.sort(result['Distance From You(miles)'].to_numpy(dtype=float)),
+                                       np.sort(distances[expected]))
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CatalogRefresh import CatalogRefresh
+from synthetic_catalog import make_catalog, make_user_inputs
+from TrailRecommedations import TrailRecommendation
+
+
+def build(raw, geocoder):
+    recommender = TrailRecommendation(raw, geocoder=geocoder)
+    recommender.preprocess_data()
+    return recommender
+
+
+@pytest.fixture(scope='module')
+def catalogs():
+    """(old raw catalog, new raw catalog, expected diff)"""
+    old = make_catalog(3000)
+    # Trails sharing their (site_name, Name) key, told apart by their occurrence number
+    old = pd.concat([old, old.iloc[[10, 10, 20]]], ignore_index=True)
+    new = old.drop(index=[5, 6, 7, 10]).copy()
+    # Dropping the first trail 10 makes its second copy occurrence 0: same content, so unchanged,
+    # and the last copy moves to occurrence 1, the one the third copy used to have
+    new.loc[[100, 101], 'Elevation_Gain'] += 250
+    new.loc[102, 'latitude'] += 0.5
+    new.loc[103, 'amenities'] = 'Hiking, Fishing'
+    new.loc[104, 'Foot'] = 'N' if new.loc[104, 'Foot'] == 'Y' else 'Y'
+    added = make_catalog(50, seed=1)
+    added['Name'] = [f'New trail {i}' for i in range(len(added))]
+    # An added duplicate of a kept trail gets a new occurrence number
+    new = pd.concat([new, added, old.iloc[[30]]], ignore_index=True)
+    # Row order of the new CSV is arbitrary
+    new = new.sample(frac=1, random_state=0).reset_index(drop=True)
+    return old, new, {'added': 51, 'changed': 5, 'removed': 4}
+
+
+def test_refresh_equals_a_full_build(catalogs, geocoder):
+    old, new, expected = catalogs
+    refresh = CatalogRefresh(build(old, geocoder))
+    summary = refresh.diff(new)
+    assert {k: summary[k] for k in expected} == expected
+    refreshed, summary = refresh.apply(new)
+    assert summary['unchanged'] == len(new) - expected['added'] - expected['changed']
+    full = build(new.copy(), geocoder)
+
+    np.testing.assert_array_equal(refreshed.feature_matrix.masks, full.feature_matrix.masks)
+    assert refreshed.feature_matrix.n_features == full.feature_matrix.n_features
+    np.testing.assert_array_equal(refreshed.row_keys, full.row_keys)
+    np.testing.assert_array_equal(refreshed.row_hashes, full.row_hashes)
+    np.testing.assert_array_equal(refreshed.spatial_index.order, full.spatial_index.order)
+    np.testing.assert_array_equal(refreshed.spatial_index.sorted_cells, full.spatial_index.sorted_cells)
+    pd.testing.assert_frame_equal(refreshed.df, full.df, check_categorical=False)
+
+    users = make_user_inputs(40)
+    users += [dict(user, amenities=['Hiking']) for user in users[:10]]
+    users += [dict(user, radius=25, keywords=['lake']) for user in users[:10]]
+    for user_input in users:
+        pd.testing.assert_frame_equal(refreshed.get_recommendations(user_input), full.get_recommendations(user_input),
+                                      check_categorical=False)
+
+
+def test_refresh_of_an_identical_catalog_changes_nothing(catalogs, geocoder):
+    old, _, _ = catalogs
+    live = build(old, geocoder)
+    refreshed, summary = CatalogRefresh(live).apply(old.copy())
+    assert summary == {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': len(old)}
+    assert refreshed is not live
+    np.testing.assert_array_equal(refreshed.feature_matrix.masks, live.feature_matrix.masks)
+    np.testing.assert_array_equal(refreshed.spatial_index.order, live.spatial_index.order)
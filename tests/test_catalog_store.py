@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from CatalogStore import CatalogStore
+from synthetic_catalog import make_catalog, make_user_inputs
+from TrailRecommedations import TrailRecommendation
+
+
+@pytest.fixture(scope='module')
+def recommender(geocoder):
+    recommender = TrailRecommendation(make_catalog(3000), geocoder=geocoder)
+    recommender.preprocess_data()
+    return recommender
+
+
+def page(recommender, user_input):
+    result = recommender.get_recommendations(user_input)
+    return result[['Name', 'site_name', 'Similarity', 'Distance From You(miles)']].reset_index()
+
+
+def test_round_trip(tmp_path, recommender, geocoder):
+    store = CatalogStore(str(tmp_path))
+    version = store.write(recommender)
+    loaded = store.load(geocoder=geocoder)
+    assert loaded.catalog_version == version == store.current_version()
+    # The large arrays are mapped, not read
+    assert isinstance(loaded.feature_matrix.masks, np.memmap)
+    np.testing.assert_array_equal(loaded.feature_matrix.masks, recommender.feature_matrix.masks)
+    np.testing.assert_array_equal(loaded.row_keys, recommender.row_keys)
+    np.testing.assert_array_equal(loaded.spatial_index.order, recommender.spatial_index.order)
+    for user_input in make_user_inputs(40):
+        pd.testing.assert_frame_equal(page(loaded, user_input), page(recommender, user_input), check_dtype=False,
+                                      check_categorical=False)
+
+
+def test_versions_are_immutable(tmp_path, recommender):
+    store = CatalogStore(str(tmp_path))
+    version = store.write(recommender)
+    with pytest.raises(ValueError):
+        store.write(recommender, version)
+    assert store.current_version() == version
+    assert os.path.exists(os.path.join(str(tmp_path), version, 'header.json'))
+
+
+def test_prune_keeps_the_current_version(tmp_path, recommender, geocoder):
+    store = CatalogStore(str(tmp_path))
+    store.write(recommender, 'b')
+    store.write(recommender, 'c')
+    # Sorts before the others, so it is among the oldest names the prune removes
+    store.write(recommender, 'a', keep=1)
+    assert store.current_version() == 'a'
+    assert sorted(d for d in os.listdir(str(tmp_path)) if d != 'CURRENT') == ['a', 'c']
+    assert store.load(geocoder=geocoder).catalog_version == 'a'
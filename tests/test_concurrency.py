@@ -0,0 +1,8 @@
+import concurrency_check
+
+
+def test_concurrent_queries_match_a_fresh_recommender():
+    jobs, failures, stats = concurrency_check.check(trails=3000, queries=60, threads=8, repeats=3)
+    assert failures == 0, f'{failures} of {jobs} concurrent answers differ from the reference'
+    # The shared recommender started cold, so the concurrent phase computed results as well as reusing them
+    assert stats['misses'] > 0 and stats['hits'] > 0
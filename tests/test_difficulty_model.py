@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from DifficultyModel import DifficultyModel, label_trails, merge_labeled
+from synthetic_catalog import DIFFICULTY_LABELS, make_catalog
+from TrailClustering import TrailClustering
+from TrailKeys import trail_keys
+
+
+def test_labels_follow_their_centroids():
+    rng = np.random.default_rng(0)
+    previous = DifficultyModel(['easy', 'hard', 'medium'], [0.5, 2.0, 0.1], [-1.0, 0.0, -0.2],
+                               np.hstack([np.eye(3)[[0, 1, 2, 0, 2]], rng.random((5, 3))]),
+                               ['a', 'b', 'c', 'd', 'e'])
+    # The same clusters refitted: in another order, another scaling and another type_factor vocabulary
+    order = [3, 0, 4, 2, 1]
+    measurements = (previous.centroids[order, 3:] - previous.offset) / previous.scale
+    scale, offset = np.array([0.25, 1.5, 0.3]), np.array([0.1, -0.5, 0.0])
+    one_hot = previous.centroids[order][:, [0, 2, 1]]
+    refit = DifficultyModel(['easy', 'medium', 'hard', 'very hard'], scale, offset,
+                            np.hstack([one_hot, np.zeros((5, 1)), measurements * scale + offset]),
+                            ['x'] * 5)
+    assert list(previous._inherit_labels(refit)) == [previous.labels[i] for i in order]
+
+
+def clustered_catalog(n, seed=0):
+    """Trails drawn around five distinct difficulty profiles, so a refit finds the same clusters."""
+    rng = np.random.default_rng(seed)
+    trails = make_catalog(n, seed)
+    profiles = np.array([[500, 5, 1], [2000, 40, 3], [5000, 90, 6], [9000, 150, 10], [15000, 300, 15]])
+    profile = rng.integers(0, len(profiles), n)
+    trails[['Shape_Leng', 'Elevation_Gain', 'Angle_of_Descent']] = profiles[profile] * rng.normal(1, 0.05, (n, 3))
+    trails['type_factor'] = np.array([0.0, 0.0, 0.1, 0.3, 0.3])[profile]
+    return trails
+
+
+def test_refit_keeps_the_labels():
+    trails = clustered_catalog(3000)
+    first = TrailClustering([5], n_jobs=1, random_state=1).fit(trails)
+    # Labels unlike the difficulty ranking, so only inheritance can reproduce them
+    first.cluster_labels = np.roll(first.cluster_labels, 1)
+    previous = DifficultyModel.from_clustering(first)
+
+    grown = pd.concat([trails, clustered_catalog(500, seed=1)], ignore_index=True)
+    second = TrailClustering([5], n_jobs=1, random_state=2).fit(grown)
+    refit = DifficultyModel.from_clustering(second, previous)
+    assert sorted(refit.labels) == sorted(previous.labels)
+    np.testing.assert_array_equal(refit.assign_difficulty(trails), previous.assign_difficulty(trails))
+    # Without the previous model the refit labels by difficulty rank, which the rolled labels are not
+    assert (DifficultyModel.from_clustering(second).assign_difficulty(trails) != previous.assign_difficulty(trails)).any()
+
+
+def test_merge_replaces_labeled_trails(tmp_path):
+    model = DifficultyModel(['easy', 'medium', 'hard'], [0.001, 0.01, 0.1], [0, 0, 0],
+                            np.hstack([np.eye(3)[[0, 1, 2, 2]], np.arange(12).reshape(4, 3) / 4]), DIFFICULTY_LABELS)
+    trails = make_catalog(200)
+    # Two trails sharing their site and name
+    trails.loc[1, ['site_name', 'Name']] = trails.loc[0, ['site_name', 'Name']].values
+    catalog = label_trails(trails, model)
+    catalog['Difficulty_rating_KModes'] = DIFFICULTY_LABELS[0]
+
+    relabeled = label_trails(trails.iloc[[1, 5]], model)
+    merged = merge_labeled(catalog, relabeled)
+    # Trail 1 is the first of its key in the batch, so it replaces trail 0, in its place
+    assert len(merged) == len(catalog)
+    np.testing.assert_array_equal(trail_keys(merged), trail_keys(catalog))
+    assert list(merged['Difficulty_rating_KModes'].iloc[[0, 5]]) == list(relabeled['Difficulty_rating_KModes'])
+    assert list(merged['Shape_Leng'].iloc[[0, 1, 5]]) == list(trails['Shape_Leng'].iloc[[1, 1, 5]])
+    assert (merged['Difficulty_rating_KModes'].drop(index=[0, 5]) == DIFFICULTY_LABELS[0]).all()
+
+    # Labeling the same file twice changes nothing
+    pd.testing.assert_frame_equal(merge_labeled(merged, relabeled), merged)
+    added = label_trails(make_catalog(10, seed=3).assign(Name=lambda df: 'New ' + df['Name']), model)
+    assert len(merge_labeled(merged, added)) == len(merged) + len(added)
@@ -0,0 +1,51 @@
+import numpy as np
+from geographiclib.geodesic import Geodesic
+from geopy.distance import geodesic
+
+from TrailDistance import distance_miles, haversine_miles
+
+
+def geopy_miles(origin, points):
+    return np.array([geodesic(origin, point).miles for point in points])
+
+
+def test_geodesic_matches_geopy():
+    rng = np.random.default_rng(0)
+    origin = (43.0481, -76.1474)
+    # Trails of the catalog's scale (New York State) agree to 1e-8 miles
+    local = list(zip(rng.uniform(40.5, 45, 500), rng.uniform(-79.8, -71.8, 500))) + [origin]
+    actual = distance_miles(origin[0], origin[1], [p[0] for p in local], [p[1] for p in local], method='geodesic')
+    np.testing.assert_allclose(actual, geopy_miles(origin, local), rtol=0, atol=1e-8)
+    # Coincident points
+    assert actual[-1] == 0
+    # Anywhere on earth, to well under a millimetre (1e-7 miles is 0.16 mm)
+    anywhere = list(zip(rng.uniform(-89, 89, 500), rng.uniform(-180, 180, 500))) + [(-43.0481, 103.8526)]
+    actual = distance_miles(origin[0], origin[1], [p[0] for p in anywhere], [p[1] for p in anywhere], method='geodesic')
+    np.testing.assert_allclose(actual, geopy_miles(origin, anywhere), rtol=0, atol=1e-7)
+
+
+def test_nearly_antipodal_pairs_use_karney(monkeypatch):
+    calls = []
+    inverse = Geodesic.WGS84.Inverse
+    monkeypatch.setattr(Geodesic.WGS84, 'Inverse', lambda *args, **kwargs: calls.append(args) or inverse(*args, **kwargs))
+    points = [(0.5, 179.7), (-0.3, 179.9), (0.0, 179.5)]
+    actual = distance_miles(0.0, 0.0, [p[0] for p in points], [p[1] for p in points], method='geodesic')
+    assert calls, 'Vincenty converged, the pairs do not exercise the fallback'
+    np.testing.assert_allclose(actual, geopy_miles((0.0, 0.0), points), rtol=0, atol=1e-8)
+
+
+def test_haversine_error_bound():
+    rng = np.random.default_rng(1)
+    lats, lons = rng.uniform(-89, 89, 2000), rng.uniform(-180, 180, 2000)
+    exact = distance_miles(10.0, 20.0, lats, lons, method='geodesic')
+    approximate = haversine_miles(10.0, 20.0, lats, lons)
+    assert np.max(np.abs(approximate - exact) / exact) < 0.0056
+
+
+def test_missing_coordinates_are_nan():
+    lats = np.array([43.0, np.nan, 42.0])
+    lons = np.array([-76.0, -75.0, np.nan])
+    for method in ('geodesic', 'haversine'):
+        result = distance_miles(43.1, -76.1, lats, lons, method=method)
+        assert np.isfinite(result[0]) and np.isnan(result[1]) and np.isnan(result[2])
+    assert np.isnan(distance_miles(np.nan, -76.1, lats, lons)).all()
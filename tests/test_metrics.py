@@ -0,0 +1,42 @@
+import json
+import urllib.request
+
+from TrailMetrics import TrailMetrics
+
+
+def record(metrics):
+    with metrics.request('recommend'):
+        with metrics.span('score'):
+            pass
+    metrics.increment('result_cache_total', result='miss')
+
+
+def test_drain_and_merge_add_up():
+    worker, parent = TrailMetrics(sample_rate=1.0), TrailMetrics(sample_rate=1.0)
+    for _ in range(3):
+        record(worker)
+        parent.merge(worker.drain())
+    assert worker.snapshot() == {'counters': [], 'histograms': []}
+
+    expected = TrailMetrics(sample_rate=1.0)
+    for _ in range(3):
+        record(expected)
+    merged, direct = parent.snapshot(), expected.snapshot()
+    assert merged['counters'] == direct['counters']
+    assert [(h['name'], h['labels'], h['count']) for h in merged['histograms']] == \
+           [(h['name'], h['labels'], h['count']) for h in direct['histograms']]
+
+
+def test_serve():
+    metrics = TrailMetrics(sample_rate=1.0)
+    record(metrics)
+    server = metrics.serve(0)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        text = urllib.request.urlopen(f'{url}/metrics', timeout=10).read().decode('utf-8')
+        assert 'trails_stage_seconds_bucket' in text and 'trails_result_cache_total' in text
+        snapshot = json.loads(urllib.request.urlopen(f'{url}/metrics.json', timeout=10).read())
+        assert snapshot['counters']
+    finally:
+        server.shutdown()
+        server.server_close()
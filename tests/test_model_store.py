@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from TrainModels import ModelStore
+
+
+def stored(path):
+    return sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+
+
+def test_versions_are_never_replaced(tmp_path):
+    store = ModelStore(str(tmp_path))
+    version = store.write({'run': 1})
+    with pytest.raises(ValueError):
+        store.write({'run': 2}, version=version)
+    assert store.current_version() == version
+    assert store.metrics()['run'] == 1
+    # Nothing of the rejected write is left behind
+    assert stored(str(tmp_path)) == [version]
+
+
+def test_prune_keeps_the_current_version(tmp_path, monkeypatch):
+    store = ModelStore(str(tmp_path))
+    os.makedirs(os.path.join(str(tmp_path), 'cache'))
+    for version in ('b', 'c'):
+        store.write({}, version=version)
+    # Sorts before the others, so it is among the oldest names the prune removes
+    store.write({}, version='a', keep=1)
+    assert store.current_version() == 'a'
+    assert stored(str(tmp_path)) == ['a', 'c', 'cache']
+
+    # Another writer points CURRENT at 'c' between this write's publish and its prune
+    monkeypatch.setattr(store.versions, 'current_version', lambda: 'c')
+    store.write({}, version='d', keep=1)
+    assert stored(str(tmp_path)) == ['c', 'cache', 'd']
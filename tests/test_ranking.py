@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from TrailRanking import top_k
+
+
+def reference(scores, k, mask=None):
+    positions = np.arange(len(scores)) if mask is None else np.flatnonzero(mask)
+    order = np.argsort(-scores[positions], kind='stable')[:k]
+    return positions[order], scores[positions][order]
+
+
+@pytest.mark.parametrize('k', [1, 5, 20, 200, 1000])
+@pytest.mark.parametrize('full_sort', [False, True])
+def test_top_k_matches_a_stable_sort(k, full_sort):
+    rng = np.random.default_rng(k)
+    # Few distinct values, so almost every selection cuts through a tie
+    scores = rng.integers(0, 6, 300).astype(np.float32)
+    for mask in (None, rng.random(300) < 0.5):
+        positions, values = top_k(scores, k, mask, full_sort)
+        expected_positions, expected_values = reference(scores, k, mask)
+        np.testing.assert_array_equal(positions, expected_positions)
+        np.testing.assert_array_equal(values, expected_values)
+
+
+def test_ties_go_to_the_lower_position():
+    positions, _ = top_k(np.array([1.0, 2.0, 2.0, 2.0, 0.5]), 2)
+    assert positions.tolist() == [1, 2]
+
+
+def test_mask_is_applied_before_selection():
+    scores = np.array([9.0, 8.0, 1.0, 7.0, 2.0, 3.0])
+    mask = np.array([False, False, True, False, True, False])
+    # The mask leaves fewer than k rows: only those come back, never the better masked-out ones
+    positions, values = top_k(scores, 5, mask)
+    assert positions.tolist() == [4, 2]
+    assert values.tolist() == [2.0, 1.0]
+    assert len(top_k(scores, 3, np.zeros(6, dtype=bool))[0]) == 0
@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from TrailRender import TrailRender, site_link
+
+COLUMNS = ['site_name', 'website', 'Name', 'Length(miles)', 'Distance From You(miles)']
+SCRIPT = '<script>alert("x")</script>'
+
+
+@pytest.fixture
+def catalog():
+    return pd.DataFrame({
+        'site_name': [SCRIPT, 'Bear\'s "Den" & Co', 'Lake Park', 'Lake Park', None],
+        'website': ['https://parks.ny.gov/?a=1&b="2"', 'javascript:alert(document.cookie)', 'JavaScript:void(0)',
+                    ' https://parks.ny.gov/lake', 'HTTP://parks.ny.gov/'],
+        'Name': ['<b>Loop</b>', "O'Brien Trail", 'Lake "Shore"', 'Ridge </td></tr><tr><td>', np.nan],
+        'Length(miles)': [1.5, 2.25, np.nan, 3.0, 0.4],
+    }, index=[10, 20, 30, 40, 50])
+
+
+def result_of(catalog):
+    result = catalog.iloc[::-1].copy()
+    result['Distance From You(miles)'] = [0.5, 1.0, 1.5, 2.0, 2.5]
+    return result
+
+
+def test_site_link():
+    assert site_link(SCRIPT, 'https://parks.ny.gov/?a=1&b="2"') == (
+        '<a href="https://parks.ny.gov/?a=1&amp;b=&quot;2&quot;">&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;</a>')
+    # Anything but an http(s) URL is shown as plain text, never as a link
+    for website in ('javascript:alert(1)', 'JavaScript:alert(1)', ' https://parks.ny.gov', 'data:text/html,x',
+                    '//parks.ny.gov', ''):
+        assert site_link('Park <1>', website) == 'Park &lt;1&gt;'
+    assert site_link('Park', 'HTTPS://parks.ny.gov') == '<a href="HTTPS://parks.ny.gov">Park</a>'
+
+
+def test_html_escapes_every_cell(catalog):
+    renderer = TrailRender(catalog, ['Site Name', 'Name', 'Length(miles)', 'Distance From You(miles)'])
+    page = renderer.html(result_of(catalog))
+    rows = page.split('<tbody>')[1].split('</tr>')[:-1]
+    assert rows == [
+        '<tr><td><a href="HTTP://parks.ny.gov/"></a></td><td></td><td>0.40</td><td>0.50</td>',
+        '<tr><td>Lake Park</td><td>Ridge &lt;/td&gt;&lt;/tr&gt;&lt;tr&gt;&lt;td&gt;</td><td>3.00</td><td>1.00</td>',
+        '<tr><td>Lake Park</td><td>Lake &quot;Shore&quot;</td><td></td><td>1.50</td>',
+        '<tr><td>Bear&#x27;s &quot;Den&quot; &amp; Co</td><td>O&#x27;Brien Trail</td><td>2.25</td><td>2.00</td>',
+        '<tr><td><a href="https://parks.ny.gov/?a=1&amp;b=&quot;2&quot;">&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;'
+        '</a></td><td>&lt;b&gt;Loop&lt;/b&gt;</td><td>1.50</td><td>2.50</td>',
+    ]
+    assert '<script' not in page and 'javascript:' not in page.lower()
+
+
+def test_json_round_trips_and_embeds_safely(catalog):
+    renderer = TrailRender(catalog, ['Site Name', 'Name'])
+    result = result_of(catalog)
+    text = renderer.json(result, COLUMNS)
+    # No markup survives, even inside a <script> block
+    assert '<' not in text
+    records = json.loads(text)
+    assert [record['site_name'] for record in records] == [None, 'Lake Park', 'Lake Park', 'Bear\'s "Den" & Co', SCRIPT]
+    assert records[3]['website'] == 'javascript:alert(document.cookie)'
+    assert records[1]['Name'] == 'Ridge </td></tr><tr><td>'
+    assert [record['Length(miles)'] for record in records] == [0.4, 3.0, None, 2.25, 1.5]
+    assert [record['Distance From You(miles)'] for record in records] == [0.5, 1.0, 1.5, 2.0, 2.5]
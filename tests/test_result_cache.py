@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from RecommendationCache import RecommendationCache
+from synthetic_catalog import make_catalog
+from TrailRecommedations import TrailRecommendation
+from TrailSpatialIndex import geohash_bounds, geohash_encode
+from ZipGeocoder import ZipGeocoder
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return make_catalog(20000)
+
+
+@pytest.fixture(scope='module')
+def users(catalog, tmp_path_factory):
+    """
+    ZIP codes of 60 points spread over the geohash cell of the park with the most trails, and
+    their geocoder.
+    """
+    park = catalog.loc[catalog['site_name'] == catalog['site_name'].mode()[0]]
+    center = geohash_encode(park['latitude'].median(), park['longitude'].median(), 5)
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(center)
+    rng = np.random.default_rng(0)
+    # Corners and edges included, where a pool built for the cell center is most likely to run out
+    lats = np.concatenate([[lat_min, lat_min, lat_max - 1e-9, lat_max - 1e-9], rng.uniform(lat_min, lat_max, 56)])
+    lons = np.concatenate([[lon_min, lon_max - 1e-9, lon_min, lon_max - 1e-9], rng.uniform(lon_min, lon_max, 56)])
+    zips = [f'{90000 + i}' for i in range(len(lats))]
+    directory = str(tmp_path_factory.mktemp('cell'))
+    csv_path = os.path.join(directory, 'zips.csv')
+    pd.DataFrame({'GEOID': zips, 'INTPTLAT': lats, 'INTPTLONG': lons}).to_csv(csv_path, index=False)
+    geocoder = ZipGeocoder(table_path=os.path.join(directory, 'zips.sqlite'), allow_network=False)
+    geocoder.import_csv(csv_path, sep=',')
+    assert {geohash_encode(lat, lon, 5) for lat, lon in zip(lats, lons)} == {center}
+    return zips, geocoder
+
+
+def user_input(zip_code, radius):
+    return {'Zip': zip_code, 'Foot': 'Y', 'Horse': 'N', 'Bike': 'N', 'Snowmb': 'N', 'Accessible': 'N',
+            'Trail_Leng': 3, 'Elevation_Gain': 80, 'type_factor': 'beginner', 'radius': radius}
+
+
+def page(result):
+    return list(result.index), result['Similarity'].tolist(), np.round(result['Distance From You(miles)'], 9).tolist()
+
+
+def check_cell(catalog, users, radius):
+    """Asserts every user of the cell gets the page of a direct query; returns the cache stats."""
+    zips, geocoder = users
+    recommender = TrailRecommendation(catalog.copy(), geocoder=geocoder)
+    recommender.preprocess_data()
+    # A small pool, so users away from the cell center run out of it and fall back
+    recommender.result_cache = RecommendationCache(pool_size=30)
+    for zip_code in zips:
+        query = user_input(zip_code, radius)
+        cached = page(recommender.get_recommendations(query))
+        # The same query from scratch: an empty cache, and the direct (uncached) search
+        recommender.result_cache.invalidate()
+        cleared = page(recommender.get_recommendations(query))
+        lat, lon = geocoder.locate(zip_code)
+        direct = page(recommender._recommend(recommender.encode_users([query])[0], lat, lon, radius))
+        assert cached == cleared == direct
+    return recommender.result_cache.stats()
+
+
+@pytest.mark.parametrize('radius', [2, 5, 50])
+def test_cached_pools_give_the_direct_page(catalog, users, radius):
+    assert check_cell(catalog, users, radius)['hits'] > 0
+
+
+def test_fallback_when_the_pool_runs_out(catalog, users):
+    # With a one mile radius, users near the cell edges keep fewer than 20 of the 30 pooled trails
+    stats = check_cell(catalog, users, 1)
+    assert stats['hits'] > 0 and stats['fallbacks'] > 0
@@ -0,0 +1,147 @@
+import hashlib
+import http.server
+import threading
+
+import pytest
+
+from ParkScraper import ParkScraper
+
+
+LISTINGS = [('parks/', 'Container_lstStateParks')]
+SITES = ['Alpha', 'Beta', 'Gamma', 'Delta']
+
+
+def listing_page(names):
+    options = ''.join(f'<option value="{name.lower()}.aspx">{name}</option>' for name in names)
+    return f'<html><body><select id="Container_lstStateParks"><option value="">Any State Park</option>{options}</select></body></html>'
+
+
+def site_page(name):
+    return f"""<html><body>
+<span style="font-weight:bold;">Latitude</span> 42.{len(name)}<br>
+<span style="font-weight:bold;">Longitude</span> -75.{len(name)}<br>
+<div style="margin-bottom:8px;">Address 1 {name} Road</div>
+<strong>Phone</strong> <a href="tel:5555550100">(555) 555-0100</a>
+<div role="tabpanel">{name} is a park.</div>
+<ul style="padding:0px; list-style:none;"><li>Amenities</li><li>header</li><li>Hiking</li><li>Swimming</li></ul>
+</body></html>"""
+
+
+class FixtureSite(http.server.ThreadingHTTPServer):
+    """Serves pages with ETags and answers conditional requests, counting the requests per path."""
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        self.broken = set()
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('If-None-Match') is not None))
+        if self.path not in server.pages or self.path in server.broken:
+            self.send_error(404)
+            return
+        body = server.pages[self.path].encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    pages = {'/parks/': listing_page(SITES)}
+    pages.update({f'/parks/{name.lower()}.aspx': site_page(name) for name in SITES})
+    server = FixtureSite(pages)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def make_scraper(site, tmp_path):
+    return ParkScraper(site.base_url, LISTINGS, cache_dir=str(tmp_path / 'cache'), max_workers=2,
+                       requests_per_second=0, timeout=5)
+
+
+def test_second_run_is_all_not_modified(site, tmp_path):
+    first = make_scraper(site, tmp_path)
+    df = first.scrape()
+    assert list(df['site_name']) == SITES
+    assert df.loc[0, 'amenities'] == 'Hiking, Swimming'
+    assert first.stats['downloaded'] == len(SITES) + 1
+
+    second = make_scraper(site, tmp_path)
+    site.requests.clear()
+    assert second.scrape().equals(df)
+    assert second.stats['downloaded'] == 0
+    assert second.stats['not_modified'] == len(SITES) + 1
+    assert all(conditional for _, conditional in site.requests)
+
+
+def test_resume_fetches_only_the_missing_sites(site, tmp_path):
+    site.broken = {'/parks/beta.aspx', '/parks/delta.aspx'}
+    with pytest.raises(RuntimeError):
+        make_scraper(site, tmp_path).scrape()
+
+    site.broken = set()
+    site.requests.clear()
+    scraper = make_scraper(site, tmp_path)
+    df = scraper.scrape()
+    assert list(df['site_name']) == SITES
+    assert scraper.stats['resumed'] == 2
+    assert sorted(path for path, _ in site.requests) == ['/parks/', '/parks/beta.aspx', '/parks/delta.aspx']
+
+
+def test_malformed_pages_are_skipped(site, tmp_path):
+    # No site details at all: skipped. Missing or odd fields: None, the other fields kept
+    site.pages['/parks/beta.aspx'] = '<html><body><p>Service unavailable</p>'
+    site.pages['/parks/gamma.aspx'] = ('<html><body><span style="font-weight:bold;">Latitude</span>'
+                                       '<ul style="padding:0px; list-style:none;"><li>a</li><li><b>x</b></li></ul>'
+                                       '<div role="tabpanel">Gamma only has a description.</div>')
+    scraper = make_scraper(site, tmp_path)
+    df = scraper.scrape()
+    assert list(df['site_name']) == ['Alpha', 'Gamma', 'Delta']
+    assert scraper.stats['parse_failed'] == 1
+    assert scraper.parse_failures[0][0].endswith('/parks/beta.aspx')
+    gamma = df.set_index('site_name').loc['Gamma']
+    assert gamma['description'] == 'Gamma only has a description.'
+    assert gamma[['latitude', 'longitude', 'address', 'phone', 'amenities']].isna().all()
+
+
+def test_parse_failures_are_checkpointed(site, tmp_path):
+    site.pages['/parks/beta.aspx'] = '<html></html>'
+    site.broken = {'/parks/delta.aspx'}
+    with pytest.raises(RuntimeError):
+        make_scraper(site, tmp_path).scrape()
+
+    site.broken = set()
+    site.requests.clear()
+    scraper = make_scraper(site, tmp_path)
+    assert list(scraper.scrape()['site_name']) == ['Alpha', 'Gamma', 'Delta']
+    assert scraper.stats['parse_failed'] == 1
+    assert sorted(path for path, _ in site.requests) == ['/parks/', '/parks/delta.aspx']
+
+
+def test_listing_without_its_menu_is_reported(site, tmp_path):
+    site.pages['/parks/'] = '<html><body>Moved</body></html>'
+    with pytest.raises(RuntimeError, match='select menu'):
+        make_scraper(site, tmp_path).scrape()
@@ -0,0 +1,151 @@
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from CatalogStore import build_store
+from synthetic_catalog import make_catalog, make_geocoder
+from TrailService import TrailService, _HttpError
+
+
+REQUEST = {'zip': '13210', 'exploration_mode': 'Walk', 'elevation_gain': 80, 'trail_length': 3,
+           'experience': 'Beginner', 'radius': 50}
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    """A one worker service on a synthetic catalog, without a difficulty catalog, on its own event loop thread."""
+    tmp = str(tmp_path_factory.mktemp('service'))
+    csv_path = os.path.join(tmp, 'trails.csv')
+    make_catalog(2000).to_csv(csv_path, index=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_store(csv_path, os.path.join(tmp, 'catalog'))
+    make_geocoder(tmp)
+    service = TrailService(port=0, workers=1, timeout=5.0, store_path=os.path.join(tmp, 'catalog'),
+                           trails_csv=csv_path, difficulty_csv=os.path.join(tmp, 'missing.csv'),
+                           zip_table=os.path.join(tmp, 'zip_centroids.sqlite'), allow_network=False)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(service.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    service.loop = loop
+    yield service
+
+    async def stop():
+        service.close()
+        # Connections still open (keep-alive) end with the loop
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def request(service, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(service.host, service.port, timeout=30)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read().decode('utf-8')
+    finally:
+        connection.close()
+
+
+def post(service, path, payload):
+    return request(service, 'POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+
+
+def test_recommendations(service):
+    status, body = post(service, '/recommendations', REQUEST)
+    assert status == 200
+    assert 'trails' in json.loads(body)
+
+
+@pytest.mark.parametrize('radius', ['NaN', 'Infinity', '-Infinity', '-1'])
+def test_radius_must_be_finite(service, radius):
+    body = json.dumps(dict(REQUEST, radius=0)).replace('"radius": 0', f'"radius": {radius}')
+    status, response = request(service, 'POST', '/recommendations', body)
+    assert status == 400
+    assert 'Distance' in json.loads(response)['error']
+
+
+@pytest.mark.parametrize('length, expected', [('abc', 400), ('-5', 400), (str(1 << 30), 413)])
+def test_invalid_content_length(service, length, expected):
+    connection = http.client.HTTPConnection(service.host, service.port, timeout=30)
+    try:
+        connection.putrequest('POST', '/recommendations')
+        connection.putheader('Content-Length', length)
+        connection.endheaders()
+        assert connection.getresponse().status == expected
+    finally:
+        connection.close()
+
+
+def test_missing_difficulty_catalog_is_unavailable(service):
+    status, body = post(service, '/difficulty', {'zip': '13210', 'difficulty': 'x'})
+    assert status == 503
+    assert json.loads(body)['error'] == 'The difficulty catalog is not available'
+
+
+def test_unexpected_errors_are_generic(service):
+    async def broken(body):
+        raise KeyError('internal detail')
+
+    service._routes[('GET', '/broken')] = broken
+    try:
+        status, body = request(service, 'GET', '/broken')
+    finally:
+        del service._routes[('GET', '/broken')]
+    assert status == 500
+    assert json.loads(body) == {'error': 'Internal Server Error'}
+
+
+def test_timed_out_request_keeps_its_slot_until_the_worker_is_done(service):
+    free = service._pending._value
+    run = asyncio.run_coroutine_threadsafe(service._run(time.sleep, 1.0, timeout=0.1), service.loop)
+    with pytest.raises(_HttpError) as error:
+        run.result(timeout=30)
+    assert error.value.status == 504
+    # The worker is still sleeping: its slot is not free yet
+    assert service._pending._value == free - 1
+    deadline = time.monotonic() + 30
+    while service._pending._value != free and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert service._pending._value == free
+
+
+def test_metrics_include_the_workers(service):
+    assert post(service, '/recommendations', REQUEST)[0] == 200
+    status, body = request(service, 'GET', '/metrics')
+    assert status == 200
+    for series in ('trails_http_requests_total', 'trails_requests_total{outcome="ok",request="recommend"}',
+                   'trails_stage_seconds_bucket', 'trails_result_cache_total', 'trails_geocoder_lookups_total'):
+        assert series in body
+    stages = {h['labels']['stage'] for h in json.loads(request(service, 'GET', '/metrics.json')[1])['histograms']
+              if h['name'] == 'stage_seconds'}
+    assert stages
+
+
+def geocoder_lookups(service):
+    counters = json.loads(request(service, 'GET', '/metrics.json')[1])['counters']
+    return sum(c['value'] for c in counters if c['name'] == 'geocoder_lookups_total')
+
+
+def test_batch_geocodes_each_request_once(service):
+    before = geocoder_lookups(service)
+    status, body = post(service, '/recommendations/batch',
+                        {'requests': [REQUEST, dict(REQUEST, zip='14850'), dict(REQUEST, zip='00000')]})
+    assert status == 200
+    results = json.loads(body)['results']
+    assert ['trails' in result for result in results] == [True, True, False]
+    assert geocoder_lookups(service) - before == 3
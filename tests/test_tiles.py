@@ -0,0 +1,119 @@
+import json
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from synthetic_catalog import make_catalog, make_trail_geometries
+from TrailTiles import TrailTileSet, mercator, simplify, simplify_lines, tiles_in_view
+
+MIN_ZOOM, CLUSTER_MAX_ZOOM, MAX_ZOOM = 5, 10, 12
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    df = make_catalog(2000)
+    # Trails without coordinates are left off the map
+    df.loc[[3, 7], 'latitude'] = np.nan
+    return df
+
+
+def features_in_view(tile_set, zoom):
+    """Every feature of the tiles a viewport over the whole tile set fetches at zoom."""
+    (south, west), (north, east) = tile_set.manifest['bounds']
+    tiles = tiles_in_view(south, west, north, east, zoom)
+    assert {key for key in tile_set.tiles if key[0] == zoom} <= set(tiles)
+    return [(key, feature) for key in tiles if tile_set.tile(*key)
+            for feature in json.loads(tile_set.tile(*key))['features']]
+
+
+def test_each_trail_once_per_zoom(catalog):
+    tile_set = TrailTileSet.build(catalog, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, cluster_max_zoom=CLUSTER_MAX_ZOOM)
+    mapped = set(range(len(catalog))) - {3, 7}
+    assert tile_set.manifest['trails'] == len(mapped)
+    for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+        features = [feature['properties'] for _, feature in features_in_view(tile_set, zoom)]
+        singles = Counter(p['id'] for p in features if 'cluster' not in p)
+        assert all(count == 1 for count in singles.values())
+        # Cluster counts and single trails add up to every trail on the map
+        assert sum(p['cluster'] for p in features if 'cluster' in p) + len(singles) == len(mapped)
+        if zoom > CLUSTER_MAX_ZOOM:
+            assert set(singles) == mapped
+
+
+def test_clusters_hold_their_trails(catalog):
+    tile_set = TrailTileSet.build(catalog, min_zoom=MIN_ZOOM, max_zoom=MIN_ZOOM, cluster_max_zoom=MIN_ZOOM)
+    features = [feature for _, feature in features_in_view(tile_set, MIN_ZOOM)]
+    clusters = [f for f in features if 'cluster' in f['properties']]
+    assert clusters and all(f['properties']['cluster'] > 1 for f in clusters)
+    # A cluster sits at the center of its trails, inside the catalog's bounds
+    (south, west), (north, east) = tile_set.manifest['bounds']
+    for f in clusters:
+        lon, lat = f['geometry']['coordinates']
+        assert south - 1e-5 <= lat <= north + 1e-5 and west - 1e-5 <= lon <= east + 1e-5
+
+
+def test_lines_are_in_every_tile_they_cross_once(catalog):
+    geometries = make_trail_geometries(catalog, spacing=50)
+    tile_set = TrailTileSet.build(catalog, geometries=geometries, min_zoom=MAX_ZOOM, max_zoom=MAX_ZOOM,
+                                  cluster_max_zoom=MAX_ZOOM - 1)
+    n = 1 << MAX_ZOOM
+    occurrences = Counter((feature['properties']['id'], key) for key, feature in features_in_view(tile_set, MAX_ZOOM))
+    assert max(occurrences.values()) == 1
+    tiles_of = {}
+    for trail, key in occurrences:
+        tiles_of.setdefault(trail, set()).add(key)
+    assert set(tiles_of) == set(range(len(catalog))) - {3, 7}
+    for trail, keys in tiles_of.items():
+        # The tiles of the line's bounding box, which include the tile of its point
+        x, y = mercator(geometries[trail][0][:, 1], geometries[trail][0][:, 0])
+        xs = range(int(x.min() * n), int(x.max() * n) + 1)
+        ys = range(int(y.min() * n), int(y.max() * n) + 1)
+        assert keys == {(MAX_ZOOM, tx, ty) for tx in xs for ty in ys}
+
+
+def segment_distance(point, a, b):
+    ab = b - a
+    t = 0.0 if not ab.any() else np.clip(np.dot(point - a, ab) / np.dot(ab, ab), 0, 1)
+    return np.hypot(*(point - (a + t * ab)))
+
+
+def douglas_peucker(points, tolerance):
+    """The textbook recursion, one chord at a time."""
+    def split(first, last):
+        if last - first < 2:
+            return []
+        distances = [segment_distance(points[i], points[first], points[last]) for i in range(first + 1, last)]
+        middle = first + 1 + int(np.argmax(distances))
+        if max(distances) <= tolerance:
+            return []
+        return split(first, middle) + [middle] + split(middle, last)
+    return np.array([0] + split(0, len(points) - 1) + [len(points) - 1])
+
+
+def test_simplify_lines():
+    rng = np.random.default_rng(0)
+    lines = [np.cumsum(rng.normal(0, 1, (size, 2)), axis=0) for size in (2, 3, 10, 50, 400)]
+    # A closed loop (a zero-length chord), a straight line and repeated points
+    lines.append(np.array([[0, 0], [1, 1], [2, 0], [1, -1], [0, 0]], dtype=float))
+    lines.append(np.column_stack([np.arange(20.0), np.arange(20.0) * 2]))
+    lines.append(np.array([[0, 0], [0, 0], [0, 0], [1, 0]], dtype=float))
+    # Doubles back along its chord: far from the chord segment, on its line
+    lines.append(np.array([[0, 0], [3, 0], [1, 0]], dtype=float))
+    points = np.concatenate(lines)
+    sizes = np.array([len(line) for line in lines])
+    ends = np.cumsum(sizes) - 1
+    starts = ends - sizes + 1
+    for tolerance in (0.0, 0.1, 0.5, 2.0, 50.0):
+        keep = simplify_lines(points, starts, ends, tolerance)
+        for line, start in zip(lines, starts):
+            kept = np.flatnonzero(keep[start:start + len(line)])
+            np.testing.assert_array_equal(kept, douglas_peucker(line, tolerance))
+            np.testing.assert_array_equal(simplify(line, tolerance), kept)
+            # The end points stay, and every dropped point is within tolerance of the simplified line
+            assert kept[0] == 0 and kept[-1] == len(line) - 1
+            for a, b in zip(kept[:-1], kept[1:]):
+                for i in range(a + 1, b):
+                    assert segment_distance(line[i], line[a], line[b]) <= tolerance + 1e-9
+    assert simplify_lines(points, starts, ends, np.inf).sum() == 2 * len(lines)
+    assert list(simplify(lines[-1], 0.5)) == [0, 1, 2]
@@ -0,0 +1,312 @@
+"""
+Importable, incremental version of the Park_Hist_siteScraper from Webscraping_NYS_Park.ipynb.
+
+Refreshes data/Webscraped_NYS.csv with:
+- a bounded thread pool sharing one keep-alive session,
+- a per-host rate limit and retries with backoff,
+- conditional requests (ETag / Last-Modified) backed by an on-disk HTTP cache, so
+  unchanged pages come back as an empty 304 and are not downloaded again,
+- a JSON-lines checkpoint, so an interrupted run resumes where it stopped,
+- field by field parsing, as in the notebook: a field missing from a page is None, and a
+  page with no site details at all is skipped (and recorded in the checkpoint) instead of
+  aborting the run,
+- the lxml parser when it is installed (html.parser otherwise).
+
+Usage: python trails/ParkScraper.py [--out data/Webscraped_NYS.csv] [--workers 8] [--rate 2]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlsplit
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+
+BASE_URL = 'https://parks.ny.gov/'
+# (listing page, id of the select menu that lists its sites)
+LISTINGS = [('historic-sites/', 'Container_lstHistoricSites'), ('parks/', 'Container_lstStateParks')]
+COLUMNS = ['site_name', 'website', 'latitude', 'longitude', 'address', 'phone', 'description', 'amenities']
+# Coordinates missing from the park pages, looked up by hand (see the notebook)
+MANUAL_COORDINATES = {
+    "Minnewaska State Park Preserve: Sam's Point Area": ("41.670636", "-74.361385"),
+    "Pat McGee Trail": ("42.20820", "-78.75710"),
+    "Hudson River Park": ("40.729563", "-74.012699"),
+    "Genesee Valley Greenway State Park": ("43.1080", "-77.6515"),
+}
+
+logger = logging.getLogger('trails.scraper')
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_OUTPUT = os.path.join(repo_root, 'data', 'Webscraped_NYS.csv')
+DEFAULT_CACHE_DIR = os.path.join(repo_root, 'data', '.http_cache')
+
+
+def _field(extract):
+    # Each field on its own, as the notebook did: a page missing one still yields the others
+    try:
+        return extract()
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return None
+
+
+class HttpCache:
+    """
+    An on-disk cache of response bodies and their validators (ETag, Last-Modified), one
+    pair of files per URL, used to make conditional requests.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json'), os.path.join(self.directory, key + '.html')
+
+    def get(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def put(self, url, headers, body):
+        meta_path, body_path = self._paths(url)
+        meta = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+        # Body first, then metadata, each through a rename, so a crash never leaves a
+        # validator pointing at a half-written body
+        for path, data, mode in ((body_path, body, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            tmp_path = f'{path}.tmp-{threading.get_ident()}'
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host by at least 1 / requests_per_second seconds."""
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ParkScraper:
+    """
+    A scraper for the state park and historic site pages of the New York State Parks website.
+
+    Methods:
+        fetch: a method to download a page through the rate limiter and the HTTP cache
+        list_sites: a method to read the sites listed in a listing page's select menu
+        parse_site: a method to extract the latitude, longitude, address, phone number,
+        description and amenities from a site page
+        scrape: a method to scrape every listed site concurrently and return a dataframe
+    """
+    def __init__(self, base_url=BASE_URL, listings=LISTINGS, cache_dir=DEFAULT_CACHE_DIR,
+                 checkpoint_path=None, max_workers=8, requests_per_second=2.0, timeout=15):
+        """
+        Parameters:
+        - base_url (str): root of the website (a local fixture server in tests)
+        - listings (list): (listing path, select menu id) pairs to crawl
+        - cache_dir (str): directory of the HTTP cache
+        - checkpoint_path (str): JSON-lines file of scraped sites; defaults to a file in cache_dir
+        - max_workers (int): number of concurrent requests
+        - requests_per_second (float): per-host request rate
+        - timeout (float): connect/read timeout in seconds
+        """
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.listings = listings
+        self.cache = HttpCache(cache_dir)
+        self.checkpoint_path = checkpoint_path or os.path.join(cache_dir, 'checkpoint.jsonl')
+        self.max_workers = max_workers
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504],
+                      respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'TrailsToHealth-scraper/1.0'
+        self._lock = threading.Lock()
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'resumed': 0, 'parse_failed': 0}
+        # (url, reason) of the sites skipped because their page could not be parsed
+        self.parse_failures = []
+
+    def fetch(self, url):
+        meta, body = self.cache.get(url)
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        self.rate_limiter.wait(url)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and body is not None:
+            self._count('not_modified')
+            return body
+        response.raise_for_status()
+        self._count('downloaded')
+        self.cache.put(url, response.headers, response.content)
+        return response.content
+
+    def list_sites(self, listing_path, select_menu_id):
+        listing_url = urljoin(self.base_url, listing_path)
+        soup = BeautifulSoup(self.fetch(listing_url), PARSER)
+        select_menu = soup.find('select', {'id': select_menu_id})
+        if select_menu is None:
+            raise ValueError(f"{listing_url} has no select menu {select_menu_id!r}")
+        # start at index 1 to skip the first "Any State Park" option
+        return [(option.text.strip(), listing_url + option['value'])
+                for option in select_menu.find_all('option')[1:] if option.get('value')]
+
+    @staticmethod
+    def parse_site(html, site_name, site_url):
+        """
+        The site's row; a field that cannot be found is None. Raises ValueError when the page
+        has none of them (not a site page, or its layout changed).
+        """
+        site_soup = BeautifulSoup(html, PARSER)
+
+        def bold_value(label):
+            span = site_soup.find("span", {"style": "font-weight:bold;"}, string=label)
+            return span.find_next_sibling(string=True).strip()
+
+        def amenities():
+            amenity_ul = site_soup.find("ul", {"style": "padding:0px; list-style:none;"})
+            amenities_list = [li.contents[0].strip() for li in amenity_ul.find_all("li")[1:] if li.contents]
+            return ", ".join(amenities_list[1:])
+
+        fields = {
+            "latitude": _field(lambda: bold_value("Latitude")),
+            "longitude": _field(lambda: bold_value("Longitude")),
+            "address": _field(lambda: site_soup.find("div", {"style": "margin-bottom:8px;"})
+                              .get_text(strip=True).replace("Address", "", 1).strip()),
+            "phone": _field(lambda: site_soup.find("strong", string=["Phone", "General Information"])
+                            .find_next("a").text.strip()),
+            "description": _field(lambda: site_soup.find("div", {"role": "tabpanel"}).get_text(strip=True)),
+            "amenities": _field(amenities),
+        }
+        if all(value is None for value in fields.values()):
+            raise ValueError("no site details found")
+        if fields["latitude"] is None and site_name in MANUAL_COORDINATES:
+            fields["latitude"], fields["longitude"] = MANUAL_COORDINATES[site_name]
+        return dict({"site_name": site_name, "website": site_url}, **fields)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _read_checkpoint(self):
+        done = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                for line in f:
+                    try:
+                        site = json.loads(line)
+                    except ValueError:
+                        # The last line may have been cut short by the interruption
+                        continue
+                    done[site['website']] = site
+        return done
+
+    def _parse_failed(self, url, reason):
+        logger.warning("Skipping %s: %s", url, reason)
+        with self._lock:
+            self.stats['parse_failed'] += 1
+            self.parse_failures.append((url, reason))
+
+    def _checkpoint(self, site):
+        with self._lock:
+            with open(self.checkpoint_path, 'a') as f:
+                f.write(json.dumps(site) + '\n')
+
+    def scrape(self, resume=True):
+        """
+        Scrapes every listed site and returns them as a dataframe, in listing order.
+        With resume=True, sites already in the checkpoint of an interrupted run are reused.
+        Sites whose page cannot be parsed are skipped (parse_failures) and recorded in the
+        checkpoint, so a resumed run does not fetch them again; network errors and listing
+        pages without their select menu raise RuntimeError once every other site is done.
+        """
+        done = self._read_checkpoint() if resume else {}
+        if not resume and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stats['resumed'] = len(done)
+        for url, site in done.items():
+            if 'error' in site:
+                self._parse_failed(url, site['error'])
+
+        failures = []
+        sites = []
+        for listing_path, menu_id in self.listings:
+            try:
+                sites.extend(self.list_sites(listing_path, menu_id))
+            except (requests.RequestException, ValueError) as e:
+                failures.append((listing_path, e))
+        todo = [(name, url) for name, url in sites if url not in done]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, url): (name, url) for name, url in todo}
+            for future in as_completed(futures):
+                name, url = futures[future]
+                try:
+                    site = self.parse_site(future.result(), name, url)
+                except requests.RequestException as e:
+                    failures.append((url, e))
+                    continue
+                except Exception as e:
+                    # A malformed page: skipped, and remembered so a resume does not retry it
+                    site = {'site_name': name, 'website': url, 'error': f'{type(e).__name__}: {e}'}
+                    self._parse_failed(url, site['error'])
+                done[url] = site
+                self._checkpoint(site)
+        if failures:
+            # Scraped sites stay in the checkpoint, so rerunning only retries these
+            raise RuntimeError(f"{len(failures)} page(s) failed, e.g. {failures[0][0]}: {failures[0][1]}")
+
+        df = pd.DataFrame([done[url] for _, url in sites if url in done and 'error' not in done[url]], columns=COLUMNS)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default=DEFAULT_OUTPUT)
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=2.0, help='requests per second per host')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint of an interrupted run')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    scraper = ParkScraper(args.base_url, cache_dir=args.cache_dir, max_workers=args.workers, requests_per_second=args.rate)
+    df = scraper.scrape(resume=not args.restart)
+    df.to_csv(args.out, index=False)
+    print(f"Wrote {len(df)} sites to {args.out} in {time.perf_counter() - start:.1f}s {scraper.stats}")